@@ -1,18 +1,38 @@
+import os
 import sys
-from density import *
-from velocity import *
+from density import Density, Solid
+from velocity import Velocity
 from fluid import Fluid
+from scene import load_scene
 
 CMAPS = ['viridis', 'plasma', 'inferno', 'magma', 'cividis', 'Greys', 'Purples', 'Blues', 'Greens', 'Oranges', 'Reds', 'YlOrBr', 'YlOrRd', 'OrRd', 'PuRd', 'RdPu', 'BuPu', 'GnBu', 'PuBu', 'YlGnBu', 'PuBuGn', 'BuGn', 'YlGn', 'binary', 'gist_yarg', 'gist_gray', 'gray', 'bone', 'pink', 'spring', 'summer', 'autumn', 'winter', 'cool', 'Wistia', 'hot', 'afmhot', 'gist_heat', 'copper', 'PiYG', 'PRGn', 'BrBG', 'PuOr', 'RdGy', 'RdBu', 'RdYlBu', 'RdYlGn', 'Spectral', 'coolwarm', 'bwr', 'seismic', 'twilight', 'twilight_shifted', 'hsv', 'Pastel1', 'Pastel2', 'Paired', 'Accent', 'Dark2', 'Set1', 'Set2', 'Set3', 'tab10', 'tab20', 'tab20b', 'tab20c', 'flag', 'prism', 'ocean', 'gist_earth', 'terrain', 'gist_stern', 'gnuplot', 'gnuplot2', 'CMRmap', 'cubehelix', 'brg', 'gist_rainbow', 'rainbow', 'jet', 'turbo', 'nipy_spectral', 'gist_ncar']
 
 QCOLOR = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'w']
 
-def read_input(filename=""):
+def config_path(filename: str):
+    """Path of a Config file from its name, or the path given if the file exists.
+
+    Args:
+        filename (str): The name of the file in Config folder without the extension, or its path.
+
+    Returns:
+        str: The path of the file.
+    """
+    return filename if os.path.isfile(filename) else "Config/" + filename + ".txt"
+
+def read_input(filename="", interactive=True):
     """Reads input from a txt file. If none is given, lets the user enter a name.
-    The file must be in Config folder.
+    The file must be in Config folder, unless a path to an existing file is given.
+    The file is parsed strictly by scene.load_scene, and cached.
 
     Args:
-        filename (str, optional): The name of the file to be read without the extension. Defaults to "".
+        filename (str, optional): The name of the file to be read without the extension, or its path. Defaults to "".
+        interactive (bool, optional): Lets the user enter a name and exits if the file is not found. Defaults to True.
+            False: Never prompts nor exits, raises instead.
+
+    Raises:
+        ValueError: If no filename is given without interactive, or the file does not follow the format.
+        FileNotFoundError: If the file is not found without interactive.
 
     Returns:
         [str, str, list, list, list]
@@ -23,88 +43,28 @@ def read_input(filename=""):
             list: List of Solid objects.
     """
     if not filename:
+        if not interactive: raise ValueError("No filename given")
         print("The filename must be a txt file and within the Config folder of the project.")
         filename = input("Enter the filename without extension (default Input): ") or "Input"
 
     try:
-        file = open("Config/" + filename + ".txt", "r")
+        scene = load_scene(config_path(filename))
     except FileNotFoundError:
+        if not interactive: raise
         print("The file was not found, please check the spelling of filename.")
         sys.exit()
-    lines = file.read().split("\n")
-    den_array = []
-    vel_array = []
-    sol_array = []
-    colormap = ""
-    qcolor = ""
-    current = ""
-    length = 0
-    for line in lines:
-        if "colormap" in line:
-            colormap = line.split("=")[1]
-        elif "quiver" in line:
-            qcolor = line.split("=")[1]
-        elif "density" in line:
-            length = int(line.split("=")[1])
-            current = "density"
-        elif "velocity" in line:
-            length = int(line.split("=")[1])
-            current = "velocity"
-        elif "solid" in line:
-            length = int(line.split("=")[1])
-            current = "solid"
-        elif length > 0:
-            length -= 1
-            if current == "density": den_array.append(line)
-            elif current == "velocity": vel_array.append(line)
-            elif current == "solid": sol_array.append(line)
-    file.close()
-
-    densities = []
-    for den in den_array:
-        info = den.split(", ")
-        pos_x = int(info[0])
-        pos_y = int(info[1])
-        size_x = int(info[2])
-        size_y = int(info[3])
-        density = int(info[4])
-        temp_den = Density(pos_x, pos_y, size_x, size_y, density)
-        densities.append(temp_den)
-
-    velocities = []
-    for vel in vel_array:
-        info = vel.split(", ")
-        animation_value = 0
-
-        pos_x = int(info[0])
-        pos_y = int(info[1])
-        strength_x = int(info[2])
-        strength_y = int(info[3])
-        animation = VelocityAnimation(int(info[4]))
-        if animation in [VelocityAnimation.ROTATE_CW, VelocityAnimation.ROTATE_CCW, VelocityAnimation.RETURN_X, VelocityAnimation.RETURN_Y]:
-            animation_value = int(info[5])
-
-        temp_vel = Velocity(pos_x, pos_y, strength_x, strength_y, animation, animation_value)
-        velocities.append(temp_vel)
-    
-    solids = []
-    for sol in sol_array:
-        info = sol.split(", ")
-        pos_x = int(info[0])
-        pos_y = int(info[1])
-        size_x = int(info[2])
-        size_y = int(info[3])
-        temp_sol = Solid(pos_x, pos_y, size_x, size_y)
-        solids.append(temp_sol)
-
-    return colormap, qcolor, densities, velocities, solids
-
-def create_from_input(fluid: Fluid, filename=""):
+
+    densities, velocities, solids = scene.objects()
+    return scene.colormap, scene.qcolor, densities, velocities, solids
+
+def create_from_input(fluid: Fluid, filename="", interactive=True):
     """Adds Density and Velocity to a Fluid from an input file.
 
     Args:
         fluid (Fluid): The Fluid object to be modified.
         filename (str, optional): The name of the file to be read without the extension. Defaults to "".
+        interactive (bool, optional): Lets the user choose what is missing from the file. Defaults to True.
+            False: Raises instead of prompting, see read_input, choose_color and choose_quiver.
 
     Returns:
         [str, str, list, list]
@@ -113,21 +73,25 @@ def create_from_input(fluid: Fluid, filename=""):
             list: List of Density objects.
             list: List of Velocity objects.
     """
-    cmap, qcolor, densities, velocities, solids = read_input(filename)
-    colormap = choose_color(cmap)
-    q_color = choose_quiver(qcolor)
+    cmap, qcolor, densities, velocities, solids = read_input(filename, interactive)
+    colormap = choose_color(cmap, interactive)
+    q_color = choose_quiver(qcolor, interactive)
 
-    fluid.solid = solids
+    fluid.set_solids(solids)
     maintain_step(fluid, densities, velocities, solids)
 
     return colormap, q_color, densities, velocities, solids
 
-def choose_color(color_name=""):
+def choose_color(color_name="", interactive=True):
     """Gets the Colormap from the name given, if none is given, lets the user choose one.
 
     Args:
         color_name (str, optional): The name of the Colormap. Defaults to "".
             See also: https://matplotlib.org/3.5.1/tutorials/colors/colormaps.html
+        interactive (bool, optional): Lets the user choose. Defaults to True.
+
+    Raises:
+        ValueError: If the name is missing or unknown without interactive.
 
     Returns:
         str: Name of Colormap to be used.
@@ -137,6 +101,7 @@ def choose_color(color_name=""):
         for color in CMAPS:
             if color_name.lower() == color.lower(): color_map = color
     if not color_map:
+        if not interactive: raise ValueError(f"Unknown colormap {color_name!r}")
         defaults = ["Paired", "viridis", "bone"]
         print("1. Temperature Map")
         print("2. Purple to yellow")
@@ -147,12 +112,16 @@ def choose_color(color_name=""):
         color_map = defaults[color - 1]
     return color_map
 
-def choose_quiver(color_name=""):
+def choose_quiver(color_name="", interactive=True):
     """Gets the Quiver Color from the name given, if none is given, lets the user choose one.
 
     Args:
         color_name (str, optional): The name of the Color. Defaults to "".
             See also: https://matplotlib.org/stable/tutorials/colors/colors.html
+        interactive (bool, optional): Lets the user choose. Defaults to True.
+
+    Raises:
+        ValueError: If the name is missing or unknown without interactive.
 
     Returns:
         str: Name of Quiver Color to be used.
@@ -162,6 +131,7 @@ def choose_quiver(color_name=""):
         for color in QCOLOR:
             if color_name.lower() == color.lower(): q_color = color
     if not q_color:
+        if not interactive: raise ValueError(f"Unknown quiver color {color_name!r}")
         defaults = ["k", "y", "w"]
         print("1. Black")
         print("2. Yellow")
@@ -191,30 +161,32 @@ def add_velocity(fluid: Fluid, velocity: Velocity):
     fluid.velo[velocity.pos_y, velocity.pos_x] = velocity.get_dir()
 
 def add_solid(fluid: Fluid, solid: Solid):
-    """Adds a Solid to the Fluid given.
+    """Adds a Solid to the solids of the Fluid given, they are compiled again and the cells it covers emptied.
 
     Args:
         fluid (Fluid): The Fluid object that will be modified.
         solid (Solid): The Solid object that will be added.
     """
-    fluid.velo[solid.pos_y:solid.pos_y + solid.size_y, solid.pos_x:solid.pos_x + solid.size_x] = 0
-    fluid.density[solid.pos_y:solid.pos_y + solid.size_y, solid.pos_x:solid.pos_x + solid.size_x] = 0
+    fluid.set_solids(fluid.solid + [solid])
+    fluid.set_solid_cells(fluid.velo)
+    fluid.set_solid_cells(fluid.density)
 
 def maintain_step(fluid: Fluid, densities: list, velocities: list, solids: list):
-    """Adds all the Density object, Velocity objects and Solid objects given to the Fluid. The Velocity suffer a step.
+    """Adds all the Density object and Velocity objects given to the Fluid. The Velocity suffer a step.
+    The Solid objects are enforced by the Fluid itself, if they differ from the ones of the Fluid they are compiled again.
+    Scenes with many sources should use sources.Sources, which does the same in a few array operations.
 
     Args:
         fluid (Fluid): The Fluid to be modified.
         densities (list): The list of Density objects to be added.
         velocities (list): The list of Velocity objects to be added.
-        solids (list): The list of Solid objects to be added.
+        solids (list): The list of Solid objects of the Fluid.
     """
+    if solids is not fluid.solid and list(solids) != fluid.solid: fluid.set_solids(solids)
+
     for den in densities:
         add_density(fluid, den)
     
     for vel in velocities:
         add_velocity(fluid, vel)
-        vel.step()
-
-    for sol in solids:
-        add_solid(fluid, sol)
\ No newline at end of file
+        vel.step()
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Benchmark suite, runs every Config file at several grid sizes and solver iterations.
+
+For every case it reports the steps per second, the time of every phase of the step and of the sources,
+the solver iterations, the boundary calls and the peak memory allocated. The results are JSON, one
+object per case, so they can be compared between versions.
+
+Usage:
+    python bench.py --sizes 60 128 256 --iters 2 10 --steps 20 --output bench.json
+"""
+import argparse
+import glob
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from assets import config_path
+from fluid import Fluid
+from scene import load_scene
+
+def code_version():
+    """Git revision of the code, if it can be found.
+
+    Returns:
+        str: The revision, or "unknown".
+    """
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def load(config: str, size: int, iterations: int, solver=None, backend="numpy", threads=1):
+    """Creates a Fluid with the scene of a Config file.
+
+    Returns:
+        [Fluid, Sources]
+            Fluid: The Fluid created.
+            Sources: The densities and velocities of the scene.
+    """
+    fluid = Fluid(size, solver, backend, threads)
+    fluid.iter = iterations
+    sources, solids = load_scene(config_path(config), size).apply(fluid)
+    sources.apply(fluid)
+    return fluid, sources
+
+def bench_case(config: str, size: int, iterations: int, steps=20, warmup=2, solver=None, backend="numpy", threads=1):
+    """Benchmarks a single case.
+
+    The steps per second are measured without profiling, the phases in a second run with the Profiler
+    attached, and the peak memory in a third run traced by tracemalloc.
+
+    Returns:
+        dict: The results of the case.
+    """
+    fluid, sources = load(config, size, iterations, solver, backend, threads)
+    for step in range(0, warmup):
+        sources.apply(fluid)
+        fluid.step()
+
+    start = time.perf_counter()
+    for step in range(0, steps):
+        sources.apply(fluid)
+        fluid.step()
+    elapsed = time.perf_counter() - start
+
+    profiler = fluid.start_profiling()
+    sources_time = 0.0
+    for step in range(0, steps):
+        begin = time.perf_counter()
+        sources.apply(fluid)
+        sources_time += time.perf_counter() - begin
+        fluid.step()
+    fluid.stop_profiling()
+    report = profiler.report()
+    report["phases"]["sources"] = {"time": sources_time, "calls": steps}
+
+    tracemalloc.start()
+    fluid, sources = load(config, size, iterations, solver, backend, threads)
+    for step in range(0, max(1, warmup)):
+        sources.apply(fluid)
+        fluid.step()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "config": config, "size": size, "iter": iterations, "steps": steps,
+        "solver": type(fluid.solver).__name__, "backend": fluid.backend, "threads": threads,
+        "steps_per_sec": steps / elapsed,
+        "phases": report["phases"],
+        "solver_iterations": report["solver_iterations"] / steps,
+        "boundary_calls": report["boundary_calls"] / steps,
+        "peak_memory": peak
+    }
+
+def run(configs=None, sizes=(60, 128, 256), iterations=(2, 10), steps=20, solver=None, backend="numpy", threads=1):
+    """Benchmarks every combination of Config file, grid size and solver iterations.
+
+    Args:
+        configs (list, optional): Names or paths of the Config files. Defaults to None.
+            None: Every Config*.txt file in Config folder.
+        sizes (tuple, optional): Grid sizes. Defaults to (60, 128, 256).
+        iterations (tuple, optional): Solver iterations. Defaults to (2, 10).
+        steps (int, optional): Steps timed per case. Defaults to 20.
+        solver (str, optional): Name of the linear solver. Defaults to None.
+        backend (str, optional): "numpy" or "numba". Defaults to "numpy".
+        threads (int, optional): Threads of the Fluid. Defaults to 1.
+
+    Yields:
+        dict: The results of every case.
+    """
+    if configs is None: configs = sorted(glob.glob("Config/Config*.txt"))
+    for config in configs:
+        for size in sizes:
+            for iteration in iterations:
+                yield bench_case(config, size, iteration, steps, solver=solver, backend=backend, threads=threads)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the Fluid on the Config files.")
+    parser.add_argument("--configs", nargs="+", default=None, help="names or paths of Config files (default Config/Config*.txt)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[60, 128, 256], help="grid sizes")
+    parser.add_argument("--iters", nargs="+", type=int, default=[2, 10], help="solver iterations")
+    parser.add_argument("--steps", type=int, default=20, help="steps timed per case (default 20)")
+    parser.add_argument("--solver", default=None, help="linear solver: jacobi, sor, multigrid or cg (default jacobi)")
+    parser.add_argument("--backend", default="numpy", help="numpy or numba compiled kernels (default numpy)")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="threads of the Fluid (default 1)")
+    parser.add_argument("-o", "--output", default="", help="JSON file for the results (default print them)")
+    args = parser.parse_args(args)
+
+    header = {"version": code_version(), "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()}
+    results = []
+    for result in run(args.configs, args.sizes, args.iters, args.steps, args.solver, args.backend, args.threads):
+        results.append(result)
+        print(f"{result['config']} size={result['size']} iter={result['iter']}: {result['steps_per_sec']:.1f} steps/s, "
+              f"peak {result['peak_memory'] / 2 ** 20:.1f} MiB")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"environment": header, "results": results}, file, indent=1)
+        print(f"Results saved in {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Boundaries of the edges of the grid, each edge with its own type.
+
+The edges are named as the grid is displayed: top is the first row, bottom the last row, left the first column
+and right the last column. These cells are ghost cells, every type sets them from the interior:
+    reflect: A wall, the velocity across the edge is inverted, the other fields are left as they are.
+    periodic: The grid wraps around, the edge copies the interior row or column of the opposite edge,
+        which must be periodic too. Backtraces of the advection wrap around as well.
+    inflow: The velocity of the edge is a prescribed profile, the other fields have a zero gradient.
+    outflow: Every field has a zero gradient, the flow leaves the grid freely.
+The pressure solve sees the ghost cells of every sweep of the jacobi solver, so it wraps around the periodic edges
+and has a zero gradient on the open ones. The other solvers hold the edges fixed during a solve.
+
+Usage:
+    fluid.boundaries = Boundaries(left="inflow", right="outflow", profiles={"left": (0.0, 0.5)})
+    fluid.boundaries = parse_boundaries(["top=periodic", "bottom=periodic", "left=inflow:0,0.5", "right=outflow"])
+"""
+import numpy as np
+
+EDGES = ["top", "bottom", "left", "right"]
+TYPES = ["reflect", "periodic", "inflow", "outflow"]
+OPPOSITE = {"top": "bottom", "bottom": "top", "left": "right", "right": "left"}
+
+class Boundaries:
+    """Types of the four edges of a grid and the velocity profiles of the inflow edges.
+    """
+    def __init__(self, top="reflect", bottom="reflect", left="reflect", right="reflect", profiles=None):
+        """Creates Boundaries, reflective walls all around by default.
+
+        Args:
+            top (str, optional): Type of the first row. Defaults to "reflect".
+            bottom (str, optional): Type of the last row. Defaults to "reflect".
+            left (str, optional): Type of the first column. Defaults to "reflect".
+            right (str, optional): Type of the last column. Defaults to "reflect".
+            profiles (dict, optional): Velocity [y, x] of every inflow edge, a pair or an array (cells of the edge, 2). Defaults to None.
+
+        Raises:
+            ValueError: If a type is unknown, a periodic edge faces another type or an inflow has no profile.
+        """
+        self.types = {"top": top, "bottom": bottom, "left": left, "right": right}
+        self.profiles = {edge: np.asarray(profile, dtype=float) for edge, profile in (profiles or {}).items()}
+        for edge, kind in self.types.items():
+            if kind not in TYPES: raise ValueError(f"Unknown boundary {kind} on the {edge} edge, expected one of {', '.join(TYPES)}")
+            if kind == "periodic" and self.types[OPPOSITE[edge]] != "periodic":
+                raise ValueError(f"The {edge} edge is periodic, the {OPPOSITE[edge]} edge must be periodic too")
+            if kind == "inflow" and edge not in self.profiles: raise ValueError(f"The inflow of the {edge} edge needs a velocity profile")
+        # periodic axes, rows then columns
+        self.periodic = (top == "periodic", left == "periodic")
+
+    def is_reflect(self):
+        """True for reflective walls all around, the original boundaries."""
+        return all(kind == "reflect" for kind in self.types.values())
+
+    def state(self):
+        """Types and profiles, as saved in checkpoints.
+
+        Returns:
+            dict: The keyword arguments of Boundaries.
+        """
+        return dict(self.types, profiles={edge: profile.tolist() for edge, profile in self.profiles.items()})
+
+    def edges(self, table, vector=False):
+        """Sets the ghost cells of the four edges, the rows first then the columns.
+
+        Args:
+            table (np.ndarray): A field, its last two axes are the grid, or the last three with vector.
+            vector (bool, optional): The table is a velocity, its last axis holds the components [y, x]. Defaults to False.
+        """
+        # the components of a velocity in front, the grid is always the last two axes
+        planes = np.moveaxis(table, -1, 0) if vector else table
+        rows, cols = planes.shape[-2:]
+        # edge, axis, ghost cells, interior cells next to them and interior cells of the opposite edge
+        for edge, axis, ghost, inner, wrap in [("top", 0, 0, 1, rows - 2), ("bottom", 0, rows - 1, rows - 2, 1),
+                                               ("left", 1, 0, 1, cols - 2), ("right", 1, cols - 1, cols - 2, 1)]:
+            ghost, inner, wrap = _cells(axis, ghost), _cells(axis, inner), _cells(axis, wrap)
+            kind = self.types[edge]
+            if kind == "reflect":
+                # the component across the edge is the y component for the rows, the x component for the columns
+                if vector: np.negative(planes[axis][ghost], out=planes[axis][ghost])
+            elif kind == "periodic":
+                planes[ghost] = planes[wrap]
+            elif kind == "inflow" and vector:
+                # the profile as component planes, broadcast along the cells of the edge
+                profile = np.moveaxis(self.profiles[edge], -1, 0)
+                planes[ghost] = profile.reshape((2,) + (1,) * (planes[ghost].ndim - 2) + (-1,))
+            else:
+                planes[ghost] = planes[inner]
+
+    def corners(self, table, vector=False):
+        """Sets every corner to the mean of its two neighbours on the edges.
+
+        Args:
+            table (np.ndarray): A field, see edges.
+            vector (bool, optional): The table is a velocity. Defaults to False.
+        """
+        planes = np.moveaxis(table, -1, 0) if vector else table
+        rows, cols = planes.shape[-2:]
+        planes[..., 0, 0] = 0.5 * (planes[..., 1, 0] + planes[..., 0, 1])
+        planes[..., 0, cols - 1] = 0.5 * (planes[..., 1, cols - 1] + planes[..., 0, cols - 2])
+        planes[..., rows - 1, 0] = 0.5 * (planes[..., rows - 2, 0] + planes[..., rows - 1, 1])
+        planes[..., rows - 1, cols - 1] = 0.5 * (planes[..., rows - 2, cols - 1] + planes[..., rows - 1, cols - 2])
+
+    def limit(self, x, axis: int, length: int):
+        """Keeps the backtraces along an axis inside the grid, in place: they wrap around a periodic axis,
+        with the ghost cells of the last edge as the neighbours of the last interior cells, and are clamped otherwise.
+
+        Args:
+            x (np.ndarray): The coordinates of the backtraces along the axis.
+            axis (int): 0 for the rows, 1 for the columns.
+            length (int): The cells of the grid along the axis, ghost cells included.
+        """
+        if self.periodic[axis]:
+            np.subtract(x, 1, out=x)
+            np.mod(x, length - 2, out=x)
+            np.add(x, 1, out=x)
+            # a backtrace a rounding below 1 lands on the last ghost cell, the same point as 1
+            np.copyto(x, 1, where=x >= length - 1)
+        else:
+            np.clip(x, 0.5, (length - 1) - 0.5, out=x)
+
+    def advect(self, d, d0, velocity, dtx, dty):
+        """Semi-Lagrangian advection of the interior of d, the same operations as NumpyKernels.advect
+        but with the backtraces kept in the grid by limit, so they wrap around the periodic axes.
+        Like the kernels it also runs on a leading axis of members."""
+        n0, n1 = d.shape[-2:]
+        x = np.arange(1, n0 - 1, dtype=d.dtype)[:, None] - velocity[..., 1:-1, 1:-1, 0] * dtx
+        y = np.arange(1, n1 - 1, dtype=d.dtype)[None, :] - velocity[..., 1:-1, 1:-1, 1] * dty
+        self.limit(x, 0, n0)
+        self.limit(y, 1, n1)
+
+        s0 = np.floor(x)
+        s1 = x - s0
+        t0 = np.floor(y)
+        t1 = y - t0
+        index = s0.astype(np.intp) * n1 + t0.astype(np.intp)
+        if d.ndim > 2:
+            # the members follow each other in the flat d0
+            index += (np.arange(int(np.prod(d.shape[:-2])), dtype=np.intp) * (n0 * n1)).reshape(d.shape[:-2] + (1, 1))
+        s0 = 1.0 - s1
+        t0 = 1.0 - t1
+
+        flat = d0.reshape(-1)
+        g = flat.take(index, mode="clip") * t0
+        g += flat.take(index + 1, mode="clip") * t1
+        g *= s0
+        h = flat.take(index + n1, mode="clip") * t0
+        h += flat.take(index + n1 + 1, mode="clip") * t1
+        h *= s1
+        np.add(g, h, out=d[..., 1:-1, 1:-1])
+
+    def outflow_mask(self, y, x, shape: tuple):
+        """Mask of the positions that left the grid through an outflow edge.
+
+        Args:
+            y (np.ndarray): The row coordinates.
+            x (np.ndarray): The column coordinates.
+            shape (tuple): The shape of the grid (rows, cols).
+
+        Returns:
+            np.ndarray: The mask.
+        """
+        rows, cols = shape
+        mask = np.zeros(np.shape(y), dtype=bool)
+        for edge, beyond in [("top", y < 0.5), ("bottom", y > rows - 1.5), ("left", x < 0.5), ("right", x > cols - 1.5)]:
+            if self.types[edge] == "outflow": mask |= beyond
+        return mask
+
+def _cells(axis: int, index: int):
+    """Index of a row (axis 0) or a column (axis 1) of the last two axes."""
+    return (Ellipsis, index, slice(None)) if axis == 0 else (Ellipsis, index)
+
+def parse_boundaries(specs: list):
+    """Boundaries from the EDGE=TYPE strings of the command line, an inflow gives its velocity as inflow:VY,VX.
+
+    Args:
+        specs (list): The strings, the edges not given are reflective.
+
+    Raises:
+        ValueError: If a string does not follow the format.
+
+    Returns:
+        Boundaries: The Boundaries.
+    """
+    types = {}
+    profiles = {}
+    for spec in specs or []:
+        edge, _, kind = spec.partition("=")
+        if edge not in EDGES: raise ValueError(f"Unknown edge in {spec!r}, expected one of {', '.join(EDGES)}")
+        kind, _, profile = kind.partition(":")
+        if profile:
+            try:
+                profiles[edge] = [float(value) for value in profile.split(",")]
+            except ValueError:
+                raise ValueError(f"Invalid inflow velocity in {spec!r}, expected inflow:VY,VX") from None
+            if len(profiles[edge]) != 2: raise ValueError(f"Invalid inflow velocity in {spec!r}, expected inflow:VY,VX")
+        types[edge] = kind
+    return Boundaries(profiles=profiles, **types)
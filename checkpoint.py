@@ -0,0 +1,221 @@
+"""
+Checkpoints of a simulation, to restart a run exactly where it was left.
+
+A checkpoint is made of two files:
+    <path>.fields: The arrays of the Fluid (s, density, velo, velo0) one after the other, raw and memory-mappable,
+        followed by its tracers if it has some (the scalars and their previous values, the coordinates of the particles).
+    <path>.json: The layout of the arrays, the parameters of the Fluid and its scalars and the state of the Density, Velocity and Solid objects.
+"""
+import json
+import os
+
+import numpy as np
+
+from boundaries import Boundaries
+from density import Density, Solid
+from velocity import Velocity
+from fluid import Fluid
+from solvers import SOLVERS
+from tracers import Particles, ScalarStack
+
+FIELDS = ["s", "density", "velo", "velo0"]
+ALIGNMENT = 4096  # every array starts on a page of the fields file
+
+class Checkpointer:
+    """Saves checkpoints of a run to the same files, keeping the fields file mapped between saves.
+    A save then only costs writing the pages of the arrays.
+    """
+    def __init__(self, path: str):
+        """Creates a Checkpointer.
+
+        Args:
+            path (str): The path of the checkpoint without extension.
+        """
+        self.path = path
+        self.arrays = None
+        self.layout = None
+
+    def save(self, fluid: Fluid, densities: list, velocities: list, solids: list, frame=0):
+        """Saves a checkpoint of the simulation.
+
+        Args:
+            fluid (Fluid): The Fluid to be saved.
+            densities (list): The list of Density objects of the simulation.
+            velocities (list): The list of Velocity objects of the simulation.
+            solids (list): The list of Solid objects of the simulation.
+            frame (int, optional): The number of frames already simulated. Defaults to 0.
+        """
+        layout = make_layout(fluid)
+        if layout != self.layout:
+            self.close()
+            self.arrays = map_fields(self.path, layout, "w+")
+            self.layout = layout
+
+        for name, array in fluid_arrays(fluid).items():
+            self.arrays[name][...] = array
+        for array in self.arrays.values():
+            array.flush()
+
+        meta = {
+            "frame": frame,
+            "layout": layout,
+            "fluid": {
+                "size": fluid.size, "nx": fluid.nx, "ny": fluid.ny, "spacing": fluid.spacing, "dt": fluid.dt, "iter": fluid.iter, "diff": fluid.diff, "visc": fluid.visc,
+                "rotx": fluid.rotx, "roty": fluid.roty, "cntx": fluid.cntx, "cnty": fluid.cnty,
+                "cfl": fluid.cfl, "max_substeps": fluid.max_substeps, "boundaries": fluid.boundaries.state(),
+                "solver": solver_state(fluid.solver), "backend": fluid.backend, "precision": fluid.precision
+            },
+            "densities": [str(den) for den in densities],
+            "velocities": [vel.get_state() for vel in velocities],
+            "solids": [str(sol) for sol in solids],
+            "scalars": {"names": fluid.scalars.names, "diff": fluid.scalars.diff} if fluid.scalars is not None else None
+        }
+        # The metadata is replaced at once, a crash never leaves a partial file
+        temp = self.path + ".json.tmp"
+        with open(temp, "w") as file:
+            json.dump(meta, file, indent=1, default=_to_json)
+        os.replace(temp, self.path + ".json")
+
+    def close(self):
+        """Releases the mapped fields file.
+        """
+        self.arrays = None
+        self.layout = None
+
+def fluid_arrays(fluid: Fluid):
+    """Arrays of a Fluid saved in the fields file, its fields then its tracers.
+
+    Returns:
+        dict: The arrays by name.
+    """
+    arrays = {name: getattr(fluid, name) for name in FIELDS}
+    if fluid.scalars is not None:
+        arrays["scalars"] = fluid.scalars.fields
+        arrays["scalars_previous"] = fluid.scalars.previous
+    if fluid.particles is not None:
+        arrays["particles_y"] = fluid.particles.y
+        arrays["particles_x"] = fluid.particles.x
+    return arrays
+
+def make_layout(fluid: Fluid):
+    """Layout of the arrays of a Fluid in the fields file, see fluid_arrays.
+
+    Returns:
+        dict: For every array, its dtype, shape and offset in bytes.
+    """
+    layout = {}
+    offset = 0
+    for name, array in fluid_arrays(fluid).items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    return layout
+
+def map_fields(path: str, layout: dict, mode="r"):
+    """Maps the arrays of a fields file.
+
+    Args:
+        path (str): The path of the checkpoint without extension.
+        layout (dict): The layout given by make_layout.
+        mode (str, optional): Mode of np.memmap, "r", "r+", "c" or "w+". Defaults to "r".
+
+    Returns:
+        dict: The np.memmap of every field.
+    """
+    if mode == "w+":
+        # Creates the file with its full size, then every array is mapped into it
+        end = max(info["offset"] + int(np.prod(info["shape"])) * np.dtype(info["dtype"]).itemsize for info in layout.values())
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        with open(path + ".fields", "wb") as file:
+            file.truncate(end)
+        mode = "r+"
+    return {name: np.memmap(path + ".fields", dtype=np.dtype(info["dtype"]), mode=mode, offset=info["offset"], shape=tuple(info["shape"]))
+            for name, info in layout.items()}
+
+def open_checkpoint(path: str, mode="r"):
+    """Opens a checkpoint without reading its arrays, they are mapped from the file.
+
+    Args:
+        path (str): The path of the checkpoint without extension.
+        mode (str, optional): Mode of np.memmap, "r", "r+" or "c". Defaults to "r".
+
+    Returns:
+        [dict, dict]
+            dict: The metadata of the checkpoint.
+            dict: The np.memmap of every field.
+    """
+    with open(path + ".json", "r") as file:
+        meta = json.load(file)
+    return meta, map_fields(path, meta["layout"], mode)
+
+def save_checkpoint(path: str, fluid: Fluid, densities: list, velocities: list, solids: list, frame=0):
+    """Saves a single checkpoint of the simulation, see Checkpointer.save.
+    """
+    checkpointer = Checkpointer(path)
+    checkpointer.save(fluid, densities, velocities, solids, frame)
+    checkpointer.close()
+
+def load_checkpoint(path: str):
+    """Restores a simulation from a checkpoint.
+
+    Args:
+        path (str): The path of the checkpoint without extension.
+
+    Returns:
+        [Fluid, list, list, list, int]
+            Fluid: The Fluid as it was saved, with its tracers.
+            list: List of Density objects.
+            list: List of Velocity objects, at the step of their animation.
+            list: List of Solid objects.
+            int: The number of frames already simulated.
+    """
+    meta, arrays = open_checkpoint(path)
+    params = meta["fluid"]
+
+    fluid = Fluid(params["size"], make_solver_from_state(params["solver"]), params.get("backend", "numpy"), precision=params.get("precision", "float64"),
+                  nx=params.get("nx"), ny=params.get("ny"), spacing=params.get("spacing"))
+    for name in ["dt", "iter", "diff", "visc", "rotx", "roty", "cntx", "cnty"]:
+        setattr(fluid, name, params[name])
+    for name in ["cfl", "max_substeps"]:
+        if name in params: setattr(fluid, name, params[name])
+    if "boundaries" in params: fluid.boundaries = Boundaries(**params["boundaries"])
+    for name in FIELDS:
+        setattr(fluid, name, np.array(arrays[name]))
+    if meta.get("scalars"):
+        fluid.scalars = ScalarStack(meta["scalars"]["names"], fluid, meta["scalars"]["diff"])
+        fluid.scalars.fields[...] = arrays["scalars"]
+        fluid.scalars.previous[...] = arrays["scalars_previous"]
+    if "particles_y" in arrays:
+        fluid.particles = Particles(arrays["particles_y"], arrays["particles_x"])
+
+    densities = [Density(*[int(value) for value in den.split(", ")]) for den in meta["densities"]]
+    velocities = [Velocity.from_state(state) for state in meta["velocities"]]
+    solids = [Solid(*[int(value) for value in sol.split(", ")]) for sol in meta["solids"]]
+    fluid.set_solids(solids)
+    return fluid, densities, velocities, solids, meta["frame"]
+
+def solver_state(solver):
+    """Name and parameters of a Solver.
+
+    Returns:
+        dict: The state of the Solver, see make_solver_from_state.
+    """
+    name = next(key for key, value in SOLVERS.items() if type(solver) is value)
+    params = {key: value for key, value in vars(solver).items() if key not in ["iterations", "residual"]}
+    return {"name": name, "params": params}
+
+def make_solver_from_state(state: dict):
+    """Creates a Solver from a state given by solver_state.
+
+    Returns:
+        Solver: The Solver with the parameters it was saved with.
+    """
+    solver = SOLVERS[state["name"]]()
+    for key, value in state["params"].items():
+        setattr(solver, key, value)
+    return solver
+
+def _to_json(value):
+    """Conversion of the numpy scalars found in the state of the objects."""
+    if isinstance(value, np.generic): return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,182 @@
+"""
+Ensemble of Fluids, K independent simulations of the same scene stepped together in one array.
+
+Every field gains a leading member axis: density and s are (K, ny, nx), velo and velo0 are (K, ny, nx, 2),
+stored as the component planes velo_planes (2, K, ny, nx) like in a Fluid. dt, visc and diff can differ per member.
+The step runs the NumPy kernels of a Fluid on all the members at once, in the same workspaces, so every member
+gives the same results as a Fluid on its own.
+"""
+import numpy as np
+
+from density import Density
+from velocity import Velocity
+from fluid import Fluid
+from solvers import JacobiSolver
+
+class EnsembleFluid(Fluid):
+    """K independent Fluids sharing the grid size, the solids and the solver.
+    """
+    def __init__(self, members: int, size=60, dt=0.2, visc=0.0, diff=0.0, solver=None, precision="float64", nx=None, ny=None, spacing=None):
+        """Creates an EnsembleFluid.
+
+        Args:
+            members (int): Number of simulations K.
+            size (int, optional): The size of the grid. Defaults to 60.
+            dt (float or array, optional): Time interval, one per member or shared. Defaults to 0.2.
+            visc (float or array, optional): Viscosity, one per member or shared. Defaults to 0.0.
+            diff (float or array, optional): Diffusion, one per member or shared. Defaults to 0.0.
+            solver (Solver or str, optional): The linear solver. Defaults to None.
+                Non Jacobi solvers are run one member at a time.
+            precision (str, optional): "float64", "float32" or "mixed", see Fluid. Defaults to "float64".
+            nx (int, optional): Cells along x, see Fluid. Defaults to None.
+            ny (int, optional): Cells along y, see Fluid. Defaults to None.
+            spacing (float or tuple, optional): Width of the cells along y and x, see Fluid. Defaults to None.
+        """
+        super().__init__(size, solver, precision=precision, nx=nx, ny=ny, spacing=spacing)
+        self.members = members
+        self.dt = self._broadcast(dt)
+        self.visc = self._broadcast(visc)
+        self.diff = self._broadcast(diff)
+
+        self.s = np.full((members, self.ny, self.nx), 0, dtype=self.dtype)
+        self.density = np.full((members, self.ny, self.nx), 0, dtype=self.dtype)
+
+        self.velo = np.full((members, self.ny, self.nx, 2), 0, dtype=self.dtype)
+        self.velo0 = np.full((members, self.ny, self.nx, 2), 0, dtype=self.dtype)
+
+    def _broadcast(self, value):
+        """Per member array of a parameter."""
+        return np.broadcast_to(np.asarray(value, dtype=float), (self.members,)).copy()
+
+    def _per_member(self, value, ndim: int):
+        """Reshapes a per member array to broadcast against a field of ndim dimensions."""
+        return np.reshape(value, (-1,) + (1,) * (ndim - 1))
+
+    def _weights(self, value, dtype):
+        """Per member weights of a kernel, in the dtype of the fields it runs on."""
+        return self._per_member(np.broadcast_to(np.asarray(value, dtype=float), (self.members,)), 3).astype(dtype)
+
+    def step(self):
+        """Advances every member by its own dt.
+
+        Raises:
+            ValueError: If a cfl is set, the members would need their own number of substeps.
+        """
+        if self.cfl is not None: raise ValueError("EnsembleFluid steps every member by its own dt, it does not support a cfl")
+        super().step()
+
+    def lin_solve(self, x, x0, a, c):
+        max_iter = self.solver.max_iter if self.solver.max_iter is not None else self.iter
+        if isinstance(self.solver, JacobiSolver):
+            # the sweeps of the kernels on every member at once, the components of a velocity as its planes
+            planes, planes0 = (np.moveaxis(x, -1, 0), np.moveaxis(x0, -1, 0)) if x.ndim > 3 else (x, x0)
+            # the weights in the precision of x, like the scalars of a Fluid, pairs are rounded by the kernel
+            a_k = tuple(self._weights(weight, np.float64) for weight in a) if isinstance(a, tuple) else self._weights(a, x.dtype)
+            c_recip = self._weights(1 / np.asarray(c, dtype=float), x.dtype)
+            out = self.kernels._scratch(planes.shape, planes.dtype)
+            rows = planes.shape[-2]
+            for iteration in range(0, max_iter):
+                self.kernels.jacobi_rows(planes, planes0, a_k, c_recip, out, 1, rows - 1)
+                self.kernels.copy_rows(planes, out, 1, rows - 1)
+                self.set_boundaries(x)
+            self.solver.iterations = max_iter
+            return max_iter
+
+        # Other solvers work on 2d arrays, one member and component at a time
+        self.solver.check(self, a)
+        a = np.broadcast_to(np.asarray(a, dtype=float), (self.members,))
+        c = np.broadcast_to(np.asarray(c, dtype=float), (self.members,))
+        iterations = 0
+        for k in range(0, self.members):
+            if x.ndim > 3:
+                for axis in range(x.shape[3]):
+                    used, res = self.solver._solve(x[k, :, :, axis], x0[k, :, :, axis], a[k], c[k], max_iter)
+                    iterations = max(iterations, used)
+            else:
+                used, res = self.solver._solve(x[k], x0[k], a[k], c[k], max_iter)
+                iterations = max(iterations, used)
+        self.set_boundaries(x)
+        self.solver.iterations = iterations
+        return iterations
+
+    def set_solid_cells(self, table):
+        table[:, self.solid_cells[0], self.solid_cells[1]] = 0
+
+    def set_boundaries(self, table):
+        vector = len(table.shape) > 3  # 4d velocity vector array
+        self.boundaries.edges(table, vector)
+        if vector:
+            for axis, faces in enumerate(self.solid_faces):
+                table[:, faces[0], faces[1], axis] = - table[:, faces[0], faces[1], axis]
+        self.boundaries.corners(table, vector)
+
+    def diffuse(self, x, x0, diff):
+        still = diff == 0
+        if still.all():
+            x[...] = x0
+            return
+        # members without diffusion solve with a unit one, then get x0 back, equivalent to lin_solve with a = 0
+        diff = np.where(still, 1.0, diff)
+        scale_y, scale_x = self.scale
+        if scale_y == scale_x:
+            a = self.dt * diff * scale_y * scale_y
+            c = 1 + 6 * a
+        else:  # weights of the neighbours along y and x
+            a = (self.dt * diff * scale_y * scale_y, self.dt * diff * scale_x * scale_x)
+            c = 1 + 3 * (a[0] + a[1])
+        self.lin_solve(x, x0, a, c)
+        x[still] = x0[still]
+
+    def advect(self, d, d0, velocity):
+        dtx = self._weights(self.dt * self.scale[0], d.dtype)
+        dty = self._weights(self.dt * self.scale[1], d.dtype)
+
+        # the kernels of a Fluid, with a weight per member
+        if any(self.boundaries.periodic):
+            self.boundaries.advect(d, d0, velocity, dtx, dty)
+        else:
+            self.kernels.advect(d, d0, velocity, dtx, dty)
+        self.set_boundaries(d)
+        self.set_solid_cells(d)
+
+def add_density(ensemble: EnsembleFluid, density: Density, strength=1.0):
+    """Adds a Density to every member of the EnsembleFluid given.
+
+    Args:
+        ensemble (EnsembleFluid): The EnsembleFluid object that will be modified.
+        density (Density): The Density object that will be added.
+        strength (float or array, optional): Scale of the Density, one per member or shared. Defaults to 1.0.
+    """
+    value = ensemble._per_member(ensemble._broadcast(strength) * density.density, 3)
+    ensemble.density[:, density.pos_y:density.pos_y + density.size_y, density.pos_x:density.pos_x + density.size_x] = value
+
+def add_velocity(ensemble: EnsembleFluid, velocity: Velocity, strength=1.0):
+    """Adds a Velocity to every member of the EnsembleFluid given.
+
+    Args:
+        ensemble (EnsembleFluid): The EnsembleFluid object that will be modified.
+        velocity (Velocity): The Velocity object that will be added.
+        strength (float or array, optional): Scale of the Velocity, one per member or shared. Defaults to 1.0.
+    """
+    scale = ensemble._per_member(ensemble._broadcast(strength), 2)
+    ensemble.velo[:, velocity.pos_y, velocity.pos_x] = scale * np.asarray(velocity.get_dir(), dtype=float)
+
+def maintain_step(ensemble: EnsembleFluid, densities: list, velocities: list, solids: list, density_strength=1.0, velocity_strength=1.0):
+    """Adds all the Density objects and Velocity objects given to every member of the EnsembleFluid. The Velocity suffer a step.
+
+    Args:
+        ensemble (EnsembleFluid): The EnsembleFluid to be modified.
+        densities (list): The list of Density objects to be added.
+        velocities (list): The list of Velocity objects to be added.
+        solids (list): The list of Solid objects of the EnsembleFluid.
+        density_strength (float or array, optional): Scale of the Density objects per member. Defaults to 1.0.
+        velocity_strength (float or array, optional): Scale of the Velocity objects per member. Defaults to 1.0.
+    """
+    if solids is not ensemble.solid and list(solids) != ensemble.solid: ensemble.set_solids(solids)
+
+    for den in densities:
+        add_density(ensemble, den, density_strength)
+
+    for vel in velocities:
+        add_velocity(ensemble, vel, velocity_strength)
+        vel.step()
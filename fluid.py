@@ -4,159 +4,276 @@ and the mike ash vulgarization https://mikeash.com/pyblog/fluid-simulation-for-d
 
 https://github.com/Guilouf/python_realtime_fluidsim
 """
-import numpy as np
 import math
 
-from assets import *
+import numpy as np
+
+from boundaries import Boundaries
+from solvers import JacobiSolver, Solver, make_solver
+from kernels import load_kernels
+from profiling import Profiler
+from scene import compile_solids
+
+# dtype of the fields and dtype of the pressure solve of every precision of a Fluid
+FIELD_PRECISIONS = {"float64": (np.float64, np.float64), "float32": (np.float32, np.float32), "mixed": (np.float32, np.float64)}
 
 class Fluid:
-    def __init__(self):
+    def __init__(self, size=60, solver=None, backend="numpy", threads=1, precision="float64", nx=None, ny=None, spacing=None):
         self.rotx = 1
         self.roty = 1
         self.cntx = 1
         self.cnty = -1
 
-        self.size = 60  # map size
+        self.size = size  # map size, the reference length of the cells
+        # cells along x (columns) and y (rows), the fields have the shape (ny, nx)
+        self.nx = size if nx is None else nx
+        self.ny = size if ny is None else ny
+        # width of the cells along y and x, None keeps square cells scaled by size
+        self.spacing = None if spacing is None else tuple(np.broadcast_to(np.asarray(spacing, dtype=float), (2,)).tolist())
+        if self.spacing is None:
+            self.scale = (size - 2, size - 2)   # cells per unit length, of the advection and the diffusion
+            self.project_scale = (size, size)  # cells per unit length of the projection
+        else:
+            self.scale = self.project_scale = (1 / self.spacing[0], 1 / self.spacing[1])
         self.dt = 0.2  # time interval
+        # adaptive time stepping, cells a backtrace may cross per substep, None keeps a single step of dt
+        self.cfl = None
+        self.max_substeps = 16  # limit of substeps per step with a cfl
+        self.substeps = 1  # substeps taken by the last step
+        # tiles.ActiveTiles restricting the advection and the density diffusion to the active tiles, None runs the whole grid
+        self.tiles = None
+        # type of every edge of the grid, see boundaries.py, reflective walls by default
+        self.boundaries = Boundaries()
+        # tracers.ScalarStack and tracers.Particles carried by the velocity after the density, None for none
+        self.scalars = None
+        self.particles = None
         self.iter = 2  # linear equation solving iteration number
 
+        # linear equation solver, a Solver object or the name of one
+        if solver is None: solver = "jacobi"
+        self.solver = solver if isinstance(solver, Solver) else make_solver(solver)
+
+        # "numpy" or "numba" compiled kernels, numba falls back to numpy when it is not installed
+        # with several threads the kernels run on bands of rows
+        self.backend, self.kernels = load_kernels(backend, threads)
+
+        # "float64", "float32" or "mixed", float32 fields with the pressure solved in float64
+        if precision not in FIELD_PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}, expected one of {', '.join(FIELD_PRECISIONS)}")
+        self.precision = precision
+        self.dtype, self.solve_dtype = FIELD_PRECISIONS[precision]
+        self.pressure = None  # buffers of the pressure solve when it differs from the fields, see solve_pressure
+
+        # Profiler timing the phases of the step, see start_profiling
+        self.profiler = None
+
         self.diff = 0.0000  # Diffusion
         self.visc = 0.0000  # viscosity
 
-        self.s = np.full((self.size, self.size), 0, dtype=float)        # Previous density
-        self.density = np.full((self.size, self.size), 0, dtype=float)  # Current density
+        self.s = np.full((self.ny, self.nx), 0, dtype=self.dtype)        # Previous density
+        self.density = np.full((self.ny, self.nx), 0, dtype=self.dtype)  # Current density
+
+        # array of 2d vectors, [x, y], stored as two contiguous planes, see velo
+        self.velo = np.full((self.ny, self.nx, 2), 0, dtype=self.dtype)
+        self.velo0 = np.full((self.ny, self.nx, 2), 0, dtype=self.dtype)
 
-        # array of 2d vectors, [x, y]
-        self.velo = np.full((self.size, self.size, 2), 0, dtype=float)
-        self.velo0 = np.full((self.size, self.size, 2), 0, dtype=float)
+        # list of solids, compiled into masks and face index tables by set_solids
+        self.set_solids([])
 
-        # array of solids
-        self.solid = np.full((self.size, self.size), 0, dtype=float)
+    @property
+    def velo(self):
+        """Velocity as an array of 2d vectors, a view of the component planes velo_planes[0] and velo_planes[1].
+        Each component is contiguous, which the kernels read faster than interleaved vectors."""
+        return self.__velo
+
+    @velo.setter
+    def velo(self, value):
+        self.velo_planes, self.__velo = _set_planes(getattr(self, "velo_planes", None), value, self.dtype)
+
+    @property
+    def velo0(self):
+        """Previous velocity, a view of velo0_planes like velo."""
+        return self.__velo0
+
+    @velo0.setter
+    def velo0(self, value):
+        self.velo0_planes, self.__velo0 = _set_planes(getattr(self, "velo0_planes", None), value, self.dtype)
 
     def step(self):
+        """Advances the Fluid by dt. With a cfl, dt is split in as many substeps as the velocity needs,
+        each substep going as far as the cfl allows, so a step always covers the same simulated time."""
+        if self.cfl is None:
+            self.substeps = 1
+            self.substep()
+            return
+
+        step_dt = self.dt
+        elapsed = 0.0
+        self.substeps = 0
+        try:
+            while True:
+                # splits what remains evenly, the last substep covers exactly what is left
+                remaining = step_dt - elapsed
+                count = max(1, min(math.ceil(remaining / self.cfl_dt()), self.max_substeps - self.substeps))
+                self.dt = remaining / count
+                self.substep()
+                self.substeps += 1
+                if count == 1: break
+                elapsed += self.dt
+        finally:
+            self.dt = step_dt
+
+    def cfl_dt(self):
+        """Largest time interval that keeps the backtrace of every cell within cfl cells."""
+        planes = self.velo_planes
+        # cells crossed per unit of time along each axis
+        speed = max(max(planes[0].max(), -planes[0].min()) * self.scale[0], max(planes[1].max(), -planes[1].min()) * self.scale[1])
+        if speed == 0: return math.inf
+        return self.cfl / speed
+
+    def substep(self):
+        """Single step of the solver over dt."""
+        if self.tiles is not None: self.tiles.update(self)
+
         self.diffuse(self.velo0, self.velo, self.visc)
 
         # x0, y0, x, y
-        self.project(self.velo0[:, :, 0], self.velo0[:, :, 1], self.velo[:, :, 0], self.velo[:, :, 1])
+        self.project(self.velo0[..., 0], self.velo0[..., 1], self.velo[..., 0], self.velo[..., 1])
 
-        self.advect(self.velo[:, :, 0], self.velo0[:, :, 0], self.velo0)
-        self.advect(self.velo[:, :, 1], self.velo0[:, :, 1], self.velo0)
+        self.advect(self.velo[..., 0], self.velo0[..., 0], self.velo0)
+        self.advect(self.velo[..., 1], self.velo0[..., 1], self.velo0)
 
-        self.project(self.velo[:, :, 0], self.velo[:, :, 1], self.velo0[:, :, 0], self.velo0[:, :, 1])
+        self.project(self.velo[..., 0], self.velo[..., 1], self.velo0[..., 0], self.velo0[..., 1])
 
         self.diffuse(self.s, self.density, self.diff)
 
         self.advect(self.density, self.s, self.velo)
 
-    def lin_solve(self, x, x0, a, c):
-        """Implementation of the Gauss-Seidel relaxation"""
-        c_recip = 1 / c
+        if self.scalars is not None: self.scalars.step(self)
+        if self.particles is not None: self.particles.step(self)
 
-        for iteration in range(0, self.iter):
-            # Calculates the interactions with the 4 closest neighbors
-            x[1:-1, 1:-1] = (x0[1:-1, 1:-1] + a * (x[2:, 1:-1] + x[:-2, 1:-1] + x[1:-1, 2:] + x[1:-1, :-2])) * c_recip
+    def start_profiling(self, profiler=None):
+        """Starts timing the phases of the step and counting the solver iterations and boundary calls.
+        Returns the Profiler, without profiling the Fluid runs its own methods untouched."""
+        self.profiler = profiler or Profiler()
+        self.profiler.attach(self)
+        return self.profiler
 
-            self.set_boundaries(x)
+    def stop_profiling(self):
+        """Stops the profiling and returns the Profiler with its results."""
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None: profiler.detach()
+        return profiler
 
+    def lin_solve(self, x, x0, a, c):
+        """Solves the linear system of diffusion and pressure with the solver of the Fluid.
+        Returns the number of iterations used."""
+        return self.solver.solve(self, x, x0, a, c)
 
-    def set_boundaries(self, table):
+    def set_solids(self, solids, tables=None):
         """
-        Boundaries handling
-        :return:
+        Compiles the solids into a mask of the cells they cover and index tables of their faces
+        :param solids: list of Solid objects
+        :param tables: mask, faces and cells already compiled for these solids by scene.compile_solids
         """
+        self.solid = list(solids)
+        if tables is None:
+            tables = compile_solids([[sol.pos_x, sol.pos_y, sol.size_x, sol.size_y] for sol in self.solid], (self.ny, self.nx))
+        self.solid_mask, self.solid_faces, self.solid_cells = tables
 
-        if len(table.shape) > 2:  # 3d velocity vector array
-            # Simulating the bouncing effect of the velocity array
-            # vertical, invert if y vector
-            table[:, 0, 1] = - table[:, 0, 1]
-            table[:, self.size - 1, 1] = - table[:, self.size - 1, 1]
-
-            # horizontal, invert if x vector
-            table[0, :, 0] = - table[0, :, 0]
-            table[self.size - 1, :, 0] = - table[self.size - 1, :, 0]
-
-            for sol in self.solid:
-                # vertical, invert if y vector
-                table[sol.pos_y:sol.pos_y + sol.size_y, sol.pos_x, 1] = - table[sol.pos_y:sol.pos_y + sol.size_y, sol.pos_x, 1]
-                table[sol.pos_y:sol.pos_y + sol.size_y, sol.pos_x + sol.size_x, 1] = - table[sol.pos_y:sol.pos_y + sol.size_y, sol.pos_x + sol.size_x, 1]
-
-                # horizontal, invert if x vector
-                table[sol.pos_y, sol.pos_x:sol.pos_x + sol.size_x, 0] = - table[sol.pos_y, sol.pos_x:sol.pos_x + sol.size_x, 0]
-                table[sol.pos_y + sol.size_y, sol.pos_x:sol.pos_x + sol.size_x, 0] = - table[sol.pos_y + sol.size_y, sol.pos_x:sol.pos_x + sol.size_x, 0]
+    def set_solid_cells(self, table):
+        """
+        Removes what is inside the solids
+        """
+        table[self.solid_cells] = 0
 
+    def set_boundaries(self, table):
+        """
+        Boundaries handling, the edges of the grid as given by the boundaries then the faces of the solids
+        :return:
+        """
 
-        table[0, 0] = 0.5 * (table[1, 0] + table[0, 1])
-        table[0, self.size - 1] = 0.5 * (table[1, self.size - 1] + table[0, self.size - 2])
-        table[self.size - 1, 0] = 0.5 * (table[self.size - 2, 0] + table[self.size - 1, 1])
-        table[self.size - 1, self.size - 1] = 0.5 * table[self.size - 2, self.size - 1] + table[self.size - 1, self.size - 2]
+        vector = len(table.shape) > 2  # 3d velocity vector array
+        self.boundaries.edges(table, vector)
+        if vector:
+            # faces of the solids, invert the vector perpendicular to the face
+            for axis, faces in enumerate(self.solid_faces):
+                np.negative.at(table[:, :, axis], faces)
+        self.boundaries.corners(table, vector)
 
     def diffuse(self, x, x0, diff):
         if diff != 0:
-            a = self.dt * diff * (self.size - 2) * (self.size - 2)
-            self.lin_solve(x, x0, a, 1 + 6 * a)
+            scale_y, scale_x = self.scale
+            if scale_y == scale_x:
+                a = self.dt * diff * scale_y * scale_y
+                c = 1 + 6 * a
+            else:  # weights of the neighbours along y and x
+                a = (self.dt * diff * scale_y * scale_y, self.dt * diff * scale_x * scale_x)
+                c = 1 + 3 * (a[0] + a[1])
+            if x.ndim == 2 and self._sparse() and type(self.solver) is JacobiSolver and self.solver.tol is None:
+                # the density only diffuses on the active tiles, with the sweeps of the jacobi solver
+                max_iter = self.solver.max_iter if self.solver.max_iter is not None else self.iter
+                self.tiles.keep(x, x0)
+                for iteration in range(0, max_iter):
+                    self.tiles.jacobi(x, x0, a, 1 / c)
+                    self.set_boundaries(x)
+            else:
+                self.lin_solve(x, x0, a, c)
         else:  # equivalent to lin_solve with a = 0
             x[:, :] = x0[:, :]
 
     def project(self, velo_x, velo_y, p, div):
-        # numpy equivalent to this in a for loop:
         # div[i, j] = -0.5 * (velo_x[i + 1, j] - velo_x[i - 1, j] + velo_y[i, j + 1] - velo_y[i, j - 1]) / self.size
-        div[1:-1, 1:-1] = -0.5 * (
-                velo_x[2:, 1:-1] - velo_x[:-2, 1:-1] +
-                velo_y[1:-1, 2:] - velo_y[1:-1, :-2]) / self.size
+        scale = self.project_scale[0] if self.project_scale[0] == self.project_scale[1] else self.project_scale
+        self.kernels.divergence(velo_x, velo_y, div, scale)
         p[:, :] = 0
 
         self.set_boundaries(div)
         self.set_boundaries(p)
-        self.lin_solve(p, div, 1, 6)
+        self.solve_pressure(p, div)
 
-        velo_x[1:-1, 1:-1] -= 0.5 * (p[2:, 1:-1] - p[:-2, 1:-1]) * self.size
-        velo_y[1:-1, 1:-1] -= 0.5 * (p[1:-1, 2:] - p[1:-1, :-2]) * self.size
+        self.kernels.gradient(velo_x, velo_y, p, scale)
 
         self.set_boundaries(self.velo)
+        self.set_solid_cells(self.velo)
+
+    def solve_pressure(self, p, div):
+        """Solves the pressure with lin_solve, in solve_dtype buffers when the fields have a lower precision.
+        With cells wider than tall, or the opposite, the neighbours along y and x get their own weights."""
+        scale_y, scale_x = self.project_scale
+        a, c = 1, 6
+        if scale_y != scale_x:
+            a = (scale_y / scale_x, scale_x / scale_y)
+            c = 3 * (a[0] + a[1])
+        if p.dtype == self.solve_dtype:
+            self.lin_solve(p, div, a, c)
+            return
+        if self.pressure is None or self.pressure[0].shape != p.shape:
+            self.pressure = (np.empty(p.shape, dtype=self.solve_dtype), np.empty(p.shape, dtype=self.solve_dtype))
+        p_solve, div_solve = self.pressure
+        p_solve[...] = p
+        div_solve[...] = div
+        self.lin_solve(p_solve, div_solve, a, c)
+        p[...] = p_solve
 
     def advect(self, d, d0, velocity):
-        dtx = self.dt * (self.size - 2)
-        dty = self.dt * (self.size - 2)
-
-        for j in range(1, self.size - 1):
-            for i in range(1, self.size - 1):
-                tmp1 = dtx * velocity[i, j, 0]
-                tmp2 = dty * velocity[i, j, 1]
-                x = i - tmp1
-                y = j - tmp2
-
-                if x < 0.5:
-                    x = 0.5
-                if x > (self.size - 1) - 0.5:
-                    x = (self.size - 1) - 0.5
-                i0 = math.floor(x)
-                i1 = i0 + 1.0
-
-                if y < 0.5:
-                    y = 0.5
-                if y > (self.size - 1) - 0.5:
-                    y = (self.size - 1) - 0.5
-                j0 = math.floor(y)
-                j1 = j0 + 1.0
-
-                s1 = x - i0
-                s0 = 1.0 - s1
-                t1 = y - j0
-                t0 = 1.0 - t1
-
-                i0i = int(i0)
-                i1i = int(i1)
-                j0i = int(j0)
-                j1i = int(j1)
-
-                try:
-                    d[i, j] = s0 * (t0 * d0[i0i, j0i] + t1 * d0[i0i, j1i]) + \
-                              s1 * (t0 * d0[i1i, j0i] + t1 * d0[i1i, j1i])
-                except IndexError:
-                    # tmp = str("inline: i0: %d, j0: %d, i1: %d, j1: %d" % (i0, j0, i1, j1))
-                    # print("tmp: %s\ntmp1: %s" %(tmp, tmp1))
-                    raise IndexError
+        dtx = self.dt * self.scale[0]
+        dty = self.dt * self.scale[1]
+
+        # Backtraces every interior cell, or those of the active tiles, and gathers d0 bilinearly around it
+        if any(self.boundaries.periodic):
+            # the backtraces wrap around the periodic axes, always on the whole grid
+            self.boundaries.advect(d, d0, velocity, dtx, dty)
+        elif self._sparse():
+            self.tiles.advect(d, d0, velocity, dtx, dty)
+        else:
+            self.kernels.advect(d, d0, velocity, dtx, dty)
         self.set_boundaries(d)
+        self.set_solid_cells(d)
+
+    def _sparse(self):
+        """True when the active tiles of the substep are known."""
+        return self.tiles is not None and self.tiles.cells is not None
 
     def turn(self):
         self.cntx += 1
@@ -173,49 +290,55 @@ class Fluid:
             self.roty = self.rotx
         return self.rotx, self.roty
 
+def _set_planes(planes, value, dtype):
+    """Copies an array of vectors into component planes of a dtype, reallocated only when the shape changes.
+    Returns the planes and their view as an array of vectors."""
+    value = np.moveaxis(np.asarray(value, dtype=dtype), -1, 0)
+    if planes is None or planes.shape != value.shape:
+        planes = np.ascontiguousarray(value)
+    else:
+        planes[...] = value
+    return planes, np.moveaxis(planes, 0, -1)
+
 if __name__ == "__main__":
     filename = "Config5"
     anim_name = "Movie5"
     save_anim = True
+    from assets import create_from_input, maintain_step
     try:
         import matplotlib.pyplot as plt
         from matplotlib import animation
+        from render import Renderer
+        from runner import VideoWriter
 
         inst = Fluid()
         cmap, qcolor, density, velocity, solids = create_from_input(inst, filename)
-        
+        # the frames are drawn by the Renderer, matplotlib only shows the image
+        renderer = Renderer(cmap, qcolor, scale=4)
+        # the first frames are saved, encoded in the thread of the writer while the next ones are computed
+        save_frames = 100
+        writer = VideoWriter("Movies/" + anim_name + ".gif", fps=30, renderer=Renderer(cmap, qcolor, scale=4)) if save_anim else None
+
         def update_im(i, densities, velocities, solids):
+            global writer
             maintain_step(inst, densities, velocities, solids)
             inst.step()
-            im.set_array(inst.density)
-            q.set_UVC(inst.velo[:, :, 1], inst.velo[:, :, 0])
-            # print(f"Density sum: {inst.density.sum()}")
-            im.autoscale()
+            im.set_data(renderer.render(inst.density, inst.velo_planes))
+            if writer is not None:
+                writer.write(inst)
+                if i + 1 >= save_frames:
+                    writer.close()
+                    writer = None
 
         fig = plt.figure()
 
-        # plot density
-        im = plt.imshow(inst.density, vmax=100, interpolation='bilinear', cmap=cmap)
-
-        # plot vector field
-        q = plt.quiver(inst.velo[:, :, 1], inst.velo[:, :, 0], scale=10, angles='xy', color=qcolor)
+        # plot density and vector field
+        im = plt.imshow(renderer.render(inst.density, inst.velo_planes))
         anim = animation.FuncAnimation(fig, update_im, fargs=(density, velocity, solids), interval=0)
-        if save_anim: anim.save("Movies/" + anim_name + ".gif", fps=30)
         plt.show()
+        if writer is not None: writer.close()
 
     except ImportError:
-        import imageio
-
-        frames = 30
-
-        flu = Fluid()
-        cmap, qcolor, density, velocity, solids = create_from_input(inst, filename)
-
-        video = np.full((frames, flu.size, flu.size), 0, dtype=float)
-
-        for step in range(0, frames):
-            maintain_step(inst, density, velocity, solids)
-            flu.step()
-            video[step] = flu.density
-
-        imageio.mimsave("Movies/" + anim_name + ".gif", video.astype('uint8'))
+        # headless fallback, streams the frames to the gif
+        from runner import run
+        run(filename, 30, output="Movies/" + anim_name + ".gif")
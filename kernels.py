@@ -0,0 +1,452 @@
+"""
+Kernels of the Fluid step, NumPy ones working in preallocated workspaces, and compiled ones used
+when the Fluid is created with backend="numba".
+
+Every compiled kernel is a single loop over the grid, with no temporary arrays, that gives the same
+results as the NumPy kernels. numba is only imported when a Fluid asks for it, without numba installed
+the Fluid falls back to NumPy.
+
+Running this file compares both backends and prints the time per step, FLUID_THREADS sets the threads:
+    python kernels.py 64 256 1024
+"""
+import abc
+import math
+import os
+import sys
+import warnings
+
+import numpy as np
+
+BACKENDS = ["numpy", "numba"]
+
+def _jacobi_rows(x, x0, a, c_recip, out, start, stop):
+    n1 = x.shape[1]
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            out[i, j] = (x0[i, j] + a * (x[i + 1, j] + x[i - 1, j] + x[i, j + 1] + x[i, j - 1])) * c_recip
+
+def _jacobi_rows_xy(x, x0, a_y, a_x, c_recip, out, start, stop):
+    n1 = x.shape[1]
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            out[i, j] = (x0[i, j] + a_y * (x[i + 1, j] + x[i - 1, j]) + a_x * (x[i, j + 1] + x[i, j - 1])) * c_recip
+
+def _copy_rows(x, out, start, stop):
+    n1 = x.shape[1]
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            x[i, j] = out[i, j]
+
+def _divergence(velo_x, velo_y, div, size, start, stop):
+    n1 = div.shape[1]
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            div[i, j] = -0.5 * (velo_x[i + 1, j] - velo_x[i - 1, j] + velo_y[i, j + 1] - velo_y[i, j - 1]) / size
+
+def _gradient(velo_x, velo_y, p, size, start, stop):
+    n1 = p.shape[1]
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            velo_x[i, j] -= 0.5 * (p[i + 1, j] - p[i - 1, j]) * size
+            velo_y[i, j] -= 0.5 * (p[i, j + 1] - p[i, j - 1]) * size
+
+def _divergence_xy(velo_x, velo_y, div, size_y, size_x, start, stop):
+    n1 = div.shape[1]
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            div[i, j] = -0.5 * ((velo_x[i + 1, j] - velo_x[i - 1, j]) / size_x + (velo_y[i, j + 1] - velo_y[i, j - 1]) / size_y)
+
+def _gradient_xy(velo_x, velo_y, p, size_y, size_x, start, stop):
+    n1 = p.shape[1]
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            velo_x[i, j] -= 0.5 * (p[i + 1, j] - p[i - 1, j]) * size_y
+            velo_y[i, j] -= 0.5 * (p[i, j + 1] - p[i, j - 1]) * size_x
+
+def _advect(d, d0, velo_x, velo_y, dtx, dty, start, stop):
+    n0, n1 = d.shape
+    for i in range(start, stop):
+        for j in range(1, n1 - 1):
+            x = i - dtx * velo_x[i, j]
+            y = j - dty * velo_y[i, j]
+            x = min(max(x, 0.5), (n0 - 1) - 0.5)
+            y = min(max(y, 0.5), (n1 - 1) - 0.5)
+
+            i0 = math.floor(x)
+            j0 = math.floor(y)
+            s1 = x - i0
+            s0 = 1.0 - s1
+            t1 = y - j0
+            t0 = 1.0 - t1
+
+            i0i = int(i0)
+            j0i = int(j0)
+            d[i, j] = s0 * (t0 * d0[i0i, j0i] + t1 * d0[i0i, j0i + 1]) + \
+                      s1 * (t0 * d0[i0i + 1, j0i] + t1 * d0[i0i + 1, j0i + 1])
+
+_compiled = {}
+
+def compiled_kernels():
+    """Compiled versions of the kernel functions, numba is only imported the first time they are asked.
+
+    Returns:
+        dict: The compiled function of every kernel by name, None if numba is not installed.
+    """
+    if not _compiled:
+        try:
+            import numba
+        except ImportError:
+            return None
+        # nogil lets several threads run the kernels at the same time
+        for function in [_jacobi_rows, _jacobi_rows_xy, _copy_rows, _divergence, _divergence_xy, _gradient, _gradient_xy, _advect]:
+            _compiled[function.__name__] = numba.njit(cache=True, nogil=True)(function)
+    return _compiled
+
+class Kernels(abc.ABC):
+    """Base class of the kernels of a Fluid, a backend implements every abstract kernel.
+    Every kernel works on the interior rows [start, stop) of 2d arrays, so the grid can be split in bands.
+    On cells that are not square, the weight a of jacobi and the size of divergence and gradient are pairs
+    (along y, along x).
+    """
+    def __init__(self):
+        """Creates the Kernels.
+        """
+        self.scratch = {}
+
+    def _scratch(self, shape: tuple, dtype=np.float64):
+        """Scratch array of a shape and dtype, allocated only once."""
+        key = (shape, np.dtype(dtype))
+        if key not in self.scratch: self.scratch[key] = np.empty(shape, dtype=dtype)
+        return self.scratch[key]
+
+    def jacobi(self, x, x0, a, c_recip):
+        """Jacobi sweep over the interior of x, every component of 3d arrays is swept.
+        """
+        if x.ndim > 2:
+            for k in range(x.shape[2]):
+                self.jacobi(x[:, :, k], x0[:, :, k], a, c_recip)
+            return
+        out = self._scratch(x.shape, x.dtype)
+        self.jacobi_rows(x, x0, a, c_recip, out, 1, x.shape[0] - 1)
+        self.copy_rows(x, out, 1, x.shape[0] - 1)
+
+    @abc.abstractmethod
+    def jacobi_rows(self, x, x0, a, c_recip, out, start, stop):
+        """Jacobi update of the rows of x, written to out."""
+
+    @abc.abstractmethod
+    def copy_rows(self, x, out, start, stop):
+        """Copies the interior of the rows of out to x."""
+
+    @abc.abstractmethod
+    def divergence(self, velo_x, velo_y, div, size, start=1, stop=-1):
+        """Divergence of the velocity in the rows of div."""
+
+    @abc.abstractmethod
+    def gradient(self, velo_x, velo_y, p, size, start=1, stop=-1):
+        """Subtracts the gradient of p from the velocity in the rows."""
+
+    @abc.abstractmethod
+    def advect(self, d, d0, velocity, dtx, dty, start=1, stop=-1):
+        """Semi-Lagrangian advection of d0 into the rows of d."""
+
+class NumpyKernels(Kernels):
+    """Row band versions of the NumPy code of the Fluid, NumPy releases the GIL while it computes.
+    Every operation writes into preallocated workspace arrays with out=, once the workspace of a grid exists
+    a step allocates no arrays. Bands write disjoint rows of the workspace, so threads can share it.
+    The grid is the last two axes, divergence, gradient and advect also run on a leading axis of members,
+    with weights of shape (members, 1, 1), see ensemble.py.
+    """
+    def _workspace(self, shape: tuple, dtype=np.float64):
+        """Workspace arrays for the interior of arrays of a shape and dtype, allocated only once."""
+        key = ("workspace", shape, np.dtype(dtype))
+        if key not in self.scratch:
+            rows, cols = shape[-2:]
+            inner = shape[:-2] + (rows - 2, cols - 2)
+            workspace = {name: np.empty(inner, dtype=dtype) for name in ["x", "y", "s0", "s1", "t0", "t1", "g", "h"]}
+            workspace["index"] = np.empty(inner, dtype=np.intp)
+            workspace["col"] = np.empty(inner, dtype=np.intp)
+            # Interior cell indices of every cell, as floats
+            workspace["i"], workspace["j"] = np.meshgrid(np.arange(1, rows - 1, dtype=dtype), np.arange(1, cols - 1, dtype=dtype), indexing="ij")
+            # Flat index of the first cell of every member
+            workspace["offset"] = (np.arange(int(np.prod(shape[:-2], dtype=np.intp)), dtype=np.intp) * (rows * cols)).reshape(shape[:-2] + (1, 1))
+            self.scratch[key] = workspace
+        return self.scratch[key]
+
+    def jacobi(self, x, x0, a, c_recip):
+        if x.ndim > 2:
+            # Both components at once, as planes of the velocity
+            x = x.transpose(2, 0, 1)
+            x0 = x0.transpose(2, 0, 1)
+        out = self._scratch(x.shape, x.dtype)
+        self.jacobi_rows(x, x0, a, c_recip, out, 1, x.shape[-2] - 1)
+        self.copy_rows(x, out, 1, x.shape[-2] - 1)
+
+    def jacobi_rows(self, x, x0, a, c_recip, out, start, stop):
+        # out = (x0 + a * (x[i + 1] + x[i - 1] + x[j + 1] + x[j - 1])) * c_recip
+        o = out[..., start:stop, 1:-1]
+        np.add(x[..., start + 1:stop + 1, 1:-1], x[..., start - 1:stop - 1, 1:-1], out=o)
+        if isinstance(a, tuple):
+            # out = (x0 + a_x * ((x[i + 1] + x[i - 1]) * a_y / a_x + x[j + 1] + x[j - 1])) * c_recip
+            ratio = a[0] / a[1]
+            a = a[1]
+            if isinstance(a, np.ndarray):
+                # weights per member, rounded to the precision of x like the scalars of a Fluid
+                ratio, a = ratio.astype(o.dtype), a.astype(o.dtype)
+            np.multiply(o, ratio, out=o)
+        np.add(o, x[..., start:stop, 2:], out=o)
+        np.add(o, x[..., start:stop, :-2], out=o)
+        np.multiply(o, a, out=o)
+        np.add(x0[..., start:stop, 1:-1], o, out=o)
+        np.multiply(o, c_recip, out=o)
+
+    def copy_rows(self, x, out, start, stop):
+        np.copyto(x[..., start:stop, 1:-1], out[..., start:stop, 1:-1])
+
+    def divergence(self, velo_x, velo_y, div, size, start=1, stop=-1):
+        # div = -0.5 * (velo_x[i + 1] - velo_x[i - 1] + velo_y[j + 1] - velo_y[j - 1]) / size
+        stop %= div.shape[-2]
+        o = div[..., start:stop, 1:-1]
+        np.subtract(velo_x[..., start + 1:stop + 1, 1:-1], velo_x[..., start - 1:stop - 1, 1:-1], out=o)
+        if isinstance(size, tuple):
+            # div = -0.5 * ((velo_x[i + 1] - velo_x[i - 1]) / size_x + (velo_y[j + 1] - velo_y[j - 1]) / size_y)
+            g = self._workspace(div.shape, div.dtype)["g"][..., start - 1:stop - 1, :]
+            np.divide(o, size[1], out=o)
+            np.subtract(velo_y[..., start:stop, 2:], velo_y[..., start:stop, :-2], out=g)
+            np.divide(g, size[0], out=g)
+            np.add(o, g, out=o)
+            np.multiply(o, -0.5, out=o)
+            return
+        np.add(o, velo_y[..., start:stop, 2:], out=o)
+        np.subtract(o, velo_y[..., start:stop, :-2], out=o)
+        np.multiply(o, -0.5, out=o)
+        np.divide(o, size, out=o)
+
+    def gradient(self, velo_x, velo_y, p, size, start=1, stop=-1):
+        # velo -= 0.5 * (p[i + 1] - p[i - 1], p[j + 1] - p[j - 1]) * size
+        stop %= p.shape[-2]
+        size_y, size_x = size if isinstance(size, tuple) else (size, size)
+        g = self._workspace(p.shape, velo_x.dtype)["g"][..., start - 1:stop - 1, :]
+        np.subtract(p[..., start + 1:stop + 1, 1:-1], p[..., start - 1:stop - 1, 1:-1], out=g)
+        np.multiply(g, 0.5, out=g)
+        np.multiply(g, size_y, out=g)
+        np.subtract(velo_x[..., start:stop, 1:-1], g, out=velo_x[..., start:stop, 1:-1])
+        np.subtract(p[..., start:stop, 2:], p[..., start:stop, :-2], out=g)
+        np.multiply(g, 0.5, out=g)
+        np.multiply(g, size_x, out=g)
+        np.subtract(velo_y[..., start:stop, 1:-1], g, out=velo_y[..., start:stop, 1:-1])
+
+    def advect(self, d, d0, velocity, dtx, dty, start=1, stop=-1):
+        n0, n1 = d.shape[-2:]
+        stop %= n0
+        workspace = self._workspace(d.shape, d.dtype)
+        x, y, s0, s1, t0, t1, g, h, index, col = [workspace[name][..., start - 1:stop - 1, :] for name in ["x", "y", "s0", "s1", "t0", "t1", "g", "h", "index", "col"]]
+
+        # Backtrace every interior cell at once, clamped to the domain
+        np.multiply(velocity[..., start:stop, 1:-1, 0], dtx, out=x)
+        np.subtract(workspace["i"][start - 1:stop - 1], x, out=x)
+        np.multiply(velocity[..., start:stop, 1:-1, 1], dty, out=y)
+        np.subtract(workspace["j"][start - 1:stop - 1], y, out=y)
+        np.clip(x, 0.5, (n0 - 1) - 0.5, out=x)
+        np.clip(y, 0.5, (n1 - 1) - 0.5, out=y)
+
+        # Weights of the neighbors, the floors go through s0 and t0 on their way to the indices
+        np.floor(x, out=s0)
+        np.subtract(x, s0, out=s1)
+        np.copyto(index, s0, casting="unsafe")
+        np.subtract(1.0, s1, out=s0)
+        np.floor(y, out=t0)
+        np.subtract(y, t0, out=t1)
+        np.copyto(col, t0, casting="unsafe")
+        np.subtract(1.0, t1, out=t0)
+
+        # Bilinear gather of the four neighbors from the flat d0, a view when d0 is contiguous
+        flat = d0.reshape(-1)
+        np.multiply(index, n1, out=index)
+        np.add(index, col, out=index)
+        if d.ndim > 2:
+            # the members follow each other in the flat d0
+            np.add(index, workspace["offset"], out=index)
+        np.take(flat, index, out=g, mode="clip")
+        np.multiply(g, t0, out=g)
+        np.add(index, 1, out=index)
+        np.take(flat, index, out=h, mode="clip")
+        np.multiply(h, t1, out=h)
+        np.add(g, h, out=g)
+        np.multiply(g, s0, out=g)
+
+        np.add(index, n1 - 1, out=index)
+        np.take(flat, index, out=h, mode="clip")
+        np.multiply(h, t0, out=h)
+        np.add(index, 1, out=index)
+        np.take(flat, index, out=x, mode="clip")
+        np.multiply(x, t1, out=x)
+        np.add(h, x, out=h)
+        np.multiply(h, s1, out=h)
+        np.add(g, h, out=d[..., start:stop, 1:-1])
+
+class NumbaKernels(Kernels):
+    """Compiled kernels of a Fluid, single loops with no temporary arrays.
+    """
+    def __init__(self):
+        """Creates the NumbaKernels, numba must be installed.
+        """
+        super().__init__()
+        compiled = compiled_kernels()
+        self._jacobi_rows = compiled["_jacobi_rows"]
+        self._jacobi_rows_xy = compiled["_jacobi_rows_xy"]
+        self._copy_rows = compiled["_copy_rows"]
+        self._divergence = compiled["_divergence"]
+        self._divergence_xy = compiled["_divergence_xy"]
+        self._gradient = compiled["_gradient"]
+        self._gradient_xy = compiled["_gradient_xy"]
+        self._advect = compiled["_advect"]
+
+    def jacobi_rows(self, x, x0, a, c_recip, out, start, stop):
+        if isinstance(a, tuple):
+            self._jacobi_rows_xy(x, x0, a[0], a[1], c_recip, out, start, stop)
+        else:
+            self._jacobi_rows(x, x0, a, c_recip, out, start, stop)
+
+    def copy_rows(self, x, out, start, stop):
+        self._copy_rows(x, out, start, stop)
+
+    def divergence(self, velo_x, velo_y, div, size, start=1, stop=-1):
+        if isinstance(size, tuple):
+            self._divergence_xy(velo_x, velo_y, div, size[0], size[1], start, stop % div.shape[0])
+        else:
+            self._divergence(velo_x, velo_y, div, size, start, stop % div.shape[0])
+
+    def gradient(self, velo_x, velo_y, p, size, start=1, stop=-1):
+        if isinstance(size, tuple):
+            self._gradient_xy(velo_x, velo_y, p, size[0], size[1], start, stop % p.shape[0])
+        else:
+            self._gradient(velo_x, velo_y, p, size, start, stop % p.shape[0])
+
+    def advect(self, d, d0, velocity, dtx, dty, start=1, stop=-1):
+        self._advect(d, d0, velocity[:, :, 0], velocity[:, :, 1], dtx, dty, start, stop % d.shape[0])
+
+class TiledKernels(Kernels):
+    """Runs the kernels of another Kernels on bands of rows, in a pool of threads.
+    Each band reads one halo row above and below it from the shared arrays. A pass only ends when every band
+    has written its rows, which is when the halo rows are exchanged: the next sweep reads the updated neighbors.
+    """
+    def __init__(self, kernels: Kernels, threads: int):
+        """Creates the TiledKernels.
+
+        Args:
+            kernels (Kernels): The kernels run on every band, compiled kernels or NumPy both release the GIL.
+            threads (int): Number of threads, the grid is split in as many bands.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        super().__init__()
+        self.kernels = kernels
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(threads)
+        self.bands = {}
+
+    def _bands(self, rows: int):
+        """Limits [start, stop) of the bands of the interior of an array of rows rows."""
+        if rows not in self.bands:
+            limits = np.linspace(1, rows - 1, min(self.threads, rows - 2) + 1).astype(int)
+            self.bands[rows] = list(zip(limits[:-1], limits[1:]))
+        return self.bands[rows]
+
+    def _run(self, kernel, rows: int, *args):
+        """Runs a kernel on every band and waits for all of them."""
+        futures = [self.pool.submit(kernel, *args, start, stop) for start, stop in self._bands(rows)]
+        for future in futures:
+            future.result()
+
+    def jacobi(self, x, x0, a, c_recip):
+        if x.ndim > 2:
+            for k in range(x.shape[2]):
+                self.jacobi(x[:, :, k], x0[:, :, k], a, c_recip)
+            return
+        out = self._scratch(x.shape, x.dtype)
+        self._run(self.kernels.jacobi_rows, x.shape[0], x, x0, a, c_recip, out)
+        self._run(self.kernels.copy_rows, x.shape[0], x, out)
+
+    def jacobi_rows(self, x, x0, a, c_recip, out, start, stop):
+        # rows chosen by the caller, already a band
+        self.kernels.jacobi_rows(x, x0, a, c_recip, out, start, stop)
+
+    def copy_rows(self, x, out, start, stop):
+        self.kernels.copy_rows(x, out, start, stop)
+
+    def divergence(self, velo_x, velo_y, div, size, start=1, stop=-1):
+        self._run(self.kernels.divergence, div.shape[0], velo_x, velo_y, div, size)
+
+    def gradient(self, velo_x, velo_y, p, size, start=1, stop=-1):
+        self._run(self.kernels.gradient, p.shape[0], velo_x, velo_y, p, size)
+
+    def advect(self, d, d0, velocity, dtx, dty, start=1, stop=-1):
+        self._run(self.kernels.advect, d.shape[0], d, d0, velocity, dtx, dty)
+
+def load_kernels(backend="numpy", threads=1):
+    """Kernels of a backend.
+
+    Args:
+        backend (str, optional): "numpy" or "numba". Defaults to "numpy".
+        threads (int, optional): Threads running the kernels on bands of rows. Defaults to 1.
+
+    Returns:
+        [str, Kernels]
+            str: The backend that will be used, numba falls back to numpy when it is not installed.
+            Kernels: The kernels.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {', '.join(BACKENDS)}")
+    if backend == "numba" and compiled_kernels() is None:
+        warnings.warn("numba is not installed, the Fluid falls back to numpy")
+        backend = "numpy"
+
+    kernels = NumbaKernels() if backend == "numba" else NumpyKernels()
+    if threads > 1: kernels = TiledKernels(kernels, threads)
+    return backend, kernels
+
+def benchmark(sizes=(64, 256, 1024), steps=10, threads=1):
+    """Compares both backends on a scene with a density, a velocity and a solid.
+    The results of both must be the same.
+
+    Args:
+        sizes (tuple, optional): Grid sizes. Defaults to (64, 256, 1024).
+        steps (int, optional): Steps timed per size. Defaults to 10.
+        threads (int, optional): Threads of the Fluid. Defaults to 1.
+    """
+    import time
+    from assets import maintain_step
+    from fluid import Fluid
+    from density import Density, Solid
+    from velocity import Velocity
+
+    for size in sizes:
+        quarter = size // 4
+        times = {}
+        fields = {}
+        for backend in BACKENDS:
+            fluid = Fluid(size, backend=backend, threads=threads)
+            densities = [Density(quarter, quarter, quarter // 2 + 1, quarter // 2 + 1)]
+            velocities = [Velocity(quarter, 2 * quarter, 2, 1)]
+            solids = [Solid(2 * quarter, 2 * quarter, quarter // 2 + 1, quarter // 2 + 1)]
+            fluid.set_solids(solids)
+            maintain_step(fluid, densities, velocities, solids)
+            fluid.step()  # compiles the kernels
+
+            start = time.perf_counter()
+            for step in range(0, steps):
+                maintain_step(fluid, densities, velocities, solids)
+                fluid.step()
+            times[fluid.backend] = (time.perf_counter() - start) / steps
+            fields[fluid.backend] = (fluid.density, fluid.velo)
+
+        line = f"{size}x{size}: numpy {times['numpy'] * 1000:.2f} ms/step"
+        if "numba" in times:
+            same = all(np.array_equal(a, b) for a, b in zip(fields["numpy"], fields["numba"]))
+            line += f", numba {times['numba'] * 1000:.2f} ms/step, speedup {times['numpy'] / times['numba']:.1f}x, same results: {same}"
+        print(line)
+
+if __name__ == "__main__":
+    threads = int(os.environ.get("FLUID_THREADS", 1))
+    benchmark([int(size) for size in sys.argv[1:]] or (64, 256, 1024), threads=threads)
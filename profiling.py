@@ -0,0 +1,82 @@
+"""
+Per-phase profiling of a Fluid.
+
+A Profiler wraps the methods of a single Fluid while it is attached, and removes the wrappers when
+it is detached, so a Fluid that is not profiled runs exactly the same code as before.
+"""
+import functools
+import json
+import time
+
+PHASES = ["step", "diffuse", "project", "advect", "lin_solve", "set_boundaries"]
+
+class Profiler:
+    """Collects the time and the calls of every phase of the step of a Fluid, and the solver iterations.
+    """
+    def __init__(self, phases=PHASES):
+        """Creates a Profiler.
+
+        Args:
+            phases (list, optional): Names of the methods of the Fluid that are timed. Defaults to PHASES.
+        """
+        self.phases = list(phases)
+        self.fluid = None
+        self.reset()
+
+    def reset(self):
+        """Clears the timers and counters.
+        """
+        self.times = {phase: 0.0 for phase in self.phases}
+        self.calls = {phase: 0 for phase in self.phases}
+        self.solver_iterations = 0
+
+    def attach(self, fluid):
+        """Starts profiling a Fluid.
+
+        Args:
+            fluid (Fluid): The Fluid to be profiled.
+        """
+        if self.fluid is not None: self.detach()
+        self.fluid = fluid
+        for phase in self.phases:
+            setattr(fluid, phase, self._wrap(phase, getattr(fluid, phase)))
+
+    def detach(self):
+        """Stops profiling, the Fluid gets its own methods back.
+        """
+        if self.fluid is None: return
+        for phase in self.phases:
+            if phase in vars(self.fluid): delattr(self.fluid, phase)
+        self.fluid = None
+
+    def _wrap(self, phase: str, method):
+        """Timed version of a bound method."""
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            self.times[phase] += time.perf_counter() - start
+            self.calls[phase] += 1
+            if phase == "lin_solve" and result is not None: self.solver_iterations += result
+            return result
+        return timed
+
+    def report(self):
+        """Results of the profiling, every time is inclusive of the phases called inside it.
+
+        Returns:
+            dict: Time in seconds and calls of every phase, and the solver iterations.
+        """
+        return {
+            "phases": {phase: {"time": self.times[phase], "calls": self.calls[phase]} for phase in self.phases},
+            "solver_iterations": self.solver_iterations,
+            "boundary_calls": self.calls.get("set_boundaries", 0)
+        }
+
+    def to_json(self):
+        """Report of the profiling as JSON.
+
+        Returns:
+            str: The report.
+        """
+        return json.dumps(self.report())
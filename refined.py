@@ -0,0 +1,398 @@
+"""
+Fluid with an adaptive fine level, block-structured refinement of the grid around the details.
+
+The grid is split into blocks of block x block cells. Blocks where the density gradient or the vorticity
+is high, or next to a solid, get a patch ratio times finer, and the blocks where the flow calms down lose
+theirs. The coarse grid is stepped as a Fluid over the whole domain, then every patch is stepped on the
+hierarchy: the backtraces of the advection sample the finest data covering their departure point, and
+the projection solves the pressure of every patch with the coarse pressure around it. The patches are then
+averaged back onto the coarse cells they cover.
+
+Every patch has a ring of ghost cells, filled from the neighbouring patches, or from the coarse grid where
+there are none. The patches are stacked in arrays of shape (K, block * ratio + 2, block * ratio + 2) like the
+members of an EnsembleFluid.
+
+Usage:
+    fluid = RefinedFluid(128, ratio=8)  # the detail of a 1024 x 1024 grid near the features
+    for frame in range(0, frames):
+        sources.apply(fluid)
+        fluid.step()
+    image = fluid.composite(fluid.fine_density, fluid.density)
+"""
+import numpy as np
+
+from fluid import Fluid
+
+class RefinedFluid(Fluid):
+    """Fluid with patches ratio times finer on the blocks where the flow has detail.
+    density and velo are the coarse fields, where a patch exists they hold the average of the patch.
+    The sources write into the coarse fields, the cells they change are copied into the patches.
+    """
+    def __init__(self, size=60, ratio=4, block=None, gradient_threshold=5.0, vorticity_threshold=0.1, regrid_every=4, max_patches=None, **kwargs):
+        """Creates a RefinedFluid.
+
+        Args:
+            size (int, optional): The size of the coarse grid. Defaults to 60.
+            ratio (int, optional): Fine cells per coarse cell along each axis. Defaults to 4.
+            block (int, optional): Coarse cells per block along each axis, it must divide size. Defaults to None.
+                None: The largest divisor of size from 4 to 16 that gives at least 8 blocks along each axis,
+                or the smallest divisor from 4 to 16 on smaller grids.
+            gradient_threshold (float, optional): Density difference per coarse cell that refines a block. Defaults to 5.0.
+            vorticity_threshold (float, optional): Vorticity that refines a block. Defaults to 0.1.
+            regrid_every (int, optional): Substeps between two updates of the refined blocks. Defaults to 4.
+            max_patches (int, optional): Limit of patches, the blocks with the most detail are kept. Defaults to None.
+                None: As many as keep the cells of the coarse grid and the patches under the cells of the uniform grid
+                of the finest resolution, see cell_count.
+            kwargs: The other arguments of Fluid.
+
+        Raises:
+            ValueError: If no block divides size, or if the grid or its cells are not square.
+        """
+        super().__init__(size, **kwargs)
+        if self.nx != self.ny or self.spacing is not None:
+            raise ValueError("RefinedFluid needs a square grid of square cells")
+        if block is None:
+            # small blocks follow the detail closely, large ones have fewer ghost cells
+            divisors = [b for b in range(4, 17) if size % b == 0]
+            if not divisors: raise ValueError(f"No block from 4 to 16 divides size {size}, give a block")
+            block = max((b for b in divisors if size // b >= 8), default=divisors[0])
+        if size % block: raise ValueError(f"block {block} does not divide size {size}")
+        self.ratio = ratio
+        self.block = block
+        self.blocks_per_axis = size // block
+        self.gradient_threshold = gradient_threshold
+        self.vorticity_threshold = vorticity_threshold
+        self.regrid_every = regrid_every
+        self.max_patches = max_patches
+        self.regrids = regrid_every  # substeps since the last update of the refined blocks, the first substep regrids
+
+        self._set_blocks(np.empty((0, 2), dtype=np.intp))
+
+    @property
+    def patch_size(self):
+        """Cells of a patch along each axis, ghost cells included."""
+        return self.block * self.ratio + 2
+
+    def cell_count(self):
+        """Cells simulated, coarse and fine, and the cells of a uniform grid of the same finest resolution.
+
+        Returns:
+            [int, int]
+                int: Cells of the coarse grid and of the patches.
+                int: Cells of the uniform grid.
+        """
+        return self.size * self.size + self.fine_density.size, (self.size * self.ratio) ** 2
+
+    def patch_limit(self):
+        """Number of patches allowed, max_patches or else as many as fit in the cells of the uniform grid of the
+        finest resolution beside the coarse grid: more patches would cost more than no refinement at all."""
+        if self.max_patches is not None: return self.max_patches
+        return ((self.size * self.ratio) ** 2 - self.size * self.size) // (self.patch_size * self.patch_size)
+
+    def flag_blocks(self):
+        """Blocks that need a patch: the density difference between neighbour cells or the vorticity passes its
+        threshold, or the block touches a solid. The flags are dilated by one block, so the patches are ready
+        before the detail moves into the next block. Over patch_limit, the dilation goes first, then the blocks
+        with the least detail.
+
+        Returns:
+            np.ndarray: Block rows and columns of the blocks, of shape (K, 2).
+        """
+        density = self.density
+        vy, vx = self.velo_planes
+        detail = np.zeros((self.size, self.size))
+        detail[1:-1, :] = np.abs(density[2:, :] - density[:-2, :]) / (2 * self.gradient_threshold)
+        detail[:, 1:-1] = np.maximum(detail[:, 1:-1], np.abs(density[:, 2:] - density[:, :-2]) / (2 * self.gradient_threshold))
+        vorticity = np.zeros((self.size, self.size))
+        vorticity[1:-1, 1:-1] = np.abs(vx[2:, 1:-1] - vx[:-2, 1:-1] - vy[1:-1, 2:] + vy[1:-1, :-2]) / (2 * self.vorticity_threshold)
+        np.maximum(detail, vorticity, out=detail)
+
+        # solids and the cells around them
+        solid = np.zeros((self.size + 2, self.size + 2), dtype=bool)
+        solid[1:-1, 1:-1] = self.solid_mask
+        near = solid[1:-1, 1:-1] | solid[:-2, 1:-1] | solid[2:, 1:-1] | solid[1:-1, :-2] | solid[1:-1, 2:]
+        detail[near] = np.maximum(detail[near], 1)
+
+        nb, b = self.blocks_per_axis, self.block
+        score = detail.reshape(nb, b, nb, b).max(axis=(1, 3))
+        flagged = score >= 1
+        padded = np.zeros((nb + 2, nb + 2), dtype=bool)
+        padded[1:-1, 1:-1] = flagged
+        near = np.any([padded[1 + dy:nb + 1 + dy, 1 + dx:nb + 1 + dx] for dy in (-1, 0, 1) for dx in (-1, 0, 1)], axis=0)
+        rows, cols = np.nonzero(near)
+        limit = self.patch_limit()
+        if len(rows) > limit:
+            # the flagged blocks with the most detail first, then their neighbours
+            rank = np.where(flagged, score, 0)[rows, cols]
+            keep = np.sort(np.argsort(-rank, kind="stable")[:limit])
+            rows, cols = rows[keep], cols[keep]
+        return np.stack([rows, cols], axis=1)
+
+    def regrid(self):
+        """Updates the refined blocks, the patches kept keep their data, the new ones are interpolated from
+        the coarse grid."""
+        self.regrids = 0
+        blocks = self.flag_blocks()
+        old_index = self.block_index
+        old = (self.fine_density, self.fine_velo)
+        self._set_blocks(blocks)
+
+        kept = old_index[blocks[:, 0], blocks[:, 1]]
+        new = kept < 0
+        self.fine_density[~new] = old[0][kept[~new]]
+        self.fine_velo[:, ~new] = old[1][:, kept[~new]]
+        if new.any():
+            y, x = self.fine_y[new], self.fine_x[new]
+            self.fine_density[new] = _bilinear(self.density, y, x)
+            for axis in range(2):
+                self.fine_velo[axis, new] = _bilinear(self.velo_planes[axis], y, x)
+        self._record()
+
+    def _set_blocks(self, blocks):
+        """Allocates the patches of the blocks given and their tables: the block of every patch, the patch of
+        every block, the coarse coordinates of every fine cell and the fine cells in solids or on the walls."""
+        nb, b, r, m = self.blocks_per_axis, self.block, self.ratio, self.patch_size
+        k = len(blocks)
+        self.blocks = blocks
+        self.block_index = np.full((nb, nb), -1, dtype=np.intp)
+        self.block_index[blocks[:, 0], blocks[:, 1]] = np.arange(k)
+
+        self.fine_density = np.zeros((k, m, m), dtype=self.dtype)
+        self.fine_s = np.zeros((k, m, m), dtype=self.dtype)
+        self.fine_velo = np.zeros((2, k, m, m), dtype=self.dtype)  # planes [y, x] like velo_planes
+        self.fine_velo0 = np.zeros((2, k, m, m), dtype=self.dtype)
+        self.fine_pressure = np.zeros((k, m, m), dtype=self.solve_dtype)
+        self.fine_div = np.zeros((k, m, m), dtype=self.solve_dtype)
+
+        # center of every fine cell in coarse cell coordinates, coarse cell i spans [i - 0.5, i + 0.5]
+        offsets = (np.arange(m) - 0.5) / r - 0.5
+        self.fine_y = (blocks[:, 0] * b)[:, None, None] + offsets[None, :, None] + np.zeros((1, 1, m))
+        self.fine_x = (blocks[:, 1] * b)[:, None, None] + offsets[None, None, :] + np.zeros((1, m, 1))
+
+        # the coarse cell above every interior fine cell
+        parent_y = np.rint(self.fine_y[:, 1:-1, 1:-1]).astype(np.intp)
+        parent_x = np.rint(self.fine_x[:, 1:-1, 1:-1]).astype(np.intp)
+        self.fine_solid = self.solid_mask[parent_y, parent_x]
+        # the boundary cells of the coarse grid stay under its control, set_boundaries only runs there
+        self.fine_wall = (parent_y == 0) | (parent_y == self.size - 1) | (parent_x == 0) | (parent_x == self.size - 1)
+        self.block_wall = self.fine_wall.reshape(k, b, r, b, r).any(axis=(2, 4))
+        # interpolation of the coarse grid at every fine cell, and at the fine cells on the walls
+        self.prolongation = _weights((self.size, self.size), self.fine_y, self.fine_x)
+        self.wall_prolongation = _weights((self.size, self.size), self.fine_y[:, 1:-1, 1:-1][self.fine_wall], self.fine_x[:, 1:-1, 1:-1][self.fine_wall])
+
+    def set_solids(self, solids, tables=None):
+        super().set_solids(solids, tables)
+        if hasattr(self, "blocks"):
+            parent_y = np.rint(self.fine_y[:, 1:-1, 1:-1]).astype(np.intp)
+            parent_x = np.rint(self.fine_x[:, 1:-1, 1:-1]).astype(np.intp)
+            self.fine_solid = self.solid_mask[parent_y, parent_x]
+
+    def _coarse_blocks(self, table):
+        """View of a coarse field as blocks, of shape (blocks, blocks, block, block)."""
+        nb, b = self.blocks_per_axis, self.block
+        return table.reshape(nb, b, nb, b).swapaxes(1, 2)
+
+    def _record(self):
+        """Keeps the coarse values of the refined blocks, the cells the sources change are found against them."""
+        rows, cols = self.blocks[:, 0], self.blocks[:, 1]
+        self.recorded = [self._coarse_blocks(table)[rows, cols] for table in (self.density, *self.velo_planes)]
+
+    def _inject(self):
+        """Copies the coarse cells changed since the last step, by the sources, into the fine cells below them."""
+        if not len(self.blocks): return
+        rows, cols, r = self.blocks[:, 0], self.blocks[:, 1], self.ratio
+        fines = (self.fine_density, self.fine_velo[0], self.fine_velo[1])
+        for table, recorded, fine in zip((self.density, *self.velo_planes), self.recorded, fines):
+            current = self._coarse_blocks(table)[rows, cols]
+            changed = current != recorded
+            if not changed.any(): continue
+            changed = changed.repeat(r, axis=1).repeat(r, axis=2)
+            np.copyto(fine[:, 1:-1, 1:-1], current.repeat(r, axis=1).repeat(r, axis=2), where=changed)
+
+    def substep(self):
+        """Single step over dt, every phase of Fluid.substep runs on the coarse grid then on the patches,
+        so the patches sample the coarse fields of the same phase."""
+        if not self.boundaries.is_reflect(): raise ValueError("RefinedFluid needs reflective walls on every edge")
+        # the sources reach the patches before a regrid records the coarse cells again
+        self._inject()
+        if self.regrids >= self.regrid_every: self.regrid()
+        self.regrids += 1
+        if not len(self.blocks):
+            super().substep()
+            return
+        self._fill_ghosts(self.fine_velo, self.velo_planes)
+        self._fill_ghosts(self.fine_density, self.density)
+
+        self.diffuse(self.velo0, self.velo, self.visc)
+        self._fine_diffuse(self.fine_velo0, self.fine_velo, self.visc)
+
+        # x0, y0, x, y, the coarse pressure is left in velo[..., 0]
+        self.project(self.velo0[..., 0], self.velo0[..., 1], self.velo[..., 0], self.velo[..., 1])
+        self._fine_project(self.fine_velo0, self.velo0_planes, self.velo_planes[0])
+
+        self.advect(self.velo[..., 0], self.velo0[..., 0], self.velo0)
+        self.advect(self.velo[..., 1], self.velo0[..., 1], self.velo0)
+        for axis in range(2):
+            self._fine_advect(self.fine_velo[axis], self.fine_velo0[axis], self.velo0_planes[axis], self.fine_velo0)
+            self._fine_boundaries(self.fine_velo[axis], self.velo_planes[axis])
+
+        self.project(self.velo[..., 0], self.velo[..., 1], self.velo0[..., 0], self.velo0[..., 1])
+        self._fine_project(self.fine_velo, self.velo_planes, self.velo0_planes[0])
+
+        self.diffuse(self.s, self.density, self.diff)
+        self._fine_diffuse(self.fine_s, self.fine_density, self.diff)
+        self._fill_ghosts(self.fine_s, self.s)
+
+        self.advect(self.density, self.s, self.velo)
+        self._fine_advect(self.fine_density, self.fine_s, self.s, self.fine_velo)
+        self._fine_boundaries(self.fine_density, self.density)
+
+        self._restrict()
+
+    def _sample(self, coarse, fine, y, x):
+        """Bilinear samples at coarse coordinates, from the patch covering each point or else from the coarse field.
+        Points outside the grid are clamped to it."""
+        n, b, r, m = self.size, self.block, self.ratio, self.patch_size
+        y = np.clip(y, 0, n - 1)
+        x = np.clip(x, 0, n - 1)
+        by = np.minimum(((y + 0.5) // b).astype(np.intp), self.blocks_per_axis - 1)
+        bx = np.minimum(((x + 0.5) // b).astype(np.intp), self.blocks_per_axis - 1)
+        patch = self.block_index[by, bx]
+
+        inside = patch >= 0
+        if inside.all():
+            return _bilinear(fine, (y - by * b + 0.5) * r + 0.5, (x - bx * b + 0.5) * r + 0.5, patch)
+        values = np.empty(y.shape, dtype=fine.dtype)
+        outside = ~inside
+        values[outside] = _bilinear(coarse, y[outside], x[outside])
+        if inside.any():
+            k = patch[inside]
+            # patch cell coordinates, the ghost ring is index 0
+            fy = (y[inside] - by[inside] * b + 0.5) * r + 0.5
+            fx = (x[inside] - bx[inside] * b + 0.5) * r + 0.5
+            values[inside] = _bilinear(fine, fy, fx, k)
+        return values
+
+    def _fill_ghosts(self, fine, coarse):
+        """Fills the ghost ring of every patch from the neighbour patches, or else from the coarse field.
+        Works on a scalar stack (K, m, m) and its field, or velocity planes (2, K, m, m) and their planes."""
+        if fine.ndim > 3:
+            for axis in range(fine.shape[0]):
+                self._fill_ghosts(fine[axis], coarse[axis])
+            return
+        ring = _ring(self.patch_size)
+        y, x = self.fine_y[:, ring[0], ring[1]], self.fine_x[:, ring[0], ring[1]]
+        fine[:, ring[0], ring[1]] = self._sample(coarse, fine, y, x)
+
+    def _fine_advect(self, d, d0, coarse0, velocity):
+        """Semi-Lagrangian advection of the interior of the patches, the backtraces go as far as in the coarse grid."""
+        dt0 = self.dt * (self.size - 2)
+        y = self.fine_y[:, 1:-1, 1:-1] - dt0 * velocity[0][:, 1:-1, 1:-1]
+        x = self.fine_x[:, 1:-1, 1:-1] - dt0 * velocity[1][:, 1:-1, 1:-1]
+        d[:, 1:-1, 1:-1] = self._sample(coarse0, d0, y, x)
+
+    def _fine_boundaries(self, d, coarse):
+        """Empties the fine cells in solids and gives the fine cells on the walls the values of the coarse field."""
+        inner = d[:, 1:-1, 1:-1]
+        inner[self.fine_solid] = 0
+        if self.fine_wall.any():
+            inner[self.fine_wall] = _interpolate(coarse, self.wall_prolongation)
+
+    def _fine_jacobi(self, x, x0, a, c, iterations):
+        """Jacobi sweeps over the interior of the patches, the ghost rings are fixed."""
+        out = np.empty_like(x[..., 1:-1, 1:-1])
+        for iteration in range(0, iterations):
+            np.add(x[..., 2:, 1:-1], x[..., :-2, 1:-1], out=out)
+            out += x[..., 1:-1, 2:]
+            out += x[..., 1:-1, :-2]
+            out *= a
+            out += x0[..., 1:-1, 1:-1]
+            out /= c
+            x[..., 1:-1, 1:-1] = out
+
+    def _fine_diffuse(self, x, x0, diff):
+        """Diffusion of the patches, the same system as Fluid.diffuse at the fine resolution."""
+        x[...] = x0
+        if diff != 0:
+            size = self.size * self.ratio
+            a = self.dt * diff * (size - 2) * (size - 2)
+            self._fine_jacobi(x, x0, a, 1 + 6 * a, self.iter)
+
+    def _fine_project(self, velo, coarse_velo, coarse_pressure):
+        """Projection of the velocity planes of the patches, the same system as Fluid.project at the fine resolution.
+        The pressure starts from the coarse pressure of the same projection, which also holds the ghost rings."""
+        size = self.size * self.ratio
+        vy, vx = velo
+        self._fill_ghosts(velo, coarse_velo)
+        div, p = self.fine_div, self.fine_pressure
+        div[:, 1:-1, 1:-1] = -0.5 * (vy[:, 2:, 1:-1] - vy[:, :-2, 1:-1] + vx[:, 1:-1, 2:] - vx[:, 1:-1, :-2]) / size
+        p[...] = _interpolate(coarse_pressure, self.prolongation)
+        self._fine_jacobi(p, div, 1, 6, self.iter)
+
+        vy[:, 1:-1, 1:-1] -= 0.5 * (p[:, 2:, 1:-1] - p[:, :-2, 1:-1]) * size
+        vx[:, 1:-1, 1:-1] -= 0.5 * (p[:, 1:-1, 2:] - p[:, 1:-1, :-2]) * size
+        for axis in range(2):
+            self._fine_boundaries(velo[axis], coarse_velo[axis])
+        # the advection samples the ghost rings, they take the projected velocity of the neighbour patches
+        self._fill_ghosts(velo, coarse_velo)
+
+    def _restrict(self):
+        """Averages the patches onto the coarse cells they cover, except the boundary cells of the coarse grid."""
+        k, b, r = len(self.blocks), self.block, self.ratio
+        rows, cols = self.blocks[:, 0], self.blocks[:, 1]
+        for table, fine in zip((self.density, *self.velo_planes), (self.fine_density, *self.fine_velo)):
+            view = self._coarse_blocks(table)
+            average = fine[:, 1:-1, 1:-1].reshape(k, b, r, b, r).mean(axis=(2, 4))
+            view[rows, cols] = np.where(self.block_wall, view[rows, cols], average)
+        self._record()
+
+    def composite(self, fine, coarse):
+        """Field at the finest resolution over the whole grid, the patches where they exist, the coarse
+        cells repeated elsewhere. Meant for output, it has the size of the uniform fine grid.
+
+        Args:
+            fine (np.ndarray): The patches of the field, fine_density or a plane of fine_velo.
+            coarse (np.ndarray): The coarse field, density or a plane of velo_planes.
+
+        Returns:
+            np.ndarray: The field, of shape (size * ratio, size * ratio).
+        """
+        b, r = self.block, self.ratio
+        image = coarse.repeat(r, axis=0).repeat(r, axis=1)
+        for k, (row, col) in enumerate(self.blocks):
+            image[row * b * r:(row + 1) * b * r, col * b * r:(col + 1) * b * r] = fine[k, 1:-1, 1:-1]
+        return image
+
+def _bilinear(table, y, x, k=None):
+    """Bilinear samples of a 2d table, or of the tables k of a stack, at fractional indices clamped to the table."""
+    return _interpolate(table, _weights(table.shape, y, x, k))
+
+def _weights(shape: tuple, y, x, k=None):
+    """Flat index of the first corner and the weights of the bilinear samples of tables of a shape,
+    they can be kept to sample several tables at the same points."""
+    n0, n1 = shape[-2:]
+    y = np.clip(y, 0, n0 - 1)
+    x = np.clip(x, 0, n1 - 1)
+    i0 = np.minimum(y.astype(np.intp), n0 - 2)
+    j0 = np.minimum(x.astype(np.intp), n1 - 2)
+    index = i0 * n1 + j0
+    if k is not None: index += k * (n0 * n1)
+    return index, y - i0, x - j0, n1
+
+def _interpolate(table, weights):
+    """Bilinear samples of a table with the weights of _weights, the corners are gathered from the flat table."""
+    index, s1, t1, n1 = weights
+    flat = table.reshape(-1)
+    top = flat.take(index)
+    top += t1 * (flat.take(index + 1) - top)
+    bottom = flat.take(index + n1)
+    bottom += t1 * (flat.take(index + n1 + 1) - bottom)
+    top += s1 * (bottom - top)
+    return top
+
+def _ring(m: int):
+    """Indices of the ghost ring of an m x m patch."""
+    ring = np.zeros((m, m), dtype=bool)
+    ring[[0, -1], :] = True
+    ring[:, [0, -1]] = True
+    return np.nonzero(ring)
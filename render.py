@@ -0,0 +1,214 @@
+"""
+Renderer of the frames of a Fluid straight to uint8 RGB images, without matplotlib in the loop.
+
+The density is mapped through a lookup table of the colormap computed once, and the velocity is drawn
+as line glyphs on a downsampled grid, like the quiver of the display. RenderPipeline renders and encodes
+the frames in a thread, so a frame is encoded while the Fluid computes the next one.
+
+Usage:
+    renderer = Renderer("viridis", "k", scale=4)
+    pipeline = RenderPipeline(renderer, imageio.get_writer("Movies/Movie.mp4"))
+    for frame in range(0, frames):
+        fluid.step()
+        pipeline.write(fluid)
+    pipeline.close()
+"""
+import queue
+import threading
+
+import numpy as np
+
+# RGB of the quiver colors of assets.QCOLOR, the matplotlib base colors
+BASE_COLORS = {
+    "b": (0, 0, 255), "g": (0, 128, 0), "r": (255, 0, 0), "c": (0, 191, 191),
+    "m": (191, 0, 191), "y": (191, 191, 0), "k": (0, 0, 0), "w": (255, 255, 255)
+}
+
+def colormap_lut(name="", levels=256):
+    """Lookup table of a matplotlib colormap as uint8 RGB.
+    Without a name, or without matplotlib, the table is a grey ramp.
+
+    Args:
+        name (str, optional): The name of the Colormap. Defaults to "".
+        levels (int, optional): Number of entries of the table. Defaults to 256.
+
+    Returns:
+        np.ndarray: The table, of shape (levels, 3).
+    """
+    ramp = np.linspace(0, 1, levels)
+    if name and name != "None":
+        try:
+            from matplotlib import colormaps
+            return np.round(colormaps[name](ramp)[:, :3] * 255).astype(np.uint8)
+        except ImportError:
+            pass
+    return np.repeat(np.round(ramp * 255).astype(np.uint8)[:, None], 3, axis=1)
+
+def quiver_rgb(name=""):
+    """RGB of a quiver color, a base color name or any color matplotlib knows.
+
+    Args:
+        name (str, optional): The name of the Color. Defaults to "".
+            "" or "None": No glyphs are drawn.
+
+    Returns:
+        tuple: The RGB values, or None.
+    """
+    if not name or name == "None": return None
+    if name in BASE_COLORS: return BASE_COLORS[name]
+    from matplotlib.colors import to_rgb
+    return tuple(int(round(channel * 255)) for channel in to_rgb(name))
+
+class Renderer:
+    """Draws the density and the velocity of a Fluid into a uint8 RGB image.
+    The colormap covers a fixed range of densities, so nothing is rescaled between frames.
+    """
+    def __init__(self, colormap="", qcolor="", vmin=0.0, vmax=100.0, scale=1, quiver_step=4, levels=256):
+        """Creates a Renderer.
+
+        Args:
+            colormap (str, optional): The name of the Colormap. Defaults to "", a grey ramp.
+            qcolor (str, optional): The name of the Color of the velocity glyphs. Defaults to "", no glyphs.
+            vmin (float, optional): Density at the bottom of the colormap. Defaults to 0.0.
+            vmax (float, optional): Density at the top of the colormap, like the vmax of the display. Defaults to 100.0.
+            scale (int, optional): Pixels per cell along each axis. Defaults to 1.
+            quiver_step (int, optional): Cells between two glyphs along each axis. Defaults to 4.
+            levels (int, optional): Entries of the lookup table. Defaults to 256.
+        """
+        self.colormap = colormap
+        self.levels = levels
+        self.lut = None  # built on the first frame, matplotlib is only imported by videos
+        self.qcolor = quiver_rgb(qcolor)
+        self.vmin = vmin
+        self.vmax = vmax
+        self.scale = scale
+        self.quiver_step = quiver_step
+        self.buffers = None
+
+    def _buffers(self, shape: tuple):
+        """Buffers of a grid shape, allocated on the first frame: the scaled densities, their levels, the cell
+        of every pixel, the level of every pixel and the image, plus the glyph cells and the points along a glyph."""
+        if self.buffers is None or self.buffers["shape"] != shape:
+            scale = self.scale
+            step = self.quiver_step
+            rows = np.arange(shape[0] * scale) // scale
+            cols = np.arange(shape[1] * scale) // scale
+            glyph_y, glyph_x = np.meshgrid(np.arange(step // 2, shape[0], step), np.arange(step // 2, shape[1], step), indexing="ij")
+            self.buffers = {
+                "shape": shape,
+                "scaled": np.empty(shape),
+                "levels": np.empty(shape, dtype=np.intp),
+                "pixels": rows[:, None] * shape[1] + cols[None, :],
+                "pixel_levels": np.empty((shape[0] * scale, shape[1] * scale), dtype=np.intp),
+                "image": np.empty((shape[0] * scale, shape[1] * scale, 3), dtype=np.uint8),
+                "glyphs": (glyph_y.reshape(-1), glyph_x.reshape(-1)),
+                "points": np.linspace(0, 1, step * scale + 1)
+            }
+        return self.buffers
+
+    def render(self, density, velo_planes):
+        """Draws a frame. The image returned is reused by the next frame of the same shape.
+
+        Args:
+            density (np.ndarray): The density of the Fluid.
+            velo_planes (np.ndarray): The velocity of the Fluid as component planes [y, x], see Fluid.velo_planes.
+
+        Returns:
+            np.ndarray: The image, of shape (rows * scale, cols * scale, 3) and dtype uint8.
+        """
+        if self.lut is None: self.lut = colormap_lut(self.colormap, self.levels)
+        buffers = self._buffers(density.shape)
+        scaled, levels, image = buffers["scaled"], buffers["levels"], buffers["image"]
+        top = len(self.lut) - 1
+
+        # density to the index of its color
+        np.subtract(density, self.vmin, out=scaled)
+        np.multiply(scaled, top / (self.vmax - self.vmin), out=scaled)
+        np.clip(scaled, 0, top, out=scaled)
+        np.copyto(levels, scaled, casting="unsafe")
+        np.take(levels, buffers["pixels"], out=buffers["pixel_levels"])
+        np.take(self.lut, buffers["pixel_levels"], axis=0, out=image)
+
+        if self.qcolor is not None: self._draw_glyphs(image, velo_planes, buffers)
+        return image
+
+    def _draw_glyphs(self, image, velo_planes, buffers):
+        """Draws a line from the center of every glyph cell along its velocity.
+        The longest line spans quiver_step cells, the others are shorter in proportion to their speed."""
+        glyph_y, glyph_x = buffers["glyphs"]
+        dir_y = velo_planes[0][glyph_y, glyph_x]
+        dir_x = velo_planes[1][glyph_y, glyph_x]
+        speed = np.sqrt(dir_y * dir_y + dir_x * dir_x).max()
+        if speed == 0: return
+
+        # rows and columns of the points of every line in pixels, the y component points down the rows
+        length = self.quiver_step * self.scale / speed
+        center = (self.scale - 1) / 2
+        points = buffers["points"]
+        rows = np.rint(glyph_y[:, None] * self.scale + center + dir_y[:, None] * length * points).astype(np.intp)
+        cols = np.rint(glyph_x[:, None] * self.scale + center + dir_x[:, None] * length * points).astype(np.intp)
+        inside = (rows >= 0) & (rows < image.shape[0]) & (cols >= 0) & (cols < image.shape[1])
+        image[rows[inside], cols[inside]] = self.qcolor
+
+class RenderPipeline:
+    """Renders and encodes the frames of a Fluid in a thread, while the Fluid computes the next frames.
+    write only copies the fields into a free buffer, it waits when depth frames are already queued.
+    """
+    def __init__(self, renderer: Renderer, encoder, depth=4):
+        """Creates a RenderPipeline and starts its thread.
+
+        Args:
+            renderer (Renderer): The Renderer of the frames.
+            encoder (object): Receives the images with append_data(image) and is closed with close(), like an imageio writer.
+            depth (int, optional): Frames waiting to be rendered at most. Defaults to 4.
+        """
+        self.renderer = renderer
+        self.encoder = encoder
+        self.depth = depth
+        self.allocated = 0
+        self.free = queue.Queue()
+        self.queued = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="render-pipeline", daemon=True)
+        self.thread.start()
+
+    def write(self, fluid):
+        """Queues the current frame of the Fluid.
+
+        Args:
+            fluid (Fluid): The Fluid after its step.
+        """
+        if self.error is not None: raise self.error
+        try:
+            density, velo_planes = self.free.get_nowait()
+        except queue.Empty:
+            # buffers are allocated up to depth, then the writer waits for one to be rendered
+            if self.allocated < self.depth:
+                self.allocated += 1
+                density, velo_planes = np.empty_like(fluid.density), np.empty_like(fluid.velo_planes)
+            else:
+                density, velo_planes = self.free.get()
+        if density.shape != fluid.density.shape or velo_planes.shape != fluid.velo_planes.shape:
+            density, velo_planes = np.empty_like(fluid.density), np.empty_like(fluid.velo_planes)
+        density[...] = fluid.density
+        velo_planes[...] = fluid.velo_planes
+        self.queued.put((density, velo_planes))
+
+    def _run(self):
+        """Renders and encodes the queued frames until close, a failure is raised again by write or close."""
+        while True:
+            frame = self.queued.get()
+            if frame is None: return
+            try:
+                if self.error is None: self.encoder.append_data(self.renderer.render(*frame))
+            except Exception as error:
+                self.error = error
+            self.free.put(frame)
+
+    def close(self):
+        """Waits for the queued frames to be encoded, then closes the encoder.
+        """
+        self.queued.put(None)
+        self.thread.join()
+        self.encoder.close()
+        if self.error is not None: raise self.error
@@ -0,0 +1,221 @@
+"""
+Result cache, keeps the trajectories and the outputs of the runs on disk, keyed by everything that decides them.
+
+The key of a run is the hash of its parsed scene, the parameters of its Fluid and the code of the simulation, but not
+its number of frames: an entry holds the trajectory of the longest run made so far and a checkpoint of its last frame,
+so a shorter run only reads the trajectory and a longer one continues from the checkpoint. Every output written is
+kept as well, repeating a run only copies it. The entries used the least recently are removed when the cache grows
+over its size.
+
+An entry is a folder named after its key:
+    entry.json: Frames of the trajectory, checkpoint of the last frame, outputs and time of the last use.
+    trajectory/: The density and the velocity of every frame, in the precision of the fields, see trajectory.py.
+    state_<frames>.fields, state_<frames>.json: The checkpoint, see checkpoint.py.
+    output_<key>.<extension>: The outputs, a key per number of frames and options.
+
+Usage:
+    python runner.py Config5 --frames 1000 --output Movies/Movie5.mp4 --cache .result_cache
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from checkpoint import solver_state
+
+CACHE_VERSION = 1
+# modules deciding the frames of a run, their code is part of the key
+SIMULATION_MODULES = ["boundaries.py", "fluid.py", "kernels.py", "solvers.py", "sources.py", "scene.py", "density.py", "velocity.py", "tiles.py"]
+
+def code_version():
+    """Hash of the code of the simulation and of the numpy it runs on.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256(np.__version__.encode())
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for name in SIMULATION_MODULES:
+        with open(os.path.join(folder, name), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def run_key(scene, fluid, **options):
+    """Key of the frames of a run, whatever its number of frames.
+
+    Args:
+        scene (Scene): The Scene of the run.
+        fluid (Fluid): The Fluid before its first step.
+        **options: Anything else that changes the frames, like the threads or the tiles.
+
+    Raises:
+        ValueError: If the Fluid has tracers, an entry only keeps the density and the velocity of the frames.
+
+    Returns:
+        str: The hex digest.
+    """
+    if fluid.scalars is not None or fluid.particles is not None:
+        raise ValueError("A Fluid with scalars or particles cannot be cached, the cache only keeps its density and velocity")
+    params = {
+        "version": CACHE_VERSION, "code": code_version(),
+        "size": fluid.size, "nx": fluid.nx, "ny": fluid.ny, "spacing": fluid.spacing,
+        "dt": fluid.dt, "iter": fluid.iter, "diff": fluid.diff, "visc": fluid.visc, "cfl": fluid.cfl, "max_substeps": fluid.max_substeps, "boundaries": fluid.boundaries.state(),
+        "solver": solver_state(fluid.solver), "backend": fluid.backend, "precision": fluid.precision, "options": options
+    }
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    # the rows of the scene, the colors only change the outputs
+    for table in [scene.densities, scene.velocities, scene.solids]:
+        digest.update(str(table.shape).encode())
+        digest.update(np.ascontiguousarray(table, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+def output_key(output: str, frames: int, **options):
+    """Name of an output in an entry, from its number of frames and the options it was written with.
+
+    Args:
+        output (str): The path of the output, only its extension is used.
+        frames (int): The number of frames of the output.
+        **options: The options of the writer, like its fps or its colormap.
+
+    Returns:
+        str: The name of the output in the entry.
+    """
+    digest = hashlib.sha256(json.dumps({"frames": frames, "options": options}, sort_keys=True).encode()).hexdigest()
+    return f"output_{digest[:16]}{os.path.splitext(output.rstrip('/'))[1]}"
+
+class Frame:
+    """A frame read back from a trajectory, with the fields of a Fluid the writers of the runner read.
+    """
+    def __init__(self, density, velo):
+        self.density = density
+        self.velo = velo
+
+    @property
+    def velo_planes(self):
+        """The velocity as component planes [y, x]."""
+        return np.moveaxis(self.velo, -1, 0)
+
+class ResultCache:
+    """Folder of entries, each one the trajectory, the checkpoint and the outputs of a run key.
+    """
+    def __init__(self, path=".result_cache", max_bytes=2 ** 30):
+        """Creates a ResultCache, the folder is created if needed.
+
+        Args:
+            path (str, optional): The folder of the cache. Defaults to ".result_cache".
+            max_bytes (int, optional): Size of the cache on disk, above which the entries used the least recently are removed. Defaults to 1 GiB.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, key: str, *names: str):
+        """Path of an entry, or of a file of the entry."""
+        return os.path.join(self.path, key, *names)
+
+    def open(self, key: str):
+        """Metadata of an entry, an empty entry if the key is not in the cache.
+        Nothing is written, the folder of a new entry is created by what stores into it.
+
+        Returns:
+            dict: frames, checkpoint (its path without extension, relative to the entry), outputs and used.
+        """
+        try:
+            with open(self.entry_path(key, "entry.json"), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"frames": 0, "checkpoint": "", "outputs": [], "used": 0.0}
+
+    def commit(self, key: str, entry: dict):
+        """Saves the metadata of an entry as the last one used, then removes the older checkpoints
+        and the entries over the size of the cache.
+
+        Args:
+            key (str): The key of the entry.
+            entry (dict): The metadata given by open, updated.
+        """
+        entry["used"] = time.time()
+        os.makedirs(self.entry_path(key), exist_ok=True)
+        # the metadata is replaced at once, an interrupted run leaves the entry as it was
+        temp = self.entry_path(key, "entry.json.tmp")
+        with open(temp, "w") as file:
+            json.dump(entry, file, indent=1)
+        os.replace(temp, self.entry_path(key, "entry.json"))
+
+        for name in os.listdir(self.entry_path(key)):
+            if name.startswith("state_") and os.path.splitext(name)[0] != entry["checkpoint"]:
+                os.remove(self.entry_path(key, name))
+        self.evict(key)
+
+    def store_output(self, key: str, entry: dict, output: str, name: str):
+        """Copies an output into an entry.
+
+        Args:
+            key (str): The key of the entry.
+            entry (dict): The metadata of the entry, name is added to its outputs.
+            output (str): The path of the output written.
+            name (str): The name of the output in the entry, see output_key.
+        """
+        target = self.entry_path(key, name)
+        temp = target + ".tmp"
+        os.makedirs(self.entry_path(key), exist_ok=True)
+        _copy(output, temp)
+        _remove(target)
+        os.replace(temp, target)
+        if name not in entry["outputs"]: entry["outputs"].append(name)
+
+    def fetch_output(self, key: str, entry: dict, name: str, output: str):
+        """Copies an output of an entry to a path.
+
+        Returns:
+            bool: False if the entry does not have the output.
+        """
+        source = self.entry_path(key, name)
+        if name not in entry["outputs"] or not os.path.exists(source): return False
+        directory = os.path.dirname(output)
+        if directory: os.makedirs(directory, exist_ok=True)
+        _remove(output)
+        _copy(source, output)
+        return True
+
+    def size(self, key: str):
+        """Bytes used by an entry on disk."""
+        total = 0
+        for folder, _, names in os.walk(self.entry_path(key)):
+            for name in names:
+                total += os.path.getsize(os.path.join(folder, name))
+        return total
+
+    def evict(self, keep=""):
+        """Removes the entries used the least recently until the cache fits in max_bytes.
+
+        Args:
+            keep (str, optional): Key of an entry never removed, the one in use. Defaults to "".
+        """
+        entries = []
+        for key in os.listdir(self.path):
+            if not os.path.isdir(self.entry_path(key)): continue
+            entries.append((self.open(key)["used"], key, self.size(key)))
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes: break
+            if key == keep: continue
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            total -= size
+
+def _copy(source: str, target: str):
+    """Copies a file, or a folder like a trajectory."""
+    if os.path.isdir(source):
+        shutil.copytree(source, target)
+    else:
+        shutil.copyfile(source, target)
+
+def _remove(path: str):
+    """Removes a file or a folder, if it exists."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,370 @@
+"""
+Headless batch runner, simulates a Config file without any display and streams every frame to the output.
+
+Usage:
+    python runner.py Config5 --frames 1000 --size 128 --output Movies/Movie5.mp4
+"""
+import argparse
+import os
+
+import numpy as np
+
+from assets import config_path
+from boundaries import parse_boundaries
+from fluid import Fluid
+from kernels import load_kernels
+from scene import load_scene
+from sources import Sources
+
+# the checkpoints, videos, result cache, trajectories and tiles are imported by the runs that use them
+
+class FrameWriter:
+    """Base class of the outputs of the runner, receives one frame at a time.
+    The base class discards the frames.
+    """
+    def write(self, fluid: Fluid):
+        """Writes the current frame of the Fluid.
+
+        Args:
+            fluid (Fluid): The Fluid after its step.
+        """
+
+    def flush(self):
+        """Writes the frames received so far to disk, before a checkpoint.
+        """
+
+    def close(self):
+        """Finishes the output.
+        """
+
+class VideoWriter(FrameWriter):
+    """Streams the frames rendered in RGB to an imageio encoder, see render.Renderer.
+    The frames are rendered and encoded by a pipeline thread while the Fluid computes the next ones.
+    Use a video format (mp4) for long runs, the gif encoder keeps its frames until closed.
+    """
+    def __init__(self, path: str, fps=30, renderer=None, depth=4):
+        """Creates a VideoWriter.
+
+        Args:
+            path (str): The path of the video, its extension selects the encoder.
+            fps (int, optional): Frames per second of the video. Defaults to 30.
+            renderer (Renderer, optional): The Renderer of the frames. Defaults to None.
+                None: The density in grey levels from 0 to 255, without velocity glyphs.
+            depth (int, optional): Frames waiting to be encoded at most. Defaults to 4.
+        """
+        import imageio
+        from render import Renderer, RenderPipeline
+        if renderer is None: renderer = Renderer(vmax=255)
+        self.pipeline = RenderPipeline(renderer, imageio.get_writer(path, fps=fps), depth)
+
+    def write(self, fluid: Fluid):
+        self.pipeline.write(fluid)
+
+    def close(self):
+        self.pipeline.close()
+
+class NpyWriter(FrameWriter):
+    """Streams the density as float32 frames to a npy file of shape (frames, size, size).
+    Only the header is written up front, every frame is appended to the file as it comes.
+    """
+    def __init__(self, path: str, frames: int, shape: tuple, keep=0):
+        """Creates a NpyWriter.
+
+        Args:
+            path (str): The path of the npy file.
+            frames (int): The number of frames that will be written, the frames kept included.
+            shape (tuple): The shape of a frame.
+            keep (int, optional): Frames of the existing file kept, the new frames are appended after them. Defaults to 0.
+
+        Raises:
+            ValueError: If the existing file has frames of another shape, or fewer frames than keep.
+        """
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False, "shape": (frames, *shape)}
+        if not keep:
+            self.file = open(path, "wb")
+            np.lib.format.write_array_header_1_0(self.file, header)
+            return
+
+        # the header gives the new number of frames, its length may change so the frames kept are copied after it
+        frame_bytes = int(np.prod(shape)) * 4
+        with open(path, "rb") as old:
+            np.lib.format.read_magic(old)
+            old_shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(old)
+            start = old.tell()
+            available = (os.path.getsize(path) - start) // frame_bytes
+            if tuple(old_shape[1:]) != tuple(shape) or dtype != np.float32 or available < keep:
+                raise ValueError(f"{path} does not hold {keep} frames of shape {tuple(shape)}, it can not be continued")
+            temp = path + ".tmp"
+            with open(temp, "wb") as new:
+                np.lib.format.write_array_header_1_0(new, header)
+                remaining = keep * frame_bytes
+                while remaining:
+                    block = old.read(min(remaining, 2 ** 24))
+                    new.write(block)
+                    remaining -= len(block)
+        os.replace(temp, path)
+        self.file = open(path, "ab")
+
+    def write(self, fluid: Fluid):
+        self.file.write(fluid.density.astype(np.float32).tobytes())
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def make_writer(output: str, frames: int, shape: tuple, fps=30, precision="float32", stride=1, renderer=None, keep=0):
+    """Creates the FrameWriter for an output path.
+
+    Args:
+        output (str): The path of the output, npy files get raw frames, traj folders a trajectory
+            with the velocity (see trajectory.py) and any other extension a video.
+            An empty string gives no output.
+        frames (int): The number of frames that will be written.
+        shape (tuple): The shape of a frame.
+        fps (int, optional): Frames per second of videos. Defaults to 30.
+        precision (str, optional): Precision of trajectories. Defaults to "float32".
+        stride (int, optional): Frames between two frames kept by trajectories. Defaults to 1.
+        renderer (Renderer, optional): The Renderer of videos. Defaults to None.
+            None: The density in grey levels, see VideoWriter.
+        keep (int, optional): Steps already written to the output, the new frames are appended after them. Defaults to 0.
+
+    Raises:
+        ValueError: If steps are kept and the output is a video, which can not be appended to.
+
+    Returns:
+        FrameWriter: The writer of the output.
+    """
+    if not output: return FrameWriter()
+    directory = os.path.dirname(output)
+    if directory: os.makedirs(directory, exist_ok=True)
+    if output.endswith(".npy"): return NpyWriter(output, keep + frames, shape, keep)
+    if output.endswith(".traj"):
+        from trajectory import TrajectoryWriter
+        # the frames of the steps kept, the first step and every stride-th after it
+        return TrajectoryWriter(output, precision, stride, keep=-(-keep // stride), steps=keep)
+    if keep: raise ValueError(f"A video can not be continued, resume {output} to a .npy or .traj output or start again")
+    return VideoWriter(output, fps, renderer)
+
+def run(config: str, frames: int, size=60, output="", solver=None, fps=30, checkpoint="", checkpoint_every=0, resume=False,
+        precision="float32", stride=1, backend="numpy", threads=1, dt=None, cfl=None, fluid_precision="float64", scale=1, quiver_step=4,
+        nx=None, ny=None, spacing=None, tile=0, cache="", cache_size=2 ** 30, boundaries=None):
+    """Runs a simulation without display, writing each frame as soon as it is computed.
+
+    Args:
+        config (str): The name of the file in Config folder, or its path.
+        frames (int): The number of steps to simulate.
+        size (int, optional): The size of the grid. Defaults to 60.
+        output (str, optional): The path of the output, see make_writer. Defaults to "".
+        solver (str, optional): The name of the solver of the Fluid. Defaults to None.
+        fps (int, optional): Frames per second of videos. Defaults to 30.
+        checkpoint (str, optional): The path of the checkpoint without extension. Defaults to "".
+        checkpoint_every (int, optional): Frames between checkpoints, 0 only saves at the end. Defaults to 0.
+        resume (bool, optional): Continues from the checkpoint if it exists, frames counts the whole run. Defaults to False.
+        precision (str, optional): Precision of trajectories. Defaults to "float32".
+        stride (int, optional): Frames between two frames kept by trajectories. Defaults to 1.
+        backend (str, optional): "numpy" or "numba" compiled kernels. Defaults to "numpy".
+        threads (int, optional): Threads running the kernels on bands of rows. Defaults to 1.
+        dt (float, optional): Simulated time per frame. Defaults to None.
+            None: The dt of the Fluid.
+        cfl (float, optional): Cells a backtrace may cross per substep, frames are then split in substeps as needed. Defaults to None.
+            None: A single step per frame.
+        fluid_precision (str, optional): Precision of the Fluid, "float64", "float32" or "mixed". Defaults to "float64".
+        scale (int, optional): Pixels per cell of videos. Defaults to 1.
+        quiver_step (int, optional): Cells between two velocity glyphs of videos. Defaults to 4.
+        nx (int, optional): Cells along x of a grid that is not square. Defaults to None.
+            None: size.
+        ny (int, optional): Cells along y of a grid that is not square. Defaults to None.
+            None: size.
+        spacing (tuple, optional): Width of the cells along y and x. Defaults to None.
+            None: Square cells, scaled by size.
+        tile (int, optional): Cells per side of the active tiles, the advection and the density diffusion skip the calm tiles. Defaults to 0.
+            0: The whole grid every step.
+        cache (str, optional): The folder of a ResultCache, see results.py. Defaults to "".
+            "": Every frame is simulated.
+        cache_size (int, optional): Bytes of the cache on disk at most. Defaults to 1 GiB.
+        boundaries (Boundaries, optional): The types of the edges of the grid, see boundaries.py. Defaults to None.
+            None: Reflective walls.
+
+    Raises:
+        ValueError: If a cache is given with a checkpoint, the cache keeps its own.
+
+    Returns:
+        Fluid: The Fluid at the end of the simulation.
+    """
+    if cache and checkpoint: raise ValueError("A cached run keeps its own checkpoint, give either a cache or a checkpoint")
+    start = 0
+    if resume and checkpoint and os.path.isfile(checkpoint + ".json"):
+        from checkpoint import load_checkpoint
+        fluid, densities, velocities, solids, start = load_checkpoint(checkpoint)
+        # the threads are not part of the checkpoint, they give the same frames
+        fluid.backend, fluid.kernels = load_kernels(fluid.backend, threads)
+        sources = Sources(densities, velocities)
+        scene = load_scene(config_path(config))
+    else:
+        fluid = Fluid(size, solver, backend, threads, fluid_precision, nx, ny, spacing)
+        if dt is not None: fluid.dt = dt
+        fluid.cfl = cfl
+        if boundaries is not None: fluid.boundaries = boundaries
+        # the scene is compiled for the size of the grid, or read from its cache
+        scene = load_scene(config_path(config), fluid.density.shape)
+        sources, solids = scene.apply(fluid)
+        densities, velocities = sources.densities, sources.velocities
+        sources.apply(fluid)
+
+    # the active tiles are found again every substep, a resumed run only needs the same tile size
+    if tile:
+        from tiles import ActiveTiles
+        fluid.tiles = ActiveTiles(tile)
+
+    # the Velocity objects are only brought up to date by sources.sync, before a checkpoint
+    checkpointer = None
+    if checkpoint:
+        from checkpoint import Checkpointer
+        checkpointer = Checkpointer(checkpoint)
+    # videos are drawn with the colors of the scene, like the display
+    renderer = None
+    if output and not output.endswith((".npy", ".traj")):
+        from render import Renderer
+        renderer = Renderer(scene.colormap, scene.qcolor, scale=scale, quiver_step=quiver_step)
+    if cache:
+        from results import ResultCache, output_key, run_key
+        # the threads give the same frames, only the tiles change them
+        key = run_key(scene, fluid, tile=tile)
+        name = output_key(output, frames, fps=fps, precision=precision, stride=stride, scale=scale, quiver_step=quiver_step,
+                          colormap=scene.colormap, qcolor=scene.qcolor) if output else ""
+        writer = lambda count: make_writer(output, count, fluid.density.shape, fps, precision, stride, renderer)
+        return _run_cached(ResultCache(cache, cache_size), key, fluid, sources, frames, output, name, writer, tile, threads)
+
+    # a resumed run appends to the frames written before its checkpoint
+    writer = make_writer(output, max(0, frames - start), fluid.density.shape, fps, precision, stride, renderer, keep=start)
+    try:
+        for frame in range(start, frames):
+            sources.apply(fluid)
+            fluid.step()
+            writer.write(fluid)
+            if checkpointer and checkpoint_every and (frame + 1) % checkpoint_every == 0:
+                sources.sync()
+                writer.flush()
+                checkpointer.save(fluid, densities, velocities, solids, frame + 1)
+    finally:
+        writer.close()
+    if checkpointer:
+        sources.sync()
+        checkpointer.save(fluid, densities, velocities, solids, max(start, frames))
+    return fluid
+
+def _run_cached(results, key: str, fluid: Fluid, sources: Sources, frames: int, output: str, name: str, writer, tile=0, threads=1):
+    """Runs a simulation through a ResultCache: the frames in the cache are read back, the others are simulated
+    from the checkpoint of the cache and added to it. An output already in the cache is only copied.
+
+    Args:
+        results (ResultCache): The cache.
+        key (str): The key of the run, see results.run_key.
+        fluid (Fluid): The Fluid before its first step.
+        sources (Sources): The densities and velocities of the run.
+        frames (int): The number of steps to simulate.
+        output (str): The path of the output, see make_writer.
+        name (str): The name of the output in the cache, see results.output_key.
+        writer (function): Creates the FrameWriter of the output from its number of frames.
+        tile (int, optional): Cells per side of the active tiles. Defaults to 0.
+        threads (int, optional): Threads running the kernels. Defaults to 1.
+
+    Returns:
+        Fluid: The Fluid at the end of the simulation.
+    """
+    from checkpoint import load_checkpoint, save_checkpoint
+    from results import Frame
+    from trajectory import TrajectoryReader, TrajectoryWriter
+
+    entry = results.open(key)
+    known = min(entry["frames"], frames)
+    trajectory = results.entry_path(key, "trajectory")
+    if known == frames and (not name or results.fetch_output(key, entry, name, output)):
+        _restore(fluid, trajectory, frames)
+        results.commit(key, entry)
+        return fluid
+
+    writer = writer(frames)
+    try:
+        if known:
+            for index, fields in TrajectoryReader(trajectory).frames(0, known):
+                writer.write(Frame(fields["density"], fields["velo"]))
+        if known < frames:
+            if known:
+                fluid, densities, velocities, solids, _ = load_checkpoint(results.entry_path(key, entry["checkpoint"]))
+                fluid.backend, fluid.kernels = load_kernels(fluid.backend, threads)
+                if tile:
+                    from tiles import ActiveTiles
+                    fluid.tiles = ActiveTiles(tile)
+                sources = Sources(densities, velocities)
+            # the trajectory keeps the fields in their own precision, every output can be written again from it
+            appender = TrajectoryWriter(trajectory, fluid.density.dtype.name, keep=known)
+            try:
+                for frame in range(known, frames):
+                    sources.apply(fluid)
+                    fluid.step()
+                    writer.write(fluid)
+                    appender.write(fluid)
+            finally:
+                appender.close()
+            sources.sync()
+            entry["checkpoint"] = f"state_{frames}"
+            save_checkpoint(results.entry_path(key, entry["checkpoint"]), fluid, sources.densities, sources.velocities, fluid.solid, frames)
+            entry["frames"] = frames
+        else:
+            _restore(fluid, trajectory, frames)
+    finally:
+        writer.close()
+    if name: results.store_output(key, entry, output, name)
+    results.commit(key, entry)
+    return fluid
+
+def _restore(fluid: Fluid, trajectory: str, frames: int):
+    """Gives a Fluid the density and the velocity of a frame of a trajectory, the Fluid after frames steps."""
+    if frames == 0: return
+    from trajectory import TrajectoryReader
+    fields = TrajectoryReader(trajectory)[frames - 1]
+    fluid.density[...] = fields["density"]
+    fluid.velo = fields["velo"]
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs a fluid simulation without display.")
+    parser.add_argument("config", help="name of the file in Config folder, or its path")
+    parser.add_argument("-f", "--frames", type=int, default=30, help="number of frames to simulate (default 30)")
+    parser.add_argument("-s", "--size", type=int, default=60, help="size of the grid (default 60)")
+    parser.add_argument("-o", "--output", default="", help="output path, .npy for raw frames, .traj for a trajectory or a video extension (default none)")
+    parser.add_argument("--solver", default=None, help="linear solver: jacobi, sor, multigrid or cg (default jacobi)")
+    parser.add_argument("--fps", type=int, default=30, help="frames per second of videos (default 30)")
+    parser.add_argument("--checkpoint", default="", help="path of the checkpoint without extension (default none)")
+    parser.add_argument("--checkpoint-every", type=int, default=0, help="frames between checkpoints (default only at the end)")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint if it exists")
+    parser.add_argument("--precision", default="float32", help="precision of trajectories: float64, float32 or float16 (default float32)")
+    parser.add_argument("--stride", type=int, default=1, help="frames between two frames kept by trajectories (default 1)")
+    parser.add_argument("--backend", default="numpy", help="numpy or numba compiled kernels (default numpy)")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="threads running the kernels on bands of rows (default 1)")
+    parser.add_argument("--dt", type=float, default=None, help="simulated time per frame (default 0.2)")
+    parser.add_argument("--fluid-precision", default="float64", help="precision of the simulation: float64, float32 or mixed, float32 with a float64 pressure solve (default float64)")
+    parser.add_argument("--cfl", type=float, default=None, help="cells a backtrace may cross per substep, enables adaptive substeps (default off)")
+    parser.add_argument("--scale", type=int, default=1, help="pixels per cell of videos (default 1)")
+    parser.add_argument("--quiver-step", type=int, default=4, help="cells between two velocity glyphs of videos (default 4)")
+    parser.add_argument("--nx", type=int, default=None, help="cells along x, for grids that are not square (default size)")
+    parser.add_argument("--ny", type=int, default=None, help="cells along y, for grids that are not square (default size)")
+    parser.add_argument("--spacing", type=float, nargs=2, default=None, metavar=("HY", "HX"), help="width of the cells along y and x (default square cells of 1 / (size - 2))")
+    parser.add_argument("--cache", default="", help="folder of a result cache, repeated runs are read from it and longer ones continue from it (default none)")
+    parser.add_argument("--cache-size", type=float, default=1024, help="size of the result cache in MiB (default 1024)")
+    parser.add_argument("--boundaries", nargs="*", default=None, metavar="EDGE=TYPE",
+                        help="types of the edges top, bottom, left and right: reflect, periodic, inflow:VY,VX or outflow (default reflect)")
+    parser.add_argument("--tile", type=int, default=0, help="cells per side of the active tiles, skips the advection of calm tiles (default off)")
+    args = parser.parse_args(args)
+
+    fluid = run(args.config, args.frames, size=args.size, output=args.output, solver=args.solver, fps=args.fps,
+                checkpoint=args.checkpoint, checkpoint_every=args.checkpoint_every, resume=args.resume, precision=args.precision,
+                stride=args.stride, backend=args.backend, threads=args.threads, dt=args.dt, cfl=args.cfl, fluid_precision=args.fluid_precision,
+                scale=args.scale, quiver_step=args.quiver_step, nx=args.nx, ny=args.ny, spacing=args.spacing, tile=args.tile,
+                cache=args.cache, cache_size=int(args.cache_size * 2 ** 20), boundaries=parse_boundaries(args.boundaries) if args.boundaries else None)
+    print(f"Density sum: {fluid.density.sum()}")
+
+if __name__ == "__main__":
+    main()
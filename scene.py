@@ -0,0 +1,368 @@
+"""
+Scenes, the densities, velocities and solids of a Config file held as integer arrays.
+
+The Config format is read strictly, every line must be one of:
+    colormap=<name>                  optional, at most once
+    quiver=<color>                   optional, at most once
+    density=<count>                  followed by count rows "pos_x, pos_y, size_x, size_y, density"
+    velocity=<count>                 followed by count rows "pos_x, pos_y, strength_x, strength_y, animation[, value]"
+    solid=<count>                    followed by count rows "pos_x, pos_y, size_x, size_y"
+Blank lines are ignored, anything else is an error that gives the file and line.
+
+Each section is parsed in bulk into an array. A compiled scene, its arrays and the solid and density tables
+of a grid size or shape (rows, columns), is cached in a .scene_cache folder next to the file, keyed by the
+hash of the file, so launching the same scene again skips the parsing and the compilation.
+"""
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from density import Density, Solid
+from velocity import Velocity, VelocityAnimation
+
+CACHE_FOLDER = ".scene_cache"
+CACHE_VERSION = 1
+
+# Columns of the rows of every section
+COLUMNS = {"density": 5, "velocity": 6, "solid": 4}
+HEADER = re.compile(r"^(colormap|quiver|density|velocity|solid)=(.*)$")
+
+class Scene:
+    """Densities, velocities and solids of a simulation as integer arrays, one row per object.
+    """
+    def __init__(self, colormap="", qcolor="", densities=None, velocities=None, solids=None):
+        """Creates a Scene.
+
+        Args:
+            colormap (str, optional): Name of the Colormap written. Defaults to "".
+            qcolor (str, optional): Name of the Quiver Color written. Defaults to "".
+            densities (np.ndarray, optional): Rows pos_x, pos_y, size_x, size_y, density. Defaults to None.
+            velocities (np.ndarray, optional): Rows pos_x, pos_y, strength_x, strength_y, animation, value. Defaults to None.
+            solids (np.ndarray, optional): Rows pos_x, pos_y, size_x, size_y. Defaults to None.
+        """
+        self.colormap = colormap
+        self.qcolor = qcolor
+        self.densities = _table(densities, "density")
+        self.velocities = _table(velocities, "velocity")
+        self.solids = _table(solids, "solid")
+        self.compiled = {}
+
+    def objects(self):
+        """Density, Velocity and Solid objects of the Scene.
+
+        Returns:
+            [list, list, list]
+                list: List of Density objects.
+                list: List of Velocity objects.
+                list: List of Solid objects.
+        """
+        densities = [Density(*row) for row in self.densities.tolist()]
+        velocities = [Velocity(*row[:4], VelocityAnimation(row[4]), row[5]) for row in self.velocities.tolist()]
+        solids = [Solid(*row) for row in self.solids.tolist()]
+        return densities, velocities, solids
+
+    def velocity_state(self):
+        """State of every Velocity before its first step, packed like in Sources.
+
+        Returns:
+            dict: Array of every key of Velocity.get_state.
+        """
+        pos_x, pos_y, strength_x, strength_y, animation, value = self.velocities.T
+        rotating = np.isin(animation, [int(VelocityAnimation.ROTATE_CW), int(VelocityAnimation.ROTATE_CCW)])
+        returning = np.isin(animation, [int(VelocityAnimation.RETURN_X), int(VelocityAnimation.RETURN_Y)])
+        return {
+            "pos_x": pos_x.copy(), "pos_y": pos_y.copy(),
+            "strength_x": strength_x.astype(float), "strength_y": strength_y.astype(float),
+            "animation": animation.copy(), "rotation": np.where(rotating, value, 0), "length": np.where(returning, value, 0),
+            "dir_x": strength_x.astype(float), "dir_y": strength_y.astype(float),
+            "current_rot": np.zeros(len(animation)), "current_length": np.zeros(len(animation), dtype=np.int64),
+            "step": np.ones(len(animation), dtype=np.int64)
+        }
+
+    def extent(self):
+        """Rows and columns a grid needs to hold every object of the Scene, with the edges of the grid outside of them.
+        A returning Velocity moves up to its value on both sides of its position.
+
+        Returns:
+            tuple: The smallest shape (rows, columns) of the grid.
+        """
+        pos_x, pos_y, _, _, animation, value = self.velocities.T
+        reach_x = np.where(animation == int(VelocityAnimation.RETURN_X), value, 0)
+        reach_y = np.where(animation == int(VelocityAnimation.RETURN_Y), value, 0)
+        rows = [self.densities[:, 1] + self.densities[:, 3], pos_y + reach_y + 1, self.solids[:, 1] + self.solids[:, 3]]
+        cols = [self.densities[:, 0] + self.densities[:, 2], pos_x + reach_x + 1, self.solids[:, 0] + self.solids[:, 2]]
+        # the last row and column of a grid are its edges
+        return (int(np.concatenate(rows + [[0]]).max()) + 1, int(np.concatenate(cols + [[0]]).max()) + 1)
+
+    def compile(self, size):
+        """Solid and density tables of the Scene on a grid, computed once per shape.
+
+        Args:
+            size (int or tuple): The size of a square grid, or its shape (rows, columns).
+
+        Returns:
+            dict: solid_mask, solid_faces and solid_cells as made by compile_solids,
+                density_cells and density_values the flat cells covered by the densities and their values.
+        """
+        shape = grid_shape(size)
+        if shape not in self.compiled:
+            mask, faces, cells = compile_solids(self.solids, shape)
+            density_cells, density_values = compile_densities(self.densities, shape)
+            self.compiled[shape] = {"solid_mask": mask, "solid_faces": faces, "solid_cells": cells,
+                                    "density_cells": density_cells, "density_values": density_values}
+        return self.compiled[shape]
+
+    def apply(self, fluid):
+        """Gives the solids of the Scene to a Fluid and creates the Sources of the Scene, without compiling them again.
+
+        Args:
+            fluid (Fluid): The Fluid of the simulation.
+
+        Returns:
+            [Sources, list]
+                Sources: The densities and velocities of the Scene.
+                list: List of Solid objects, set on the Fluid.
+        """
+        from sources import Sources
+
+        tables = self.compile(fluid.density.shape[-2:])
+        densities, velocities, solids = self.objects()
+        fluid.set_solids(solids, (tables["solid_mask"], tables["solid_faces"], tables["solid_cells"]))
+
+        sources = Sources(densities, velocities, self.velocity_state())
+        sources.density_cells[fluid.density.shape] = (tables["density_cells"], tables["density_values"])
+        return sources, solids
+
+def grid_shape(size):
+    """Shape (rows, columns) of a grid from its size, or its shape unchanged."""
+    if np.ndim(size) == 0: return (int(size), int(size))
+    rows, cols = size
+    return (int(rows), int(cols))
+
+def _table(rows, section: str):
+    """Integer array of the rows of a section, empty if there are none."""
+    if rows is None: rows = []
+    return np.asarray(rows, dtype=np.int64).reshape(-1, COLUMNS[section])
+
+def parse_scene(text: str, name="<scene>"):
+    """Parses the text of a Config file.
+
+    Args:
+        text (str): The content of the file.
+        name (str, optional): Name of the file in the error messages. Defaults to "<scene>".
+
+    Raises:
+        ValueError: If a line does not follow the format.
+
+    Returns:
+        Scene: The Scene of the file.
+    """
+    lines = text.split("\n")
+    values = {}
+    sections = {}
+    number = 0
+    while number < len(lines):
+        line = lines[number].strip()
+        number += 1
+        if not line: continue
+        match = HEADER.match(line)
+        if match is None: raise ValueError(f"{name}:{number}: expected a header, got {line!r}")
+        key, value = match.groups()
+        if key in values or key in sections: raise ValueError(f"{name}:{number}: {key} given twice")
+        if key in ["colormap", "quiver"]:
+            values[key] = value.strip()
+            continue
+
+        if not value.strip().isdigit(): raise ValueError(f"{name}:{number}: {key} count must be an integer, got {value!r}")
+        count = int(value)
+        rows = []
+        numbers = []
+        while len(rows) < count and number < len(lines):
+            if lines[number].strip():
+                rows.append(lines[number])
+                numbers.append(number + 1)
+            number += 1
+        if len(rows) < count: raise ValueError(f"{name}:{number}: {key} expects {count} rows, the file ends after {len(rows)}")
+        sections[key] = _parse_rows(rows, key, name, numbers)
+
+    return Scene(values.get("colormap", ""), values.get("quiver", ""), sections.get("density"), sections.get("velocity"), sections.get("solid"))
+
+def _parse_rows(rows: list, section: str, name: str, numbers: list):
+    """Parses all the rows of a section at once, numbers are their lines in the file."""
+    if not rows: return _table(None, section)
+    columns = COLUMNS[section]
+    if section == "velocity":
+        # the animation value is optional
+        rows = [row if row.count(",") == columns - 1 else row + ", 0" for row in rows]
+    try:
+        table = np.loadtxt(rows, delimiter=",", dtype=np.int64, ndmin=2)
+    except ValueError as error:
+        raise ValueError(f"{name}:{numbers[0]}: invalid {section} rows, {error}") from None
+    if table.shape[1] != columns: raise ValueError(f"{name}:{numbers[0]}: {section} rows must have {columns} values")
+
+    # positions are never negative, densities and solids have a size, velocities a known animation
+    bad = (table[:, :2] < 0).any(axis=1)
+    if section == "velocity":
+        bad |= ~np.isin(table[:, 4], [int(animation) for animation in VelocityAnimation])
+    else:
+        bad |= (table[:, 2:4] <= 0).any(axis=1)
+    if bad.any():
+        row = int(np.argmax(bad))
+        raise ValueError(f"{name}:{numbers[row]}: invalid {section} {rows[row].strip()!r}")
+    return table
+
+def compile_solids(solids, size):
+    """Mask of the cells covered by solids and index tables of their faces, see Fluid.set_solids.
+    Built with difference arrays, whatever the number of solids.
+
+    Args:
+        solids (np.ndarray): Rows pos_x, pos_y, size_x, size_y.
+        size (int or tuple): The size of a square grid, or its shape (rows, columns).
+
+    Returns:
+        [np.ndarray, list, tuple]
+            np.ndarray: Mask of the cells covered by the solids.
+            list: Indices of the faces that invert the y and the x vector.
+            tuple: Indices of the cells covered by the solids.
+    """
+    solids = _table(solids, "solid")
+    rows, cols = grid_shape(size)
+    x0, y0 = np.minimum(solids[:, 0], cols), np.minimum(solids[:, 1], rows)
+    x1, y1 = np.minimum(solids[:, 0] + solids[:, 2], cols), np.minimum(solids[:, 1] + solids[:, 3], rows)
+
+    # Each solid adds 1 over its rectangle, the cumulative sums of the corners
+    cover = np.zeros((rows + 1, cols + 1), dtype=np.int64)
+    np.add.at(cover, (y0, x0), 1)
+    np.add.at(cover, (y0, x1), -1)
+    np.add.at(cover, (y1, x0), -1)
+    np.add.at(cover, (y1, x1), 1)
+    mask = cover.cumsum(axis=0).cumsum(axis=1)[:rows, :cols] > 0
+
+    # Number of times each cell is inverted per vector, a face shared by two solids cancels out
+    # vertical faces invert the x vector, horizontal faces the y vector
+    vertical = np.zeros((rows + 1, cols + 1), dtype=np.int64)
+    for x in [x0, x1]:
+        np.add.at(vertical, (y0, x), 1)
+        np.add.at(vertical, (y1, x), -1)
+    horizontal = np.zeros((rows + 1, cols + 1), dtype=np.int64)
+    for y in [y0, y1]:
+        np.add.at(horizontal, (y, x0), 1)
+        np.add.at(horizontal, (y, x1), -1)
+    flips_y = horizontal.cumsum(axis=1)[:rows, :cols] % 2 == 1
+    flips_x = vertical.cumsum(axis=0)[:rows, :cols] % 2 == 1
+    return mask, [np.nonzero(flips_y), np.nonzero(flips_x)], np.nonzero(mask)
+
+def compile_densities(densities, size):
+    """Flat cells covered by densities on a grid and their values, the last density wins where they overlap.
+
+    Args:
+        densities (np.ndarray): Rows pos_x, pos_y, size_x, size_y, density.
+        size (int or tuple): The size of a square grid, or its shape (rows, columns).
+
+    Returns:
+        [np.ndarray, np.ndarray]
+            np.ndarray: Flat indices of the cells.
+            np.ndarray: Value of every cell.
+    """
+    densities = _table(densities, "density")
+    n_rows, n_cols = grid_shape(size)
+    x0, y0 = np.minimum(densities[:, 0], n_cols), np.minimum(densities[:, 1], n_rows)
+    x1, y1 = np.minimum(densities[:, 0] + densities[:, 2], n_cols), np.minimum(densities[:, 1] + densities[:, 3], n_rows)
+    width, height = x1 - x0, y1 - y0
+    counts = width * height
+
+    # Position of every cell inside its rectangle, then its row and column on the grid
+    owner = np.repeat(np.arange(len(densities)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = y0[owner] + offset // np.maximum(width[owner], 1)
+    cols = x0[owner] + offset % np.maximum(width[owner], 1)
+    cells = rows * n_cols + cols
+
+    cells, last = np.unique(cells[::-1], return_index=True)
+    return cells, densities[owner, 4][::-1][last].astype(float)
+
+def file_hash(path: str):
+    """SHA-256 of the content of a file."""
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def load_scene(path: str, size=None, cache=True):
+    """Loads the Scene of a Config file, from the cache when the file did not change.
+
+    Args:
+        path (str): The path of the file.
+        size (int or tuple, optional): Size of the grid the Scene is compiled for, or its shape (rows, columns). Defaults to None.
+            None: The Scene is not compiled.
+        cache (bool, optional): Reads and writes the cache. Defaults to True.
+
+    Raises:
+        ValueError: If the file does not follow the format.
+
+    Returns:
+        Scene: The Scene of the file.
+    """
+    if not cache:
+        with open(path, "r") as file:
+            scene = parse_scene(file.read(), path)
+        if size is not None: scene.compile(size)
+        return scene
+
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_FOLDER)
+    key = file_hash(path)
+    scene_file = os.path.join(folder, f"{key}.npz")
+    if size is not None:
+        shape = grid_shape(size)
+        # square grids keep the name of their size
+        compiled_file = os.path.join(folder, f"{key}_{shape[0]}.npz" if shape[0] == shape[1] else f"{key}_{shape[0]}x{shape[1]}.npz")
+
+    scene = _read_scene(scene_file)
+    if scene is None:
+        with open(path, "r") as file:
+            scene = parse_scene(file.read(), path)
+        os.makedirs(folder, exist_ok=True)
+        _write_cache(scene_file, version=CACHE_VERSION, colormap=scene.colormap, qcolor=scene.qcolor,
+                     densities=scene.densities, velocities=scene.velocities, solids=scene.solids)
+
+    if size is not None:
+        tables = _read_compiled(compiled_file)
+        if tables is not None:
+            scene.compiled[shape] = tables
+        else:
+            tables = scene.compile(size)
+            os.makedirs(folder, exist_ok=True)
+            _write_cache(compiled_file, version=CACHE_VERSION, solid_mask=tables["solid_mask"],
+                         faces_y_rows=tables["solid_faces"][0][0], faces_y_cols=tables["solid_faces"][0][1],
+                         faces_x_rows=tables["solid_faces"][1][0], faces_x_cols=tables["solid_faces"][1][1],
+                         density_cells=tables["density_cells"], density_values=tables["density_values"])
+    return scene
+
+def _read_scene(path: str):
+    """Scene from a cache file, None if it is missing, broken or from another version."""
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != CACHE_VERSION: return None
+            return Scene(str(data["colormap"]), str(data["qcolor"]), data["densities"], data["velocities"], data["solids"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _read_compiled(path: str):
+    """Tables of a compiled Scene from a cache file, None if it is missing, broken or from another version."""
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != CACHE_VERSION: return None
+            mask = data["solid_mask"]
+            return {
+                "solid_mask": mask, "solid_cells": np.nonzero(mask),
+                "solid_faces": [(data["faces_y_rows"], data["faces_y_cols"]), (data["faces_x_rows"], data["faces_x_cols"])],
+                "density_cells": data["density_cells"], "density_values": data["density_values"]
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _write_cache(path: str, **arrays):
+    """Writes a cache file at once, a crash never leaves a partial file."""
+    temp = f"{path}.{os.getpid()}.tmp.npz"  # several processes may write the same scene
+    np.savez(temp, **arrays)
+    os.replace(temp, path)
@@ -0,0 +1,357 @@
+"""
+Streaming server, runs a simulation in a worker thread and publishes its frames to asyncio subscribers over a local socket.
+
+Every message, both ways, is an 8 bytes prefix (length of the header, length of the payload, big endian uint32),
+a JSON header and a payload:
+    frame: {"type": "frame", "step", "shape", "vmax", "vscale", "delta", "dropped"}, the payload is the zlib compressed
+        codes (3, rows, cols) uint8: the density quantized over [0, vmax], then the velocity components [y, x] as int8
+        of vscale / 127. A delta frame holds the difference of the codes with the previous frame sent, modulo 256.
+    reply: {"type": "ack"} or {"type": "error", "message"} to every command.
+    command: {"op": "add" | "set" | "remove", "section": "density" | "velocity" | "solid", "index", "row"}, no payload,
+        row is a row of that section in the Config format, see scene.py. Commands are applied between two steps.
+
+A subscriber only ever holds the latest frame: while it is still sending a frame the newer ones replace each other,
+so a slow client skips frames (counted in dropped) and the simulation never waits for anyone.
+
+Usage:
+    python server.py Config5 --size 128 --port 8765 --downsample 2
+"""
+import argparse
+import asyncio
+import json
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from assets import config_path
+from fluid import Fluid
+from scene import load_scene, parse_scene
+
+PREFIX = struct.Struct("!II")
+SECTIONS = ["density", "velocity", "solid"]
+
+async def read_message(reader: asyncio.StreamReader):
+    """Reads a message.
+
+    Args:
+        reader (asyncio.StreamReader): The stream of the socket.
+
+    Returns:
+        [dict, bytes]
+            dict: The header.
+            bytes: The payload.
+    """
+    header_length, payload_length = PREFIX.unpack(await reader.readexactly(PREFIX.size))
+    header = json.loads(await reader.readexactly(header_length))
+    payload = await reader.readexactly(payload_length) if payload_length else b""
+    return header, payload
+
+def pack_message(header: dict, payload=b""):
+    """Bytes of a message, see read_message."""
+    header = json.dumps(header).encode()
+    return PREFIX.pack(len(header), len(payload)) + header + payload
+
+def downsample(table, factor: int):
+    """Mean of every block of factor x factor cells, the last rows and columns that do not fill a block are dropped."""
+    if factor == 1: return table
+    rows, cols = table.shape[-2] // factor, table.shape[-1] // factor
+    blocks = table[..., :rows * factor, :cols * factor].reshape(table.shape[:-2] + (rows, factor, cols, factor))
+    return blocks.mean(axis=(-3, -1))
+
+def quantize(density, velo_planes, vmax=100.0, factor=1):
+    """Codes of a frame, see the module.
+
+    Args:
+        density (np.ndarray): The density of the Fluid.
+        velo_planes (np.ndarray): The velocity of the Fluid as component planes [y, x].
+        vmax (float, optional): Density coded 255. Defaults to 100.0.
+        factor (int, optional): Cells per side of the blocks averaged into one value. Defaults to 1.
+
+    Returns:
+        [np.ndarray, float]
+            np.ndarray: The codes, of shape (3, rows, cols) and dtype uint8.
+            float: vscale, the largest velocity component, coded 127.
+    """
+    density = downsample(density, factor)
+    velo = downsample(velo_planes, factor)
+    vscale = float(np.abs(velo).max()) or 1.0
+    codes = np.empty((3,) + density.shape, dtype=np.uint8)
+    codes[0] = np.rint(np.clip(density * (255 / vmax), 0, 255))
+    codes[1:] = np.rint(velo * (127 / vscale)).astype(np.int8).view(np.uint8)
+    return codes, vscale
+
+class FrameDecoder:
+    """Decodes the frames received by a client, it keeps the codes of the last frame for the deltas.
+    """
+    def __init__(self):
+        self.codes = None
+
+    def decode(self, header: dict, payload: bytes):
+        """Decodes a frame.
+
+        Args:
+            header (dict): The header of the frame.
+            payload (bytes): The payload of the frame.
+
+        Returns:
+            [np.ndarray, np.ndarray]
+                np.ndarray: The density, of shape (rows, cols).
+                np.ndarray: The velocity as component planes [y, x], of shape (2, rows, cols).
+        """
+        codes = np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape((3,) + tuple(header["shape"]))
+        if header["delta"]:
+            if self.codes is None: raise ValueError("Delta frame received before any key frame")
+            codes = codes + self.codes
+        self.codes = codes
+        density = codes[0] * (header["vmax"] / 255)
+        velo_planes = codes[1:].view(np.int8) * (header["vscale"] / 127)
+        return density, velo_planes
+
+class Subscriber:
+    """A client of the server, its latest frame and the codes of the last frame it was sent.
+    """
+    def __init__(self, writer: asyncio.StreamWriter, keyframe_every=30):
+        """Creates a Subscriber.
+
+        Args:
+            writer (asyncio.StreamWriter): The stream of the socket.
+            keyframe_every (int, optional): Frames sent between two key frames, the others are deltas. Defaults to 30.
+        """
+        self.writer = writer
+        self.keyframe_every = keyframe_every
+        self.frame = None  # latest frame not sent yet
+        self.ready = asyncio.Event()
+        self.codes = None
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, frame):
+        """Gives a frame to the Subscriber, replacing the one it did not send yet."""
+        if self.frame is not None: self.dropped += 1
+        self.frame = frame
+        self.ready.set()
+
+    def reply(self, header: dict):
+        """Sends a reply to a command, replies are small enough to skip the backpressure."""
+        if not self.writer.is_closing(): self.writer.write(pack_message(header))
+
+    async def send_frames(self):
+        """Sends the latest frame whenever there is one, until the connection is lost."""
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            step, codes, header = self.frame
+            self.frame = None
+
+            delta = self.codes is not None and self.sent % self.keyframe_every != 0 and self.codes.shape == codes.shape
+            data = codes - self.codes if delta else codes
+            self.codes = codes
+            self.sent += 1
+            self.writer.write(pack_message(dict(header, step=step, delta=delta, dropped=self.dropped), zlib.compress(data.tobytes(), 1)))
+            # only this subscriber waits for its socket, the others keep receiving their frames
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                return
+
+class SimulationServer:
+    """Steps a Fluid in a worker thread and publishes its frames to the connected Subscribers.
+    Commands of the clients change the sources and the solids between two steps.
+    """
+    def __init__(self, fluid: Fluid, sources, solids: list, factor=1, vmax=100.0, keyframe_every=30, fps=None):
+        """Creates a SimulationServer.
+
+        Args:
+            fluid (Fluid): The Fluid of the simulation.
+            sources (Sources): The densities and velocities of the simulation.
+            solids (list): List of Solid objects, set on the Fluid.
+            factor (int, optional): Cells per side of the blocks averaged into one value of the frames. Defaults to 1.
+            vmax (float, optional): Density of the top of the quantization. Defaults to 100.0.
+            keyframe_every (int, optional): Frames sent to a subscriber between two key frames. Defaults to 30.
+            fps (float, optional): Steps per second at most. Defaults to None.
+                None: As fast as the Fluid steps.
+        """
+        self.fluid = fluid
+        self.sources = sources
+        self.solids = list(solids)
+        self.factor = factor
+        self.vmax = vmax
+        self.keyframe_every = keyframe_every
+        self.fps = fps
+
+        self.steps = 0
+        self.subscribers = set()
+        self.commands = queue.Queue()
+        self.stopping = threading.Event()
+        self.loop = None
+        self.server = None
+        self.error = None
+
+    async def serve(self, host="127.0.0.1", port=8765, path="", frames=None):
+        """Runs the simulation and the server until frames are simulated or stop is called.
+
+        Args:
+            host (str, optional): The address of the server. Defaults to "127.0.0.1".
+            port (int, optional): The port of the server. Defaults to 8765.
+            path (str, optional): The path of a unix socket, used instead of host and port. Defaults to "".
+            frames (int, optional): The number of steps to simulate. Defaults to None.
+                None: Until stop.
+        """
+        self.loop = asyncio.get_running_loop()
+        if path:
+            self.server = await asyncio.start_unix_server(self._connect, path)
+        else:
+            self.server = await asyncio.start_server(self._connect, host, port)
+        try:
+            await self.loop.run_in_executor(None, self._simulate, frames)
+        finally:
+            self.stop()
+            self.server.close()
+            for subscriber in list(self.subscribers):
+                subscriber.writer.close()
+            await self.server.wait_closed()
+        if self.error is not None: raise self.error
+
+    def stop(self):
+        """Stops the simulation after its current step, from any thread.
+        """
+        self.stopping.set()
+
+    def _simulate(self, frames):
+        """Steps the Fluid and publishes every frame, in the worker thread."""
+        try:
+            while not self.stopping.is_set() and (frames is None or self.steps < frames):
+                start = time.perf_counter()
+                self._apply_commands()
+                self.sources.apply(self.fluid)
+                self.fluid.step()
+                self.steps += 1
+
+                codes, vscale = quantize(self.fluid.density, self.fluid.velo_planes, self.vmax, self.factor)
+                header = {"type": "frame", "shape": list(codes.shape[1:]), "vmax": self.vmax, "vscale": vscale}
+                self.loop.call_soon_threadsafe(self._publish, (self.steps, codes, header))
+
+                if self.fps: time.sleep(max(0.0, 1 / self.fps - (time.perf_counter() - start)))
+        except Exception as error:
+            self.error = error
+
+    def _publish(self, frame):
+        """Offers a frame to every Subscriber, in the event loop."""
+        for subscriber in self.subscribers:
+            subscriber.offer(frame)
+
+    async def _connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves a client, its frames are sent by a task while its commands are read."""
+        subscriber = Subscriber(writer, self.keyframe_every)
+        self.subscribers.add(subscriber)
+        sender = asyncio.create_task(subscriber.send_frames())
+        try:
+            while True:
+                try:
+                    header, _ = await read_message(reader)
+                    self.commands.put((subscriber, _parse_command(header)))
+                except ValueError as error:  # a header that is not JSON as well
+                    subscriber.reply({"type": "error", "message": str(error)})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            sender.cancel()
+            writer.close()
+
+    def _apply_commands(self):
+        """Applies the commands received since the last step, in the worker thread."""
+        while True:
+            try:
+                subscriber, (op, section, index, obj, extent) = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._apply(op, section, index, obj, extent)
+                reply = {"type": "ack"}
+            except IndexError:
+                reply = {"type": "error", "message": f"No {section} {index}"}
+            except ValueError as error:
+                reply = {"type": "error", "message": str(error)}
+            self.loop.call_soon_threadsafe(subscriber.reply, reply)
+
+    def _apply(self, op: str, section: str, index: int, obj, extent=(0, 0)):
+        """Adds, replaces or removes a Density, Velocity or Solid.
+
+        Raises:
+            IndexError: If there is no object at index.
+            ValueError: If the new object does not fit in the grid, its extent is given by Scene.extent.
+        """
+        rows, cols = self.fluid.density.shape
+        if extent[0] > rows or extent[1] > cols:
+            raise ValueError(f"The {section} needs a grid of {extent[0]} x {extent[1]} cells, the grid has {rows} x {cols}")
+        # the animations of the velocities go back into the objects before the lists change
+        self.sources.sync()
+        objects = {"density": self.sources.densities, "velocity": self.sources.velocities, "solid": self.solids}[section]
+        if op == "add":
+            objects.append(obj)
+        elif op == "set":
+            objects[index] = obj
+        else:
+            del objects[index]
+
+        if section == "solid":
+            self.fluid.set_solids(self.solids)
+        else:
+            self.sources.pack()
+
+def _parse_command(header: dict):
+    """Checks a command and creates its object.
+
+    Raises:
+        ValueError: If the command is malformed.
+
+    Returns:
+        tuple: op, section, index, the new object, or None, and the smallest shape of a grid holding it, see Scene.extent.
+    """
+    if not isinstance(header, dict): raise ValueError("A command is a JSON object")
+    op = header.get("op")
+    section = header.get("section")
+    if op not in ["add", "set", "remove"]: raise ValueError(f"Unknown op {op!r}, expected add, set or remove")
+    if section not in SECTIONS: raise ValueError(f"Unknown section {section!r}, expected one of {', '.join(SECTIONS)}")
+    index = header.get("index")
+    if op != "add" and (not isinstance(index, int) or index < 0): raise ValueError(f"{op} needs the index of the {section}")
+
+    obj = None
+    extent = (0, 0)
+    if op != "remove":
+        # a one row scene, parsed as strictly as a Config file
+        scene = parse_scene(f"{section}=1\n{header.get('row', '')}", "<command>")
+        obj = [objects[0] for objects in scene.objects() if objects][0]
+        extent = scene.extent()
+    return op, section, index, obj, extent
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs a fluid simulation and streams its frames to the connected clients.")
+    parser.add_argument("config", help="name of the file in Config folder, or its path")
+    parser.add_argument("-s", "--size", type=int, default=60, help="size of the grid (default 60)")
+    parser.add_argument("-f", "--frames", type=int, default=None, help="number of frames to simulate (default until interrupted)")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the server (default 127.0.0.1)")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="port of the server (default 8765)")
+    parser.add_argument("--unix", default="", help="path of a unix socket, instead of the host and the port (default none)")
+    parser.add_argument("--downsample", type=int, default=1, help="cells per side of the blocks averaged into one value of the frames (default 1)")
+    parser.add_argument("--vmax", type=float, default=100.0, help="density of the top of the quantization (default 100)")
+    parser.add_argument("--keyframe-every", type=int, default=30, help="frames sent between two key frames (default 30)")
+    parser.add_argument("--fps", type=float, default=None, help="steps per second at most (default as fast as possible)")
+    parser.add_argument("--solver", default=None, help="linear solver: jacobi, sor, multigrid or cg (default jacobi)")
+    args = parser.parse_args(args)
+
+    fluid = Fluid(args.size, args.solver)
+    sources, solids = load_scene(config_path(args.config), fluid.density.shape).apply(fluid)
+    server = SimulationServer(fluid, sources, solids, args.downsample, args.vmax, args.keyframe_every, args.fps)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix, args.frames))
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
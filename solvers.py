@@ -0,0 +1,394 @@
+"""
+Linear solvers for the diffusion and pressure equations of the Fluid.
+
+Every solver works on the system used by Fluid.lin_solve:
+    c * x[i, j] - a * (x[i + 1, j] + x[i - 1, j] + x[i, j + 1] + x[i, j - 1]) = x0[i, j]
+over the interior of the grid, taking the edges of x as fixed boundary values.
+On cells that are not square, a is a pair (a_y, a_x) weighting the neighbours along each axis, which only
+the Jacobi solver supports. So are edges other than reflective walls: the Jacobi solver applies the boundaries
+between its sweeps, the others only once the system is solved.
+"""
+import abc
+
+import numpy as np
+
+class Solver(abc.ABC):
+    """Base class of the linear solvers used by a Fluid, every solver implements _solve.
+    """
+    def __init__(self, tol=None, max_iter=None):
+        """Creates a Solver.
+
+        Args:
+            tol (float, optional): Relative residual at which the solver stops. Defaults to None.
+                None: Always runs max_iter iterations.
+            max_iter (int, optional): Maximum number of iterations. Defaults to None.
+                None: Uses the iter value of the Fluid.
+        """
+        self.tol = tol
+        self.max_iter = max_iter
+        self.iterations = 0
+        self.residual = 0.0
+
+    def solve(self, fluid, x, x0, a, c):
+        """Solves the system in place of x and applies the boundaries of the Fluid.
+
+        Args:
+            fluid (Fluid): The Fluid that owns the arrays.
+            x (np.ndarray): The unknown, its edges are the boundary values.
+            x0 (np.ndarray): The right hand side.
+            a (float or tuple): Weight of the neighbors, or their weights along y and x.
+            c (float): Weight of the cell.
+
+        Raises:
+            ValueError: If the Fluid needs the Jacobi solver, see check.
+
+        Returns:
+            int: Iterations used.
+        """
+        self.check(fluid, a)
+        max_iter = self.max_iter if self.max_iter is not None else fluid.iter
+        self.iterations = 0
+        self.residual = 0.0
+        if x.ndim > 2:  # 3d velocity vector array, solved by component
+            for k in range(x.shape[2]):
+                iterations, residual = self._solve(x[:, :, k], x0[:, :, k], a, c, max_iter)
+                self.iterations = max(self.iterations, iterations)
+                self.residual = max(self.residual, residual)
+        else:
+            self.iterations, self.residual = self._solve(x, x0, a, c, max_iter)
+        fluid.set_boundaries(x)
+        return self.iterations
+
+    def check(self, fluid, a):
+        """Checks that the solver can hold the edges of x fixed during the solve.
+
+        Args:
+            fluid (Fluid): The Fluid that owns the arrays.
+            a (float or tuple): Weight of the neighbors, or their weights along y and x.
+
+        Raises:
+            ValueError: If the weights are a pair, the solver needs square cells.
+            ValueError: If the edges of the Fluid are not all reflective walls, the solver would not apply them.
+        """
+        if isinstance(a, tuple):
+            raise ValueError(f"{type(self).__name__} needs square cells, use the jacobi solver")
+        if not fluid.boundaries.is_reflect():
+            raise ValueError(f"{type(self).__name__} holds the edges fixed, use the jacobi solver with periodic, inflow or outflow boundaries")
+
+    @abc.abstractmethod
+    def _solve(self, x, x0, a, c, max_iter):
+        """Solves a single 2d system, the edges of x are held fixed.
+
+        Returns:
+            [int, float]
+                int: Iterations used.
+                float: Relative residual reached.
+        """
+
+    def _converged(self, x, x0, a, c, norm_b):
+        """Checks the stopping rule of the solver.
+
+        Returns:
+            [bool, float]
+                bool: True if the tolerance was reached.
+                float: Relative residual.
+        """
+        if self.tol is None: return False, 0.0
+        res = np.linalg.norm(residual(x, x0, a, c)) / norm_b
+        return res <= self.tol, res
+
+class JacobiSolver(Solver):
+    """Jacobi relaxation, the original solver of the Fluid.
+    It applies the boundaries of the Fluid after every sweep.
+    """
+    def solve(self, fluid, x, x0, a, c):
+        max_iter = self.max_iter if self.max_iter is not None else fluid.iter
+        c_recip = 1 / c
+        norm_b = _norm(x0) if self.tol is not None else None
+
+        self.residual = 0.0
+        self.iterations = 0
+        for iteration in range(0, max_iter):
+            # Calculates the interactions with the 4 closest neighbors
+            fluid.kernels.jacobi(x, x0, a, c_recip)
+
+            fluid.set_boundaries(x)
+            self.iterations += 1
+            done, self.residual = self._converged(x, x0, a, c, norm_b)
+            if done: break
+        return self.iterations
+
+    def _solve(self, x, x0, a, c, max_iter):
+        # Without a Fluid the edges are held fixed, like the other solvers
+        norm_b = _norm(x0)
+        a_y, a_x = a if isinstance(a, tuple) else (a, a)
+        res = 0.0
+        iteration = 0
+        for iteration in range(1, max_iter + 1):
+            x[1:-1, 1:-1] = (x0[1:-1, 1:-1] + a_y * (x[2:, 1:-1] + x[:-2, 1:-1]) + a_x * (x[1:-1, 2:] + x[1:-1, :-2])) / c
+            done, res = self._converged(x, x0, a, c, norm_b)
+            if done: break
+        return iteration, res
+
+class SORSolver(Solver):
+    """Red-black Gauss-Seidel with successive over-relaxation.
+    """
+    def __init__(self, omega=1.0, tol=1e-4, max_iter=500):
+        """Creates a SORSolver.
+
+        Args:
+            omega (float, optional): Relaxation factor, 1 is plain Gauss-Seidel. Defaults to 1.0.
+            tol (float, optional): Relative residual at which the solver stops. Defaults to 1e-4.
+            max_iter (int, optional): Maximum number of sweeps. Defaults to 500.
+        """
+        super().__init__(tol, max_iter)
+        self.omega = omega
+
+    def _solve(self, x, x0, a, c, max_iter):
+        norm_b = _norm(x0)
+        res = 0.0
+        iteration = 0
+        for iteration in range(1, max_iter + 1):
+            rb_sweep(x, x0, a, c, self.omega)
+            done, res = self._converged(x, x0, a, c, norm_b)
+            if done: break
+        return iteration, res
+
+class MultigridSolver(Solver):
+    """Geometric multigrid, V-cycles with red-black Gauss-Seidel smoothing.
+    """
+    def __init__(self, pre_sweeps=2, post_sweeps=2, tol=1e-4, max_iter=50):
+        """Creates a MultigridSolver.
+
+        Args:
+            pre_sweeps (int, optional): Smoothing sweeps before going to the coarse grid. Defaults to 2.
+            post_sweeps (int, optional): Smoothing sweeps after coming back from the coarse grid. Defaults to 2.
+            tol (float, optional): Relative residual at which the solver stops. Defaults to 1e-4.
+            max_iter (int, optional): Maximum number of V-cycles. Defaults to 50.
+        """
+        super().__init__(tol, max_iter)
+        self.pre_sweeps = pre_sweeps
+        self.post_sweeps = post_sweeps
+
+    def _solve(self, x, x0, a, c, max_iter):
+        norm_b = _norm(x0)
+        res = 0.0
+        iteration = 0
+        for iteration in range(1, max_iter + 1):
+            v_cycle(x, x0, a, c, self.pre_sweeps, self.post_sweeps)
+            done, res = self._converged(x, x0, a, c, norm_b)
+            if done: break
+        return iteration, res
+
+class CGSolver(Solver):
+    """Preconditioned conjugate gradient on the interior of the grid.
+    The preconditioner must be symmetric: the V-cycle smooths in the reverse order on its way up and
+    alternates both orders on its coarsest grid.
+    """
+    def __init__(self, preconditioner="multigrid", tol=1e-4, max_iter=200):
+        """Creates a CGSolver.
+
+        Args:
+            preconditioner (str, optional): "jacobi" or "multigrid" (one V-cycle). Defaults to "multigrid".
+            tol (float, optional): Relative residual at which the solver stops. Defaults to 1e-4.
+            max_iter (int, optional): Maximum number of iterations. Defaults to 200.
+        """
+        super().__init__(tol, max_iter)
+        if preconditioner not in ["jacobi", "multigrid"]:
+            raise ValueError(f"Unknown preconditioner {preconditioner}")
+        self.preconditioner = preconditioner
+
+    def _precondition(self, r, a, c):
+        if self.preconditioner == "jacobi": return r / c
+        z = np.zeros((r.shape[0] + 2, r.shape[1] + 2))
+        b = np.zeros_like(z)
+        b[1:-1, 1:-1] = r
+        v_cycle(z, b, a, c, 1, 1)
+        return z[1:-1, 1:-1]
+
+    def _solve(self, x, x0, a, c, max_iter):
+        # Solves for the correction of x, with zero boundaries
+        norm_b = _norm(x0)
+        tol = self.tol if self.tol is not None else 0.0
+        r = residual(x, x0, a, c)
+        res = np.linalg.norm(r) / norm_b
+        if res <= tol: return 0, res
+
+        p_pad = np.zeros(x.shape)
+        e = np.zeros(r.shape)
+        z = self._precondition(r, a, c)
+        p = p_pad[1:-1, 1:-1]
+        p[:] = z
+        rz = np.vdot(r, z)
+        iteration = 0
+        for iteration in range(1, max_iter + 1):
+            ap = c * p - a * (p_pad[2:, 1:-1] + p_pad[:-2, 1:-1] + p_pad[1:-1, 2:] + p_pad[1:-1, :-2])
+            pap = np.vdot(p, ap)
+            if pap == 0: break
+            alpha = rz / pap
+            e += alpha * p
+            r -= alpha * ap
+            res = np.linalg.norm(r) / norm_b
+            if res <= tol: break
+            z = self._precondition(r, a, c)
+            rz_new = np.vdot(r, z)
+            p *= rz_new / rz
+            p += z
+            rz = rz_new
+        x[1:-1, 1:-1] += e
+        return iteration, res
+
+SOLVERS = {
+    "jacobi": JacobiSolver,
+    "sor": SORSolver,
+    "multigrid": MultigridSolver,
+    "cg": CGSolver,
+}
+
+def make_solver(name="jacobi", **kwargs):
+    """Creates a Solver from its name.
+
+    Args:
+        name (str, optional): One of "jacobi", "sor", "multigrid" or "cg". Defaults to "jacobi".
+        **kwargs: Arguments given to the Solver.
+
+    Returns:
+        Solver: The Solver created.
+    """
+    try:
+        return SOLVERS[name.lower()](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown solver {name}, expected one of {', '.join(SOLVERS)}")
+
+def residual(x, x0, a, c):
+    """Residual of the system over the interior of the grid.
+
+    Args:
+        a (float or tuple): Weight of the neighbors, or their weights along y and x.
+        c (float or np.ndarray): Weight of the cell, arrays have the shape of x.
+
+    Returns:
+        np.ndarray: The residual x0 - A x, without the edges.
+    """
+    if isinstance(c, np.ndarray): c = c[1:-1, 1:-1]
+    if isinstance(a, tuple):
+        return x0[1:-1, 1:-1] - (c * x[1:-1, 1:-1] - a[0] * (x[2:, 1:-1] + x[:-2, 1:-1]) - a[1] * (x[1:-1, 2:] + x[1:-1, :-2]))
+    return x0[1:-1, 1:-1] - (c * x[1:-1, 1:-1] - a * (x[2:, 1:-1] + x[:-2, 1:-1] + x[1:-1, 2:] + x[1:-1, :-2]))
+
+def rb_sweep(x, x0, a, c, omega=1.0, reverse=False):
+    """Red-black Gauss-Seidel sweep over the interior of x, the edges are left as they are.
+
+    Args:
+        x (np.ndarray): The unknown, modified in place.
+        x0 (np.ndarray): The right hand side.
+        a (float): Weight of the neighbors.
+        c (float or np.ndarray): Weight of the cell, arrays have the shape of x.
+        omega (float, optional): Relaxation factor. Defaults to 1.0.
+        reverse (bool, optional): Updates the black cells before the red ones. Defaults to False.
+    """
+    n, m = x.shape[0], x.shape[1]
+    c_recip = 1 / c
+    # Each color is the union of two strided sub-grids of the interior
+    colors = [((1, 1), (2, 2)), ((1, 2), (2, 1))]
+    if reverse: colors.reverse()
+    for color in colors:
+        for si, sj in color:
+            rows = slice(si, n - 1, 2)
+            cols = slice(sj, m - 1, 2)
+            scale = c_recip[rows, cols] if isinstance(c_recip, np.ndarray) else c_recip
+            new = (x0[rows, cols] + a * (x[si - 1:n - 2:2, cols] + x[si + 1:n:2, cols] +
+                                         x[rows, sj - 1:m - 2:2] + x[rows, sj + 1:m:2])) * scale
+            if omega == 1.0:
+                x[rows, cols] = new
+            else:
+                x[rows, cols] += omega * (new - x[rows, cols])
+
+def v_cycle(x, x0, a, c, pre_sweeps=2, post_sweeps=2, edge_x=None, edge_y=None):
+    """Multigrid V-cycle over the interior of x, the edges are left as they are.
+
+    The coarse grid keeps every other node of the fine grid, the residual is
+    restricted with full weighting and the correction is prolonged bilinearly.
+    When a grid has an even number of nodes its last coarse node falls short of
+    the far edge, the boundary is then extrapolated into the diagonal.
+
+    Args:
+        x (np.ndarray): The unknown, modified in place.
+        x0 (np.ndarray): The right hand side.
+        a (float): Weight of the neighbors.
+        c (float): Weight of the cell.
+        pre_sweeps (int, optional): Smoothing sweeps before the coarse grid. Defaults to 2.
+        post_sweeps (int, optional): Smoothing sweeps after the coarse grid. Defaults to 2.
+        edge_x (float, optional): Position of the far edge in the first axis. Defaults to None.
+            None: The last row of x.
+        edge_y (float, optional): Position of the far edge in the second axis. Defaults to None.
+            None: The last column of x.
+    """
+    nx, ny = x.shape[0] - 2, x.shape[1] - 2
+    if edge_x is None: edge_x = nx + 1
+    if edge_y is None: edge_y = ny + 1
+
+    diag = c
+    if edge_x != nx + 1 or edge_y != ny + 1:
+        diag = np.full(x.shape, float(c))
+        diag[nx, :] += a * (1 / (edge_x - nx) - 1)
+        diag[:, ny] += a * (1 / (edge_y - ny) - 1)
+
+    if min(nx, ny) <= 3:
+        # both orders in turn, the cycle stays symmetric as a preconditioner
+        for sweep in range(0, 2 * (nx + ny)):
+            rb_sweep(x, x0, a, diag)
+            rb_sweep(x, x0, a, diag, reverse=True)
+        return
+
+    for sweep in range(0, pre_sweeps):
+        rb_sweep(x, x0, a, diag)
+
+    # Coarse node k sits on fine node 2k
+    cx, cy = nx // 2, ny // 2
+    r = np.zeros((2 * cx + 3, 2 * cy + 3))
+    r[1:nx + 1, 1:ny + 1] = residual(x, x0, a, diag)
+    b = np.zeros((cx + 2, cy + 2))
+    b[1:-1, 1:-1] = restrict(r)
+
+    # The shift c - 4a stays the same when the cells double in size
+    e = np.zeros_like(b)
+    v_cycle(e, b, a / 4, c - 3 * a, pre_sweeps, post_sweeps, edge_x / 2, edge_y / 2)
+    x[1:-1, 1:-1] += prolong(e)[1:nx + 1, 1:ny + 1]
+
+    for sweep in range(0, post_sweeps):
+        rb_sweep(x, x0, a, diag, reverse=True)
+
+def restrict(r):
+    """Full weighting restriction to every other node.
+
+    Args:
+        r (np.ndarray): The fine grid, of odd size and with zeros on the edges.
+
+    Returns:
+        np.ndarray: The interior of the coarse grid.
+    """
+    center = r[2:-1:2, 2:-1:2]
+    sides = r[1:-2:2, 2:-1:2] + r[3::2, 2:-1:2] + r[2:-1:2, 1:-2:2] + r[2:-1:2, 3::2]
+    corners = r[1:-2:2, 1:-2:2] + r[3::2, 1:-2:2] + r[1:-2:2, 3::2] + r[3::2, 3::2]
+    return (4 * center + 2 * sides + corners) / 16
+
+def prolong(e):
+    """Bilinear prolongation from every other node.
+
+    Args:
+        e (np.ndarray): The coarse grid, with a layer of boundary nodes.
+
+    Returns:
+        np.ndarray: The fine grid, of size 2 * len(e) - 1 in both axes.
+    """
+    fine = np.empty((2 * e.shape[0] - 1, 2 * e.shape[1] - 1))
+    fine[0::2, 0::2] = e
+    fine[1::2, 0::2] = 0.5 * (e[:-1, :] + e[1:, :])
+    fine[0::2, 1::2] = 0.5 * (e[:, :-1] + e[:, 1:])
+    fine[1::2, 1::2] = 0.25 * (e[:-1, :-1] + e[1:, :-1] + e[:-1, 1:] + e[1:, 1:])
+    return fine
+
+def _norm(x0):
+    """Norm of the right hand side used to make residuals relative."""
+    norm = np.linalg.norm(x0[1:-1, 1:-1])
+    return norm if norm > 0 else 1.0
@@ -0,0 +1,158 @@
+"""
+Parameter sweeps, runs every Config file crossed with many Fluid parameters on a pool of processes.
+
+Usage:
+    python sweep.py --dt 0.1 0.2 --visc 0 0.0001 --size 60 120 --frames 200 --output sweep.csv
+"""
+import argparse
+import csv
+import glob
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+BLAS_THREADS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+RESULT_FIELDS = ["config", "size", "dt", "visc", "diff", "frames", "solver", "density_sum", "peak_velocity", "wall_time"]
+
+def scenario_grid(configs=None, dt=(0.2,), visc=(0.0,), diff=(0.0,), size=(60,), frames=100, solver="jacobi"):
+    """Creates the cases of a sweep, every combination of the values given.
+
+    Args:
+        configs (list, optional): Names or paths of the Config files. Defaults to None.
+            None: Every file in Config folder.
+        dt (tuple, optional): Time intervals. Defaults to (0.2,).
+        visc (tuple, optional): Viscosities. Defaults to (0.0,).
+        diff (tuple, optional): Diffusions. Defaults to (0.0,).
+        size (tuple, optional): Grid sizes. Defaults to (60,).
+        frames (int, optional): Steps simulated by every case. Defaults to 100.
+        solver (str, optional): Name of the linear solver. Defaults to "jacobi".
+
+    Raises:
+        ValueError: If a size is too small for the objects of a Config file, see Scene.extent.
+
+    Returns:
+        list: List of dicts, one per case.
+    """
+    from assets import config_path
+    from scene import load_scene
+
+    if configs is None: configs = sorted(glob.glob("Config/*.txt"))
+    # the objects of the scenes are in cells, they do not scale with the grid
+    for config in configs:
+        rows, cols = load_scene(config_path(config)).extent()
+        for case_size in size:
+            if case_size < max(rows, cols):
+                raise ValueError(f"{config} needs a grid of at least {max(rows, cols)} cells, got size {case_size}")
+    cases = []
+    for config, case_size, case_dt, case_visc, case_diff in itertools.product(configs, size, dt, visc, diff):
+        cases.append({"config": config, "size": case_size, "dt": case_dt, "visc": case_visc, "diff": case_diff, "frames": frames, "solver": solver})
+    return cases
+
+def run_case(case: dict):
+    """Runs a single case of a sweep.
+
+    Args:
+        case (dict): The case, as given by scenario_grid.
+
+    Returns:
+        dict: The case with its density_sum, peak_velocity and wall_time.
+    """
+    import numpy as np
+    from assets import config_path
+    from fluid import Fluid
+    from scene import load_scene
+
+    start = time.perf_counter()
+    fluid = Fluid(case["size"], case["solver"])
+    fluid.dt = case["dt"]
+    fluid.visc = case["visc"]
+    fluid.diff = case["diff"]
+    sources, solids = load_scene(config_path(case["config"]), case["size"]).apply(fluid)
+    sources.apply(fluid)
+
+    peak = 0.0
+    for frame in range(0, case["frames"]):
+        sources.apply(fluid)
+        fluid.step()
+        peak = max(peak, float(np.sqrt((fluid.velo ** 2).sum(axis=2).max())))
+
+    result = dict(case)
+    result["density_sum"] = float(fluid.density.sum())
+    result["peak_velocity"] = peak
+    result["wall_time"] = time.perf_counter() - start
+    return result
+
+def _pin_threads(threads: int):
+    """Initializer of the workers, limits the BLAS thread pools of the process."""
+    for name in BLAS_THREADS:
+        os.environ[name] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+def run_sweep(cases: list, workers=None, blas_threads=1):
+    """Runs the cases of a sweep on a pool of processes, the workers are reused between cases.
+
+    Args:
+        cases (list): The cases, as given by scenario_grid.
+        workers (int, optional): Number of processes. Defaults to None.
+            None: One per core.
+        blas_threads (int, optional): BLAS threads of every worker. Defaults to 1.
+
+    Returns:
+        list: The results of run_case, in the order of the cases.
+    """
+    # The environment is inherited by the workers before they import numpy
+    saved = {name: os.environ.get(name) for name in BLAS_THREADS}
+    for name in BLAS_THREADS:
+        os.environ[name] = str(blas_threads)
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_pin_threads, initargs=(blas_threads,)) as pool:
+            return list(pool.map(run_case, cases, chunksize=max(1, len(cases) // (4 * (workers or os.cpu_count() or 1)))))
+    finally:
+        for name, value in saved.items():
+            if value is None: os.environ.pop(name, None)
+            else: os.environ[name] = value
+
+def write_results(results: list, path: str):
+    """Writes the results of a sweep to a csv file.
+
+    Args:
+        results (list): The results of run_sweep.
+        path (str): The path of the csv file.
+    """
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs a parameter sweep over Config files on all the cores.")
+    parser.add_argument("--configs", nargs="+", default=None, help="names or paths of Config files (default all in Config folder)")
+    parser.add_argument("--dt", nargs="+", type=float, default=[0.2], help="time intervals")
+    parser.add_argument("--visc", nargs="+", type=float, default=[0.0], help="viscosities")
+    parser.add_argument("--diff", nargs="+", type=float, default=[0.0], help="diffusions")
+    parser.add_argument("--size", nargs="+", type=int, default=[60], help="grid sizes")
+    parser.add_argument("-f", "--frames", type=int, default=100, help="frames per case (default 100)")
+    parser.add_argument("--solver", default="jacobi", help="linear solver: jacobi, sor, multigrid or cg (default jacobi)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of processes (default one per core)")
+    parser.add_argument("-o", "--output", default="", help="csv file for the results (default print them)")
+    args = parser.parse_args(args)
+
+    cases = scenario_grid(args.configs, args.dt, args.visc, args.diff, args.size, args.frames, args.solver)
+    results = run_sweep(cases, args.workers)
+    if args.output:
+        write_results(results, args.output)
+        print(f"{len(results)} cases saved in {args.output}")
+    else:
+        for result in results:
+            print(", ".join(f"{field}={result[field]}" for field in RESULT_FIELDS))
+
+if __name__ == "__main__":
+    main()
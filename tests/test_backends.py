@@ -0,0 +1,49 @@
+"""
+Compiled and threaded kernels against the NumPy kernels, phase by phase of the step.
+"""
+import numpy as np
+import pytest
+
+from density import Solid
+from fluid import Fluid
+
+BACKENDS = [("numba", 1), ("numpy", 3), ("numba", 3)]
+GRIDS = [{}, {"nx": 37, "ny": 23}, {"nx": 37, "ny": 23, "spacing": (0.04, 0.03)}]
+
+def make_fluid(backend, threads, grid):
+    """A Fluid with the same solids and random fields, whatever its kernels."""
+    if backend == "numba": pytest.importorskip("numba")
+    fluid = Fluid(30, backend=backend, threads=threads, **grid)
+    fluid.set_solids([Solid(10, 8, 4, 5), Solid(20, 14, 3, 3)])
+    rng = np.random.default_rng(0)
+    fluid.density[...] = rng.random(fluid.density.shape) * 100
+    fluid.s[...] = rng.random(fluid.s.shape) * 100
+    fluid.velo = rng.normal(0, 0.5, fluid.velo.shape)
+    fluid.velo0 = rng.normal(0, 0.5, fluid.velo0.shape)
+    return fluid
+
+def run_phase(fluid, phase):
+    """Runs a phase of the step on the fields of the Fluid."""
+    if phase == "diffuse":
+        fluid.diffuse(fluid.density, fluid.s, 0.001)
+        fluid.diffuse(fluid.velo0, fluid.velo, 0.0005)
+    elif phase == "project":
+        fluid.project(fluid.velo[..., 0], fluid.velo[..., 1], fluid.velo0[..., 0], fluid.velo0[..., 1])
+    elif phase == "advect":
+        fluid.advect(fluid.density, fluid.s, fluid.velo)
+        fluid.advect(fluid.velo0[..., 0], fluid.velo[..., 0], fluid.velo)
+    else:
+        for step in range(0, 3):
+            fluid.step()
+
+@pytest.mark.parametrize("phase", ["diffuse", "project", "advect", "step"])
+@pytest.mark.parametrize("grid", GRIDS)
+@pytest.mark.parametrize("backend, threads", BACKENDS)
+def test_backend_matches_numpy(backend, threads, grid, phase):
+    expected = make_fluid("numpy", 1, grid)
+    fluid = make_fluid(backend, threads, grid)
+    assert fluid.backend == backend
+    run_phase(expected, phase)
+    run_phase(fluid, phase)
+    for name in ["density", "s", "velo", "velo0"]:
+        np.testing.assert_allclose(getattr(fluid, name), getattr(expected, name), rtol=1e-12, atol=1e-12)
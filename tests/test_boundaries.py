@@ -0,0 +1,77 @@
+"""
+Edges of the grid of every boundary type, on the fields of a Fluid.
+"""
+import numpy as np
+
+from boundaries import Boundaries
+from fluid import Fluid
+
+def _advect_left(boundaries):
+    """Density of column 2 advected three cells to the left."""
+    fluid = Fluid(32)
+    fluid.boundaries = boundaries
+    fluid.s[5:10, 2] = 1.0
+    fluid.velo[..., 1] = -3 / (fluid.dt * fluid.scale[1])
+    fluid.advect(fluid.density, fluid.s, fluid.velo)
+    return fluid.density
+
+def test_periodic_domain_wraps_the_density_across_the_seam():
+    density = _advect_left(Boundaries(left="periodic", right="periodic"))
+    # column 2 - 3 is one cell past the seam, the last interior column
+    np.testing.assert_allclose(density[5:10, 29], 1.0)
+    assert density[5:10, 1:29].sum() == 0
+    # the walls clamp the backtraces instead
+    assert _advect_left(Boundaries())[5:10, 29].sum() == 0
+
+def test_periodic_ghost_cells_copy_the_opposite_interior():
+    fluid = Fluid(16)
+    fluid.boundaries = Boundaries(top="periodic", bottom="periodic")
+    table = np.random.default_rng(0).random((16, 16))
+    fluid.set_boundaries(table)
+    np.testing.assert_array_equal(table[0, 1:-1], table[14, 1:-1])
+    np.testing.assert_array_equal(table[15, 1:-1], table[1, 1:-1])
+
+def test_inflow_edge_holds_its_profile():
+    profile = np.stack([np.zeros(30), np.linspace(0.1, 0.5, 30)], axis=-1)
+    fluid = Fluid(30)
+    fluid.boundaries = Boundaries(left="inflow", right="outflow", profiles={"left": profile})
+    fluid.density[10:20, 1:5] = 1.0
+    for frame in range(0, 5):
+        fluid.step()
+        np.testing.assert_array_equal(fluid.velo[1:-1, 0], profile[1:-1])
+        # the density has a zero gradient across the inflow
+        np.testing.assert_array_equal(fluid.density[1:-1, 0], fluid.density[1:-1, 1])
+
+def test_outflow_edge_copies_the_interior():
+    fluid = Fluid(16)
+    fluid.boundaries = Boundaries(top="outflow", bottom="outflow", left="outflow", right="outflow")
+    rng = np.random.default_rng(1)
+    for table, vector in [(rng.random((16, 16)), False), (rng.random((16, 16, 2)), True)]:
+        fluid.set_boundaries(table)
+        np.testing.assert_array_equal(table[0, 1:-1], table[1, 1:-1])
+        np.testing.assert_array_equal(table[-1, 1:-1], table[-2, 1:-1])
+        np.testing.assert_array_equal(table[1:-1, 0], table[1:-1, 1])
+        np.testing.assert_array_equal(table[1:-1, -1], table[1:-1, -2])
+
+def test_corners_average_their_neighbours():
+    rng = np.random.default_rng(2)
+    fluid = Fluid(16)
+    fluid.boundaries = Boundaries(top="outflow", bottom="outflow", left="outflow", right="outflow")
+    table = rng.random((16, 16))
+    fluid.set_boundaries(table)
+    # both neighbours copy the diagonal interior cell
+    for corner, inner in [((0, 0), (1, 1)), ((0, -1), (1, -2)), ((-1, 0), (-2, 1)), ((-1, -1), (-2, -2))]:
+        assert table[corner] == table[inner]
+
+    # a velocity, every component is the mean of its two neighbours
+    fluid.boundaries = Boundaries()
+    velo = rng.random((16, 16, 2))
+    fluid.set_boundaries(velo)
+    np.testing.assert_array_equal(velo[0, 0], 0.5 * (velo[1, 0] + velo[0, 1]))
+    np.testing.assert_array_equal(velo[-1, 0], 0.5 * (velo[-2, 0] + velo[-1, 1]))
+    # mixed edges, the mean of the two neighbours as the edges left them
+    fluid.boundaries = Boundaries(top="periodic", bottom="periodic", left="outflow", right="reflect")
+    table = rng.random((16, 16))
+    fluid.set_boundaries(table)
+    assert table[0, 0] == 0.5 * (table[1, 0] + table[0, 1])
+    assert table[-1, -1] == 0.5 * (table[-2, -1] + table[-1, -2])
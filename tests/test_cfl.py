@@ -0,0 +1,61 @@
+"""
+Adaptive time stepping of Fluid.step, the substeps of a frame against the cfl.
+"""
+import math
+
+import numpy as np
+import pytest
+
+from fluid import Fluid
+
+def _fluid(speed, cfl=1.0, max_substeps=16):
+    fluid = Fluid(40)
+    fluid.cfl = cfl
+    fluid.max_substeps = max_substeps
+    fluid.density[15:25, 15:25] = 1.0
+    fluid.velo[10:30, 10:30, 1] = speed
+    # the dt of every substep
+    fluid.dts = []
+    substep = fluid.substep
+    def record():
+        fluid.dts.append(fluid.dt)
+        substep()
+    fluid.substep = record
+    return fluid
+
+@pytest.mark.parametrize("speed", [0.0, 0.001, 0.5, 2.0])
+def test_substeps_sum_to_dt(speed):
+    fluid = _fluid(speed)
+    for frame in range(0, 3):
+        fluid.dts.clear()
+        fluid.step()
+        assert len(fluid.dts) == fluid.substeps
+        assert math.fsum(fluid.dts) == pytest.approx(0.2, rel=1e-12, abs=0)
+        assert fluid.dt == 0.2
+
+def test_calm_field_takes_a_single_substep():
+    fluid = _fluid(0.001)
+    assert fluid.cfl_dt() > fluid.dt
+    fluid.step()
+    assert fluid.substeps == 1 and fluid.dts == [0.2]
+
+def test_substep_count_follows_the_cfl():
+    counts = []
+    for cfl in (4.0, 2.0, 1.0, 0.5):
+        fluid = _fluid(0.5, cfl)
+        first = math.ceil(fluid.dt / fluid.cfl_dt())
+        fluid.step()
+        # the first split is on the starting velocity, the later ones may only add substeps
+        assert fluid.substeps >= first
+        # no substep backtraces further than the cfl allows on the velocity it started from
+        assert fluid.dts[0] * 0.5 * fluid.scale[1] <= cfl * (1 + 1e-12)
+        counts.append(fluid.substeps)
+    assert counts == sorted(counts) and counts[0] < counts[-1]
+
+def test_max_substeps_is_enforced():
+    fluid = _fluid(2.0, cfl=0.1, max_substeps=5)
+    assert math.ceil(fluid.dt / fluid.cfl_dt()) > 5
+    fluid.step()
+    assert fluid.substeps == 5 == len(fluid.dts)
+    assert math.fsum(fluid.dts) == pytest.approx(0.2, rel=1e-12, abs=0)
+    assert np.isfinite(fluid.density).all()
@@ -0,0 +1,100 @@
+"""
+Checkpoints and resumed runs against runs that were never interrupted.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from checkpoint import load_checkpoint, save_checkpoint
+from fluid import Fluid
+from kernels import TiledKernels
+from results import run_key
+from runner import run
+from scene import load_scene
+from sources import Sources
+from tracers import Particles, ScalarStack
+from trajectory import TrajectoryReader
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Config", "Config2.txt")
+
+def test_resume_keeps_threads_and_frames(tmp_path):
+    checkpoint = str(tmp_path / "runs" / "config2")
+    run(CONFIG, 4, 40, checkpoint=checkpoint, threads=3)
+    resumed = run(CONFIG, 8, 40, checkpoint=checkpoint, resume=True, threads=3)
+    assert isinstance(resumed.kernels, TiledKernels) and resumed.kernels.threads == 3
+
+    straight = run(CONFIG, 8, 40)
+    assert np.array_equal(resumed.density, straight.density)
+    assert np.array_equal(resumed.velo, straight.velo)
+
+def tracer_fluid(precision):
+    """The scene of CONFIG with two scalars and particles, and its Sources."""
+    fluid = Fluid(40, precision=precision)
+    sources, solids = load_scene(CONFIG, fluid.density.shape).apply(fluid)
+    fluid.scalars = ScalarStack(["temperature", "dye"], fluid, diff=[0.001, 0.0])
+    fluid.particles = Particles.seed(500, 5, 5, 30, 30)
+    return fluid, sources, solids
+
+def advance(fluid, sources, frames):
+    for frame in range(0, frames):
+        fluid.scalars["dye"][10:15, 10:15] = 1
+        sources.apply(fluid)
+        fluid.step()
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+def test_checkpoint_keeps_tracers(tmp_path, precision):
+    fluid, sources, solids = tracer_fluid(precision)
+    advance(fluid, sources, 4)
+    sources.sync()
+    save_checkpoint(str(tmp_path / "tracers"), fluid, sources.densities, sources.velocities, solids, 4)
+    fluid.particles.remove(fluid.particles.x < 20)
+    advance(fluid, sources, 4)
+
+    resumed, densities, velocities, solids, frame = load_checkpoint(str(tmp_path / "tracers"))
+    assert frame == 4 and resumed.scalars.names == ["temperature", "dye"] and resumed.scalars.diff == [0.001, 0.0]
+    resumed.particles.remove(resumed.particles.x < 20)
+    advance(resumed, Sources(densities, velocities), 4)
+
+    for name in ["density", "velo"]:
+        assert np.array_equal(getattr(resumed, name), getattr(fluid, name))
+    assert resumed.scalars.fields.dtype == fluid.scalars.fields.dtype
+    assert np.array_equal(resumed.scalars.fields, fluid.scalars.fields)
+    assert np.array_equal(resumed.particles.y, fluid.particles.y) and np.array_equal(resumed.particles.x, fluid.particles.x)
+
+def test_cache_refuses_tracers():
+    fluid, sources, solids = tracer_fluid("float64")
+    with pytest.raises(ValueError, match="cannot be cached"):
+        run_key(load_scene(CONFIG), fluid)
+
+@pytest.mark.parametrize("output", ["frames.npy", "frames.traj"])
+def test_resume_appends_to_the_output(tmp_path, output):
+    checkpoint, path = str(tmp_path / "config2"), str(tmp_path / output)
+    # the run stops after a checkpoint, the frames after it are written again by the resumed run
+    run(CONFIG, 6, 40, output=path, checkpoint=checkpoint, checkpoint_every=4, stride=3)
+    run(CONFIG, 4, 40, checkpoint=checkpoint)  # the checkpoint of frame 4 again
+    run(CONFIG, 10, 40, output=path, checkpoint=checkpoint, resume=True, stride=3)
+    straight = str(tmp_path / ("straight" + os.path.splitext(output)[1]))
+    run(CONFIG, 10, 40, output=straight, stride=3)
+
+    if output.endswith(".npy"):
+        assert np.load(path).shape[0] == 10
+        assert np.array_equal(np.load(path), np.load(straight))
+    else:
+        resumed, expected = TrajectoryReader(path), TrajectoryReader(straight)
+        assert len(resumed) == len(expected) == 4
+        for index in range(0, 4):
+            assert np.array_equal(resumed[index]["density"], expected[index]["density"])
+
+def test_resume_past_the_frames_keeps_the_output(tmp_path):
+    checkpoint, path = str(tmp_path / "config2"), str(tmp_path / "frames.npy")
+    run(CONFIG, 6, 40, output=path, checkpoint=checkpoint)
+    fluid = run(CONFIG, 3, 40, output=path, checkpoint=checkpoint, resume=True)
+    assert np.load(path).shape[0] == 6
+    assert np.array_equal(np.load(path)[-1], fluid.density.astype(np.float32))
+
+def test_resume_refuses_a_video(tmp_path):
+    checkpoint = str(tmp_path / "config2")
+    run(CONFIG, 2, 40, checkpoint=checkpoint)
+    with pytest.raises(ValueError, match="video can not be continued"):
+        run(CONFIG, 4, 40, output=str(tmp_path / "movie.mp4"), checkpoint=checkpoint, resume=True)
@@ -0,0 +1,69 @@
+"""
+Members of an EnsembleFluid against Fluids stepped on their own.
+"""
+import numpy as np
+import pytest
+
+from boundaries import Boundaries
+from density import Solid
+from ensemble import EnsembleFluid
+from fluid import Fluid
+
+def seed(fluid, member=None):
+    """The same blob and jet in a Fluid, or in a member of an EnsembleFluid."""
+    density = fluid.density if member is None else fluid.density[member]
+    velo = fluid.velo if member is None else fluid.velo[member]
+    density[8:14, 6:12] = 100
+    velo[8:14, 6:12, 1] = 2
+    velo[10:16, 10:14, 0] = -1
+
+@pytest.mark.parametrize("precision", ["float64", "float32"])
+@pytest.mark.parametrize("grid", [{}, {"nx": 30, "ny": 18}, {"spacing": (0.05, 0.03), "nx": 30, "ny": 18}])
+def test_members_match_fluids(grid, precision):
+    dt, visc, diff = [0.1, 0.2, 0.15], [0.0, 1e-4, 2e-4], [1e-4, 0.0, 3e-4]
+    solids = [Solid(16, 4, 3, 3)]
+    ensemble = EnsembleFluid(3, 24, dt=dt, visc=visc, diff=diff, precision=precision, **grid)
+    ensemble.set_solids(solids)
+    fluids = []
+    for member in range(0, 3):
+        fluid = Fluid(24, precision=precision, **grid)
+        fluid.dt, fluid.visc, fluid.diff = dt[member], visc[member], diff[member]
+        fluid.set_solids(solids)
+        seed(fluid)
+        seed(ensemble, member)
+        fluids.append(fluid)
+
+    for step in range(0, 5):
+        ensemble.step()
+        for fluid in fluids:
+            fluid.step()
+    for member, fluid in enumerate(fluids):
+        assert np.array_equal(ensemble.density[member], fluid.density)
+        assert np.array_equal(ensemble.velo[member], fluid.velo)
+
+def test_members_match_fluids_with_periodic_boundaries():
+    boundaries = Boundaries(left="periodic", right="periodic", top="outflow")
+    ensemble = EnsembleFluid(2, 24, dt=[0.1, 0.2])
+    ensemble.boundaries = boundaries
+    fluids = []
+    for member, dt in enumerate([0.1, 0.2]):
+        fluid = Fluid(24)
+        fluid.dt = dt
+        fluid.boundaries = boundaries
+        seed(fluid)
+        seed(ensemble, member)
+        fluids.append(fluid)
+
+    for step in range(0, 5):
+        ensemble.step()
+        for fluid in fluids:
+            fluid.step()
+    for member, fluid in enumerate(fluids):
+        assert np.array_equal(ensemble.density[member], fluid.density)
+        assert np.array_equal(ensemble.velo[member], fluid.velo)
+
+def test_cfl_is_rejected():
+    ensemble = EnsembleFluid(2, 16)
+    ensemble.cfl = 1.0
+    with pytest.raises(ValueError):
+        ensemble.step()
@@ -0,0 +1,70 @@
+"""
+Kernels of the Fluid step against the per cell loops they replace.
+"""
+import math
+
+import numpy as np
+import pytest
+
+from density import Solid
+from fluid import Fluid
+from kernels import Kernels, NumpyKernels
+
+def loop_advect(d, d0, velocity, dtx, dty):
+    """The original Fluid.advect, a Python loop over every interior cell."""
+    n0, n1 = d.shape
+    for j in range(1, n1 - 1):
+        for i in range(1, n0 - 1):
+            x = i - dtx * velocity[i, j, 0]
+            y = j - dty * velocity[i, j, 1]
+            x = min(max(x, 0.5), (n0 - 1) - 0.5)
+            y = min(max(y, 0.5), (n1 - 1) - 0.5)
+            i0 = math.floor(x)
+            j0 = math.floor(y)
+            s1 = x - i0
+            s0 = 1.0 - s1
+            t1 = y - j0
+            t0 = 1.0 - t1
+            d[i, j] = s0 * (t0 * d0[i0, j0] + t1 * d0[i0, j0 + 1]) + \
+                      s1 * (t0 * d0[i0 + 1, j0] + t1 * d0[i0 + 1, j0 + 1])
+
+def random_fields(shape, seed=0):
+    """A field and a velocity fast enough for the backtraces to leave the grid."""
+    rng = np.random.default_rng(seed)
+    d0 = rng.random(shape)
+    velocity = rng.normal(0, 0.5, shape + (2,))
+    return d0, velocity
+
+@pytest.mark.parametrize("shape", [(20, 20), (17, 31)])
+def test_numpy_advect_matches_loop(shape):
+    d0, velocity = random_fields(shape)
+    dtx, dty = 0.2 * (shape[0] - 2), 0.2 * (shape[1] - 2)
+    expected = np.zeros(shape)
+    loop_advect(expected, d0, velocity, dtx, dty)
+    d = np.zeros(shape)
+    NumpyKernels().advect(d, d0, velocity, dtx, dty)
+    assert np.allclose(d, expected, rtol=0, atol=1e-12)
+
+def test_fluid_advect_with_solids_matches_loop():
+    fluid = Fluid(30)
+    fluid.set_solids([Solid(8, 10, 5, 4), Solid(18, 20, 3, 6)])
+    d0, velocity = random_fields((30, 30), seed=1)
+    fluid.velo = velocity
+
+    expected = np.zeros((30, 30))
+    loop_advect(expected, d0, fluid.velo, fluid.dt * fluid.scale[0], fluid.dt * fluid.scale[1])
+    fluid.set_boundaries(expected)
+    fluid.set_solid_cells(expected)
+
+    d = np.zeros((30, 30))
+    fluid.advect(d, d0, fluid.velo)
+    assert np.allclose(d, expected, rtol=0, atol=1e-12)
+    assert not d[fluid.solid_mask].any()
+
+def test_kernels_missing_a_method_are_rejected():
+    class Incomplete(Kernels):
+        def jacobi_rows(self, x, x0, a, c_recip, out, start, stop):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
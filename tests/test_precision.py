@@ -0,0 +1,53 @@
+"""
+float32 and mixed precision against float64 on every Config file.
+
+The scenes are chaotic: a change of one part in 10^7 of the velocity makes the fields of two float64 runs part
+after about 20 frames, so the cells of a float32 run are never compared. The total density and the kinetic energy
+are bounded instead, frame by frame while the runs stay close, then on average over a long run.
+"""
+import functools
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from fluid import Fluid
+from scene import load_scene
+
+CONFIGS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Config", "Config*.txt")))
+SIZE = 60
+FRAMES = 200
+EARLY = 8  # frames before the runs part
+
+@functools.lru_cache(maxsize=None)
+def aggregates(path, precision):
+    """Total density and kinetic energy of a Config file after every frame, in float64.
+
+    Returns:
+        np.ndarray: Array of shape (FRAMES, 2).
+    """
+    fluid = Fluid(SIZE, precision=precision)
+    sources, solids = load_scene(path, SIZE).apply(fluid)
+    result = np.empty((FRAMES, 2))
+    for frame in range(0, FRAMES):
+        sources.apply(fluid)
+        fluid.step()
+        velo = fluid.velo.astype(np.float64)
+        result[frame] = fluid.density.sum(dtype=np.float64), 0.5 * (velo ** 2).sum()
+    return result
+
+@pytest.mark.parametrize("precision", ["float32", "mixed"])
+@pytest.mark.parametrize("path", CONFIGS, ids=os.path.basename)
+def test_aggregates_follow_float64(path, precision):
+    expected = aggregates(path, "float64")
+    result = aggregates(path, precision)
+    assert result.dtype == np.float64 and np.isfinite(result).all()
+
+    np.testing.assert_allclose(result[:EARLY], expected[:EARLY], rtol=1e-2)
+    mean, expected_mean = result.mean(axis=0), expected.mean(axis=0)
+    np.testing.assert_allclose(mean[0], expected_mean[0], rtol=0.1, err_msg="mean total density")
+    np.testing.assert_allclose(mean[1], expected_mean[1], rtol=0.25, err_msg="mean kinetic energy")
+
+def test_configs_found():
+    assert len(CONFIGS) >= 1
@@ -0,0 +1,63 @@
+"""
+Refinement against the uniform grid it stands for.
+"""
+import numpy as np
+import pytest
+
+from density import Density
+from fluid import Fluid
+from refined import RefinedFluid
+from sources import Sources
+from velocity import Velocity
+
+def blob(fluid, width, velocity=True):
+    """A square of density in the middle of the grid, stirred by random velocities."""
+    start = (fluid.size - width) // 2
+    square = slice(start, start + width)
+    fluid.density[square, square] = 100
+    if velocity:
+        velo = np.zeros(fluid.velo.shape)
+        velo[square, square] = np.random.default_rng(0).normal(0, 0.3, (width, width, 2))
+        fluid.velo = velo
+
+@pytest.mark.parametrize("regrid_every", [1, 4])
+def test_ratio_one_matches_fluid(regrid_every):
+    # the patches solve the pressure from the coarse one, the two only agree once the solves converge
+    sources = [Sources([Density(12, 12, 3, 3, 100)], [Velocity(14, 14, 1, 1)]) for fluid in range(0, 2)]
+    fluid, refined = Fluid(30), RefinedFluid(30, ratio=1, block=5, max_patches=36, regrid_every=regrid_every)
+    for case in (fluid, refined):
+        case.iter = 400
+        blob(case, 15)
+    for frame in range(0, 5):
+        for case, case_sources in zip((fluid, refined), sources):
+            case_sources.apply(case)
+            case.step()
+        assert len(refined.blocks)
+        np.testing.assert_allclose(refined.density, fluid.density, atol=0.1)
+        np.testing.assert_allclose(refined.velo, fluid.velo, atol=5e-3)
+
+@pytest.mark.parametrize("ratio", [2, 4])
+def test_still_blob_keeps_its_mass(ratio):
+    fluid = RefinedFluid(60, ratio=ratio)
+    blob(fluid, 20, velocity=False)
+    mass = fluid.density.sum()
+    for frame in range(0, 10):
+        fluid.step()
+    assert len(fluid.blocks)
+    assert fluid.density.sum() == pytest.approx(mass, rel=1e-12)
+    assert fluid.composite(fluid.fine_density, fluid.density).sum() / ratio ** 2 == pytest.approx(mass, rel=1e-12)
+
+def test_refinement_is_a_fraction_of_the_uniform_grid():
+    fluid = RefinedFluid(60)
+    blob(fluid, 6)
+    for frame in range(0, 20):
+        fluid.step()
+        cells, uniform = fluid.cell_count()
+        assert len(fluid.blocks) and cells < 0.5 * uniform
+
+def test_detail_everywhere_costs_at_most_the_uniform_grid():
+    fluid = RefinedFluid(60, block=15)
+    fluid.density[...] = np.random.default_rng(0).random(fluid.density.shape) * 100
+    fluid.step()
+    cells, uniform = fluid.cell_count()
+    assert len(fluid.blocks) == fluid.patch_limit() and cells <= uniform
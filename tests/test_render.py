@@ -0,0 +1,86 @@
+"""
+Renderer against the per pixel colors it replaces, and the frames of the RenderPipeline.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from fluid import Fluid
+from render import Renderer, RenderPipeline, colormap_lut
+
+def _density(shape=(12, 9)):
+    rng = np.random.default_rng(0)
+    density = rng.uniform(-20, 300, shape)
+    density[0, :4] = [0, 255, 254.999, 1]
+    return density
+
+def test_grey_frame_matches_the_old_frames():
+    # the VideoWriter wrote np.clip(density, 0, 255).astype(np.uint8) before the Renderer
+    density = _density()
+    image = Renderer(vmax=255).render(density, np.zeros((2,) + density.shape))
+    expected = np.clip(density, 0, 255).astype(np.uint8)
+    for channel in range(0, 3):
+        np.testing.assert_array_equal(image[..., channel], expected)
+
+@pytest.mark.parametrize("levels, scale", [(256, 1), (16, 3)])
+def test_lut_matches_the_per_pixel_colors(levels, scale):
+    density = _density()
+    vmin, vmax = 10.0, 200.0
+    renderer = Renderer(vmin=vmin, vmax=vmax, scale=scale, levels=levels)
+    image = renderer.render(density, np.zeros((2,) + density.shape))
+    assert image.shape == (density.shape[0] * scale, density.shape[1] * scale, 3) and image.dtype == np.uint8
+
+    lut = colormap_lut("", levels)
+    for row in range(0, image.shape[0]):
+        for col in range(0, image.shape[1]):
+            value = density[row // scale, col // scale]
+            level = int(min(max((value - vmin) * (levels - 1) / (vmax - vmin), 0), levels - 1))
+            assert tuple(image[row, col]) == tuple(lut[level])
+
+def test_frames_of_another_shape_get_their_buffers():
+    renderer = Renderer(vmax=255)
+    first = renderer.render(_density((6, 6)), np.zeros((2, 6, 6))).copy()
+    second = renderer.render(_density((8, 5)), np.zeros((2, 8, 5)))
+    assert first.shape == (6, 6, 3) and second.shape == (8, 5, 3)
+
+class SlowEncoder:
+    """Keeps a copy of every image, slower than the writer."""
+    def __init__(self):
+        self.images = []
+        self.closed = False
+
+    def append_data(self, image):
+        time.sleep(0.002)
+        self.images.append(image.copy())
+
+    def close(self):
+        self.closed = True
+
+def test_pipeline_writes_every_frame_in_order():
+    renderer = Renderer(vmax=40, qcolor="r")
+    encoder = SlowEncoder()
+    pipeline = RenderPipeline(Renderer(vmax=40, qcolor="r"), encoder, depth=2)
+    fluid = Fluid(20)
+    fluid.velo[8:12, 8:12, 1] = 1.0
+    expected = []
+    for frame in range(0, 25):
+        fluid.density[...] = frame
+        fluid.density[frame % 18 + 1, 3] = 40
+        expected.append(renderer.render(fluid.density, fluid.velo_planes).copy())
+        pipeline.write(fluid)
+    pipeline.close()
+
+    assert encoder.closed and pipeline.allocated <= 2
+    assert len(encoder.images) == len(expected)
+    for image, frame in zip(encoder.images, expected):
+        np.testing.assert_array_equal(image, frame)
+
+def test_pipeline_raises_the_encoder_error():
+    class Broken(SlowEncoder):
+        def append_data(self, image): raise OSError("disk full")
+
+    pipeline = RenderPipeline(Renderer(), Broken())
+    pipeline.write(Fluid(10))
+    with pytest.raises(OSError, match="disk full"):
+        pipeline.close()
@@ -0,0 +1,33 @@
+"""
+The result cache, on its own and through the runner.
+"""
+import os
+
+import numpy as np
+
+from results import ResultCache
+from runner import run
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Config", "Config2.txt")
+
+def test_open_and_evict_create_nothing(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=0)
+    entry = cache.open("missing")
+    assert entry["frames"] == 0 and entry["outputs"] == []
+    cache.evict()
+    assert os.listdir(cache.path) == []
+
+    cache.commit("key", entry)
+    assert os.listdir(cache.path) == ["key"]
+    assert cache.open("key")["used"] > 0
+
+def test_cached_runs_match_straight_runs(tmp_path):
+    cache = str(tmp_path / "cache")
+    output = str(tmp_path / "frames.npy")
+    for frames in [6, 6, 3, 10]:
+        fluid = run(CONFIG, frames, output=output, cache=cache)
+        expected = run(CONFIG, frames)
+        np.testing.assert_array_equal(fluid.density, expected.density)
+        np.testing.assert_array_equal(fluid.velo, expected.velo)
+        assert np.load(output).shape[0] == frames
+    assert len(os.listdir(cache)) == 1
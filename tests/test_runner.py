@@ -0,0 +1,24 @@
+"""
+The command line of the runner.
+"""
+import inspect
+
+import runner
+
+def test_main_passes_every_option_by_name(monkeypatch):
+    parameters = list(inspect.signature(runner.run).parameters)
+    calls = []
+    def run(*args, **kwargs):
+        calls.append((args, kwargs))
+        return runner.Fluid(10)
+    monkeypatch.setattr(runner, "run", run)
+    runner.main(["Config2", "--frames", "7", "--size", "50", "--tile", "8", "--cfl", "2", "--nx", "40", "--spacing", "0.1", "0.2",
+                 "--cache", "cache", "--cache-size", "2", "--boundaries", "left=periodic", "right=periodic", "-t", "3"])
+
+    (args, kwargs), = calls
+    assert args == ("Config2", 7)
+    assert sorted(kwargs) == sorted(parameters[2:])
+    assert kwargs["size"] == 50 and kwargs["tile"] == 8 and kwargs["cfl"] == 2 and kwargs["threads"] == 3
+    assert kwargs["nx"] == 40 and kwargs["ny"] is None and kwargs["spacing"] == [0.1, 0.2]
+    assert kwargs["cache"] == "cache" and kwargs["cache_size"] == 2 * 2 ** 20
+    assert kwargs["boundaries"].state()["left"] == "periodic"
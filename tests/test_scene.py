@@ -0,0 +1,84 @@
+"""
+Config files through load_scene, the errors of the parser and the .scene_cache.
+"""
+import os
+import re
+
+import numpy as np
+import pytest
+
+import scene
+from scene import CACHE_FOLDER, file_hash, load_scene
+
+TEXT = """colormap=bone
+quiver=y
+density=1
+25, 25, 5, 5, 100
+velocity=2
+25, 25, 3, 3, 2, 5
+10, 12, 1, 0, 1
+
+solid=2
+10, 10, 30, 3
+10, 40, 30, 3
+"""
+
+def _write(tmp_path, text, name="Config.txt"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+@pytest.mark.parametrize("text, line", [
+    ("density=1\n1, 2, 3, 4, 5\nsmoke\n", 3),
+    ("density=1\n1, 2, x, 4, 5\n", 2),
+    ("colormap=bone\n\nsolid=2\n1, 1, 2, 2\n1, 1, 0, 2\n", 5),
+    ("velocity=1\n1, 2, 3, 4, 9\n", 2),
+    ("velocity=1\n-1, 2, 3, 4, 1\n", 2),
+    ("solid=1\n1, 1, 2\n", 2),
+    ("solid=3\n1, 1, 2, 2\n", 3),
+    ("density=two\n", 1),
+    ("quiver=y\nquiver=r\n", 2),
+])
+def test_malformed_line_raises_with_its_number(tmp_path, text, line):
+    path = _write(tmp_path, text)
+    for cache in (True, False):
+        with pytest.raises(ValueError, match=f"^{re.escape(path)}:{line}: "):
+            load_scene(path, 50, cache)
+    # nothing is cached for a broken file
+    assert not (tmp_path / CACHE_FOLDER).exists()
+
+def test_cache_hit_returns_the_same_arrays(tmp_path, monkeypatch):
+    path = _write(tmp_path, TEXT)
+    first = load_scene(path, 50)
+    key = file_hash(path)
+    assert sorted(os.listdir(tmp_path / CACHE_FOLDER)) == [f"{key}.npz", f"{key}_50.npz"]
+
+    # a hit neither parses nor compiles
+    def fail(*args, **kwargs): raise AssertionError("the scene was parsed or compiled again")
+    monkeypatch.setattr(scene, "parse_scene", fail)
+    monkeypatch.setattr(scene, "compile_solids", fail)
+    monkeypatch.setattr(scene, "compile_densities", fail)
+    second = load_scene(path, 50)
+    assert (second.colormap, second.qcolor) == (first.colormap, first.qcolor) == ("bone", "y")
+    for name in ("densities", "velocities", "solids"):
+        np.testing.assert_array_equal(getattr(second, name), getattr(first, name))
+    tables, expected = second.compiled[(50, 50)], first.compiled[(50, 50)]
+    for name in ("solid_mask", "density_cells", "density_values"):
+        np.testing.assert_array_equal(tables[name], expected[name])
+    for axis in (0, 1):
+        for index in (0, 1):
+            np.testing.assert_array_equal(tables["solid_faces"][axis][index], expected["solid_faces"][axis][index])
+    for index in (0, 1):
+        np.testing.assert_array_equal(tables["solid_cells"][index], expected["solid_cells"][index])
+
+def test_edited_file_changes_the_key(tmp_path):
+    path = _write(tmp_path, TEXT)
+    first = load_scene(path, 50)
+    key = file_hash(path)
+
+    _write(tmp_path, TEXT.replace("25, 25, 5, 5, 100", "20, 21, 4, 4, 50"))
+    assert file_hash(path) != key
+    second = load_scene(path, 50)
+    np.testing.assert_array_equal(second.densities, [[20, 21, 4, 4, 50]])
+    assert not np.array_equal(second.compiled[(50, 50)]["density_cells"], first.compiled[(50, 50)]["density_cells"])
+    assert len(os.listdir(tmp_path / CACHE_FOLDER)) == 4
@@ -0,0 +1,120 @@
+"""
+Messages, subscribers and commands of the streaming server.
+"""
+import asyncio
+import json
+import zlib
+
+import numpy as np
+
+from density import Density
+from fluid import Fluid
+from server import PREFIX, FrameDecoder, SimulationServer, Subscriber, pack_message, quantize, read_message
+from sources import Sources
+
+def feed(*messages):
+    """A StreamReader holding the bytes of messages."""
+    reader = asyncio.StreamReader()
+    for message in messages:
+        reader.feed_data(message)
+    reader.feed_eof()
+    return reader
+
+def test_message_round_trip():
+    async def read():
+        reader = feed(pack_message({"op": "add", "row": "1, 2"}), pack_message({"type": "frame"}, b"\x00\x01\x02"))
+        return [await read_message(reader), await read_message(reader)]
+    assert asyncio.run(read()) == [({"op": "add", "row": "1, 2"}, b""), ({"type": "frame"}, b"\x00\x01\x02")]
+
+def test_key_and_delta_frames_decode_the_codes():
+    rng = np.random.default_rng(0)
+    decoder = FrameDecoder()
+    codes = None
+    for step in range(1, 5):
+        density, velo = rng.random((12, 12)) * 100, rng.normal(0, 1, (2, 12, 12))
+        new, vscale = quantize(density, velo)
+        header = {"type": "frame", "shape": [12, 12], "vmax": 100.0, "vscale": vscale, "delta": codes is not None}
+        payload = zlib.compress((new - codes if codes is not None else new).tobytes())
+        codes = new
+        decoded, decoded_velo = decoder.decode(header, payload)
+        np.testing.assert_allclose(decoded, density, atol=100 / 255 / 2 + 1e-12)
+        np.testing.assert_allclose(decoded_velo, velo, atol=vscale / 127 / 2 + 1e-12)
+
+class SlowWriter:
+    """The stream of a client that only reads when it is let."""
+    def __init__(self):
+        self.messages = []
+        self.open = asyncio.Event()
+
+    def write(self, data):
+        header_length, payload_length = PREFIX.unpack(data[:PREFIX.size])
+        self.messages.append(json.loads(data[PREFIX.size:PREFIX.size + header_length]))
+
+    async def drain(self):
+        await self.open.wait()
+
+    def is_closing(self):
+        return False
+
+def test_slow_subscriber_drops_old_frames():
+    async def stream():
+        writer = SlowWriter()
+        subscriber = Subscriber(writer, keyframe_every=30)
+        sender = asyncio.create_task(subscriber.send_frames())
+        codes = np.zeros((3, 4, 4), dtype=np.uint8)
+        for step in range(1, 6):
+            subscriber.offer((step, codes, {"type": "frame", "shape": [4, 4]}))
+            await asyncio.sleep(0)
+        writer.open.set()
+        await asyncio.sleep(0.01)
+        sender.cancel()
+        return writer.messages
+    messages = asyncio.run(stream())
+    # the first frame is sent at once, the client reads it while the frames 2 to 4 are replaced by the 5th
+    assert [message["step"] for message in messages] == [1, 5]
+    assert messages[-1]["dropped"] == 3 and messages[-1]["delta"]
+
+async def command(reader, writer, header):
+    """Sends a command and waits for its reply, skipping the frames."""
+    writer.write(header if isinstance(header, bytes) else pack_message(header))
+    while True:
+        reply, _ = await read_message(reader)
+        if reply["type"] != "frame": return reply
+
+def test_commands(tmp_path):
+    fluid = Fluid(40)
+    sources = Sources([Density(10, 10, 4, 4)])
+    server = SimulationServer(fluid, sources, [], fps=200)
+    path = str(tmp_path / "server.sock")
+
+    async def session():
+        task = asyncio.create_task(server.serve(path=path))
+        while server.server is None: await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(path)
+        replies = [
+            await command(reader, writer, {"op": "add", "section": "velocity", "row": "20, 20, 1, 1, 1, 0"}),
+            await command(reader, writer, {"op": "set", "section": "density", "index": 0, "row": "5, 5, 3, 3, 50"}),
+            await command(reader, writer, {"op": "add", "section": "solid", "row": "30, 30, 4, 4"}),
+            await command(reader, writer, {"op": "remove", "section": "velocity", "index": 0}),
+            # invalid commands, each one answered with an error and the connection kept
+            await command(reader, writer, {"op": "add", "section": "velocity", "row": "100, 100, 1, 1, 1, 0"}),
+            await command(reader, writer, {"op": "add", "section": "velocity", "row": "30, 20, 1, 1, 4, 15"}),
+            await command(reader, writer, {"op": "set", "section": "density", "index": 0, "row": "36, 5, 8, 3, 50"}),
+            await command(reader, writer, {"op": "remove", "section": "solid", "index": 3}),
+            await command(reader, writer, {"op": "move", "section": "solid"}),
+            await command(reader, writer, PREFIX.pack(9, 0) + b"not json!"),
+            await command(reader, writer, {"op": "add", "section": "density", "row": "1, 1, 2, 2, 10"}),
+        ]
+        steps = server.steps
+        while server.steps < steps + 2: await asyncio.sleep(0.01)
+        writer.close()
+        server.stop()
+        await task
+        return replies
+
+    replies = asyncio.run(session())
+    assert [reply["type"] for reply in replies] == ["ack"] * 4 + ["error"] * 6 + ["ack"]
+    assert all("grid" in reply["message"] for reply in replies[4:7])
+    assert server.error is None
+    assert [str(den) for den in sources.densities] == ["5, 5, 3, 3, 50", "1, 1, 2, 2, 10"] and not sources.velocities
+    assert [str(sol) for sol in server.solids] == ["30, 30, 4, 4"] and fluid.solid_mask[31, 31]
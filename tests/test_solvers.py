@@ -0,0 +1,55 @@
+"""
+Linear solvers of lin_solve on the pressure system of a Fluid.
+"""
+import numpy as np
+import pytest
+
+from boundaries import Boundaries
+from ensemble import EnsembleFluid
+from fluid import Fluid
+from solvers import CGSolver, Solver, make_solver, residual
+
+@pytest.mark.parametrize("n", [6, 20, 21, 33])
+def test_multigrid_preconditioner_is_symmetric(n):
+    rng = np.random.default_rng(n)
+    solver = CGSolver("multigrid")
+    r1, r2 = rng.random((n, n)), rng.random((n, n))
+    left = np.vdot(solver._precondition(r1, 1, 6), r2)
+    right = np.vdot(r1, solver._precondition(r2, 1, 6))
+    assert left == pytest.approx(right, rel=1e-12)
+
+@pytest.mark.parametrize("name", ["jacobi", "sor", "multigrid", "cg"])
+@pytest.mark.parametrize("n", [24, 33])
+def test_solver_reaches_tolerance(name, n):
+    rng = np.random.default_rng(0)
+    x0 = np.zeros((n, n))
+    x0[1:-1, 1:-1] = rng.normal(size=(n - 2, n - 2))
+    x = np.zeros((n, n))
+    solver = make_solver(name, tol=1e-6, max_iter=20000)
+    iterations, res = solver._solve(x, x0, 1, 4.5, solver.max_iter)
+    assert iterations < solver.max_iter
+    assert np.linalg.norm(residual(x, x0, 1, 4.5)) / np.linalg.norm(x0) <= 1e-6
+
+def test_solver_without_solve_is_rejected():
+    class Incomplete(Solver):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+@pytest.mark.parametrize("name", ["sor", "multigrid", "cg"])
+def test_solver_rejects_open_boundaries(name):
+    fluid = Fluid(20, name)
+    fluid.step()
+    fluid.boundaries = Boundaries(left="periodic", right="periodic")
+    with pytest.raises(ValueError, match="use the jacobi solver"):
+        fluid.step()
+    ensemble = EnsembleFluid(2, 20, solver=name)
+    ensemble.boundaries = Boundaries(right="outflow")
+    with pytest.raises(ValueError, match="use the jacobi solver"):
+        ensemble.step()
+
+def test_jacobi_runs_open_boundaries():
+    fluid = Fluid(20, "jacobi")
+    fluid.boundaries = Boundaries(left="inflow", right="outflow", profiles={"left": [0.0, 0.5]})
+    fluid.step()
@@ -0,0 +1,45 @@
+"""
+Sources against add_velocity and maintain_step, on the cells they write.
+"""
+import numpy as np
+import pytest
+
+from assets import add_solid, add_velocity
+from density import Solid
+from fluid import Fluid
+from sources import Sources
+from velocity import Velocity, VelocityAnimation
+
+def test_negative_positions_index_like_add_velocity():
+    velocities = [Velocity(5, 4, 1, 2), Velocity(-1, -2, 3, 4), Velocity(0, -30, 5, 6)]
+    expected = Fluid(30)
+    for vel in velocities:
+        add_velocity(expected, vel)
+    fluid = Fluid(30)
+    Sources(velocities=velocities).scatter(fluid)
+    np.testing.assert_array_equal(fluid.velo, expected.velo)
+
+@pytest.mark.parametrize("position", [(30, 5), (5, 30), (-31, 0), (0, -31)])
+def test_velocity_outside_the_grid_raises(position):
+    with pytest.raises(IndexError):
+        add_velocity(Fluid(30), Velocity(*position, 1, 1))
+    with pytest.raises(IndexError, match="outside the grid"):
+        Sources(velocities=[Velocity(*position, 1, 1)]).scatter(Fluid(30))
+
+def test_returning_velocity_leaving_the_grid_raises():
+    sources = Sources(velocities=[Velocity(28, 10, 1, 1, VelocityAnimation.RETURN_X, 5)])
+    fluid = Fluid(30)
+    with pytest.raises(IndexError, match="outside the grid"):
+        for frame in range(0, 5):
+            sources.apply(fluid)
+
+def test_add_solid_compiles_the_solids():
+    fluid = Fluid(30)
+    fluid.density[...] = 1
+    fluid.velo = np.ones(fluid.velo.shape)
+    add_solid(fluid, Solid(5, 6, 4, 3))
+    expected = Fluid(30)
+    expected.set_solids([Solid(5, 6, 4, 3)])
+    assert [str(sol) for sol in fluid.solid] == [str(sol) for sol in expected.solid]
+    np.testing.assert_array_equal(fluid.solid_mask, expected.solid_mask)
+    assert not fluid.density[fluid.solid_mask].any() and not fluid.velo[fluid.solid_mask].any()
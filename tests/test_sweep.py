@@ -0,0 +1,20 @@
+"""
+Cases of the parameter sweeps.
+"""
+import os
+
+import pytest
+
+from scene import load_scene
+from sweep import scenario_grid
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Config", "Config4.txt")
+
+def test_extent_covers_the_objects():
+    # the velocity at 30 returns over 10 cells, the solids end at 40
+    assert load_scene(CONFIG, cache=False).extent() == (41, 41)
+
+def test_grid_rejects_sizes_smaller_than_the_scene():
+    assert len(scenario_grid([CONFIG], size=(41, 60))) == 2
+    with pytest.raises(ValueError, match="at least 41 cells"):
+        scenario_grid([CONFIG], size=(30, 60))
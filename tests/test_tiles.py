@@ -0,0 +1,54 @@
+"""
+ActiveTiles against the full grid, with every tile active and with calm tiles.
+"""
+import numpy as np
+
+from fluid import Fluid
+from tiles import ActiveTiles
+
+def _fluid(tiles=None, spacing=None):
+    fluid = Fluid(64, spacing=spacing)
+    fluid.diff = 0.0001
+    fluid.visc = 0.0001
+    fluid.density[8:14, 8:14] = 1.0
+    fluid.velo[8:14, 8:14, 0] = 0.5
+    fluid.velo[8:14, 8:14, 1] = 0.25
+    fluid.tiles = tiles
+    return fluid
+
+def test_all_tiles_active_matches_the_full_run():
+    for spacing in (None, (0.02, 0.01)):
+        expected = _fluid(spacing=spacing)
+        fluid = _fluid(ActiveTiles(16, threshold=-1), spacing)
+        for frame in range(0, 6):
+            expected.step()
+            fluid.step()
+        assert fluid.tiles.fraction() == 1.0
+        np.testing.assert_array_equal(fluid.density, expected.density)
+        np.testing.assert_array_equal(fluid.velo, expected.velo)
+
+def test_calm_region_stays_unchanged():
+    fluid = _fluid(ActiveTiles(16))
+    fluid.velo[...] = 0
+    fluid.density[...] = 0
+    fluid.density[8:14, 8:14] = 1.0
+    for frame in range(0, 4):
+        fluid.step()
+        # the tiles far from the density are calm, nothing reaches their density nor the target of its diffusion
+        assert not fluid.tiles.active[2:, 2:].any()
+        assert not fluid.density[33:, 33:].any()
+        assert not fluid.s[33:, 33:].any()
+    assert fluid.density[8:14, 8:14].sum() > 0
+
+def test_keep_gives_the_calm_cells_the_source():
+    fluid = _fluid(ActiveTiles(16))
+    fluid.tiles.update(fluid)
+    x = np.full(fluid.density.shape, 7.0)
+    x0 = np.arange(x.size, dtype=float).reshape(x.shape)
+    fluid.tiles.keep(x, x0)
+    inner = np.zeros(x.shape, dtype=bool)
+    inner.flat[fluid.tiles.cells] = True
+    assert (x[inner] == 7.0).all()
+    outside = ~inner
+    outside[0, :] = outside[-1, :] = outside[:, 0] = outside[:, -1] = False
+    np.testing.assert_array_equal(x[outside], x0[outside])
@@ -0,0 +1,73 @@
+"""
+Scalars and particles of the tracers against the density of the Fluid and the motions they should follow.
+"""
+import numpy as np
+
+from boundaries import Boundaries
+from density import Solid
+from fluid import Fluid
+from tracers import Particles, ScalarStack
+
+def test_single_scalar_matches_the_density():
+    fluid = Fluid(40)
+    fluid.diff = 0.0001
+    fluid.visc = 0.0001
+    fluid.density[10:20, 12:18] = 50.0
+    fluid.velo[5:30, 5:30, 0] = 0.3
+    fluid.velo[5:30, 5:30, 1] = -0.2
+    fluid.set_solids([Solid(25, 25, 4, 4)])
+    fluid.scalars = ScalarStack(["dye"], fluid, fluid.diff)
+    fluid.scalars["dye"][...] = fluid.density
+    for frame in range(0, 6):
+        fluid.step()
+        np.testing.assert_array_equal(fluid.scalars["dye"], fluid.density)
+    assert fluid.density.any()
+
+def _particles_step(fluid, y, x):
+    particles = Particles(y, x)
+    particles.step(fluid)
+    return particles
+
+def test_particles_are_advected_with_a_midpoint_step():
+    fluid = Fluid(40)
+    dty = fluid.dt * fluid.scale[0]
+    dtx = fluid.dt * fluid.scale[1]
+    # a shear, the x velocity grows with the row, which the bilinear sampling gives exactly
+    rows = np.arange(40, dtype=float)[:, None]
+    fluid.velo[..., 0] = 0.05
+    fluid.velo[..., 1] = 0.002 * rows
+    y, x = np.array([10.0, 15.25, 20.5]), np.array([8.0, 12.5, 9.75])
+    particles = _particles_step(fluid, y, x)
+
+    np.testing.assert_allclose(particles.y, y + dty * 0.05)
+    # the x velocity is sampled half way along the move, not at the start like an Euler step
+    np.testing.assert_allclose(particles.x, x + dtx * 0.002 * (y + 0.5 * dty * 0.05))
+    assert not np.allclose(particles.x, x + dtx * 0.002 * y)
+
+def test_particles_do_not_enter_solids():
+    fluid = Fluid(40)
+    fluid.set_solids([Solid(20, 10, 5, 20)])
+    fluid.velo[..., 1] = 1.0 / (fluid.dt * fluid.scale[1])  # a cell per substep to the right
+    particles = Particles(np.linspace(11, 28, 30), np.full(30, 12.0))
+    for frame in range(0, 20):
+        particles.step(fluid)
+        cells = Particles.cells(particles.y, particles.x, 40)
+        assert not fluid.solid_mask.reshape(-1)[cells].any()
+    # they pile up against the face of the solid
+    np.testing.assert_allclose(particles.x, 19.0)
+
+def test_particles_leave_through_outflow_edges():
+    fluid = Fluid(30)
+    fluid.velo[..., 1] = 2.0 / (fluid.dt * fluid.scale[1])  # two cells per substep to the right
+    y, x = np.full(4, 15.0), np.array([5.0, 20.0, 26.0, 27.6])
+
+    # the outflow removes the particles that crossed it, the others move on
+    fluid.boundaries = Boundaries(right="outflow")
+    particles = _particles_step(fluid, y, x)
+    np.testing.assert_allclose(particles.x, [7.0, 22.0, 28.0])
+
+    # a wall keeps them inside the grid
+    fluid.boundaries = Boundaries()
+    particles = _particles_step(fluid, y, x)
+    assert len(particles) == 4
+    np.testing.assert_allclose(particles.x, [7.0, 22.0, 28.0, 28.5])
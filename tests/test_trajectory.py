@@ -0,0 +1,81 @@
+"""
+Frames written by the TrajectoryWriter and read back by the TrajectoryReader.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from fluid import Fluid
+from trajectory import TrajectoryReader, TrajectoryWriter
+
+def _frames(count, shape=(6, 5)):
+    """Fluids with a different density and velocity at every step."""
+    rng = np.random.default_rng(0)
+    fluid = Fluid(nx=shape[1], ny=shape[0])
+    for step in range(0, count):
+        fluid.density[...] = rng.random(shape) * 100
+        fluid.velo = rng.random(shape + (2,)) - 0.5
+        yield fluid
+
+def _write(path, count, precision="float32", stride=1, chunk_frames=4):
+    writer = TrajectoryWriter(path, precision, stride, chunk_frames)
+    expected = []
+    for step, fluid in enumerate(_frames(count)):
+        writer.write(fluid)
+        if step % stride == 0: expected.append((fluid.density.copy(), fluid.velo.copy()))
+    writer.close()
+    return expected
+
+def _check(reader, expected, dtype):
+    assert len(reader) == len(expected)
+    for index, (density, velo) in enumerate(expected):
+        frame = reader[index]
+        assert frame["density"].dtype == frame["velo"].dtype == dtype
+        np.testing.assert_array_equal(frame["density"], density.astype(dtype))
+        np.testing.assert_array_equal(frame["velo"], velo.astype(dtype))
+    streamed = list(reader.frames())
+    assert [index for index, frame in streamed] == list(range(0, len(expected)))
+    for (index, frame), (density, velo) in zip(streamed, expected):
+        np.testing.assert_array_equal(frame["density"], density.astype(dtype))
+        np.testing.assert_array_equal(frame["velo"], velo.astype(dtype))
+
+@pytest.mark.parametrize("precision, dtype", [("float64", np.float64), ("float32", np.float32), ("float16", np.float16)])
+@pytest.mark.parametrize("stride", [1, 3])
+def test_round_trip_across_chunks(tmp_path, precision, dtype, stride):
+    path = str(tmp_path / "run.traj")
+    expected = _write(path, 23, precision, stride)
+    # 23 frames, or 8 with a stride of 3, over chunks of 4 with an incomplete last chunk
+    assert len(expected) == (23 if stride == 1 else 8)
+    assert len([name for name in os.listdir(path) if name.startswith("chunk_")]) == -(-len(expected) // 4)
+
+    reader = TrajectoryReader(path)
+    assert reader.meta["shape"] == [6, 5] and reader.meta["precision"] == precision
+    assert reader.step_of(2) == 2 * stride + 1
+    _check(reader, expected, dtype)
+    np.testing.assert_array_equal(reader[-1]["density"], expected[-1][0].astype(dtype))
+    with pytest.raises(IndexError):
+        reader[len(expected)]
+
+    # a slice of the stream, and a single field
+    assert [index for index, frame in reader.frames(1, 7, 2)] == [1, 3, 5]
+    density = TrajectoryReader(path, fields=("density",))[5]
+    assert list(density) == ["density"]
+
+def test_reopening_with_keep_appends(tmp_path):
+    path = str(tmp_path / "run.traj")
+    expected = _write(path, 30, stride=3)
+
+    # the first 6 frames kept, inside the second chunk, then the steps after them written again
+    writer = TrajectoryWriter(path, "float32", 3, 4, keep=6)
+    assert len(TrajectoryReader(path)) == 6
+    for step, fluid in enumerate(_frames(30)):
+        if step >= 18: writer.write(fluid)
+    writer.close()
+    _check(TrajectoryReader(path), expected, np.float32)
+
+    # another precision or stride is refused, as are frames the trajectory does not have
+    with pytest.raises(ValueError, match="precision"):
+        TrajectoryWriter(path, "float16", 3, 4, keep=2)
+    with pytest.raises(ValueError, match="can not be kept"):
+        TrajectoryWriter(path, "float32", 3, 4, keep=11)
@@ -0,0 +1,152 @@
+"""
+Active tiles of a Fluid, the advection and the density diffusion only run where the flow is.
+
+The grid is split into square tiles. Before every substep a tile is flagged active when the density, the
+velocity or the divergence of one of its cells passes the threshold, and the flags are dilated by margin
+tiles, so the tiles wake up before the flow reaches them and go back to sleep when it leaves. Outside the
+active tiles the velocity is under the threshold, the backtraces stay in their cell and the fields are
+copied as they are.
+
+Usage:
+    fluid.tiles = ActiveTiles(tile=16)
+    fluid.step()
+    print(fluid.tiles.fraction())
+"""
+import numpy as np
+
+class ActiveTiles:
+    """Tracks the active tiles of a Fluid and runs the advection and the density diffusion on their cells.
+    """
+    def __init__(self, tile=16, threshold=1e-4, margin=1):
+        """Creates the ActiveTiles.
+
+        Args:
+            tile (int, optional): Cells per tile along each axis. Defaults to 16.
+            threshold (float, optional): Absolute density, velocity component or divergence that wakes a tile. Defaults to 1e-4.
+            margin (int, optional): Tiles woken around every active tile. Defaults to 1.
+        """
+        self.tile = tile
+        self.threshold = threshold
+        self.margin = margin
+        self.active = None  # mask of the active tiles
+        self.cells = None   # flat indices of the interior cells of the active tiles
+        self.buffers = None
+
+    def fraction(self):
+        """Fraction of the tiles that are active."""
+        return 0.0 if self.active is None else float(self.active.mean())
+
+    def update(self, fluid):
+        """Flags the active tiles from the fields of the Fluid and lists their cells.
+
+        Args:
+            fluid (Fluid): The Fluid, before its substep.
+        """
+        rows, cols = fluid.density.shape
+        if self.buffers is None or self.buffers[0].shape != (rows, cols):
+            self.buffers = (np.zeros((rows, cols)), np.zeros((rows, cols)), np.zeros((rows - 2, cols - 2)))
+        level, term, other = self.buffers
+
+        # largest of the absolute density, velocity components and divergence of every cell
+        vy, vx = fluid.velo_planes
+        np.abs(fluid.density, out=level)
+        np.abs(vy, out=term)
+        np.maximum(level, term, out=level)
+        np.abs(vx, out=term)
+        np.maximum(level, term, out=level)
+        # the divergence of Fluid.project, with the scales of both axes on cells that are not square
+        scale_y, scale_x = fluid.project_scale
+        inner = term[1:-1, 1:-1]
+        np.subtract(vy[2:, 1:-1], vy[:-2, 1:-1], out=inner)
+        if scale_y == scale_x:
+            inner += vx[1:-1, 2:]
+            inner -= vx[1:-1, :-2]
+            np.abs(inner, out=inner)
+            inner *= 0.5 / scale_y
+        else:
+            inner /= scale_x
+            np.subtract(vx[1:-1, 2:], vx[1:-1, :-2], out=other)
+            other /= scale_y
+            inner += other
+            np.abs(inner, out=inner)
+            inner *= 0.5
+        np.maximum(level[1:-1, 1:-1], inner, out=level[1:-1, 1:-1])
+
+        # largest of every tile, the bands of rows first, each of them a contiguous block
+        band_starts = np.arange(0, rows, self.tile)
+        bands = np.empty((len(band_starts), cols))
+        for band, start in enumerate(band_starts):
+            np.max(level[start:start + self.tile], axis=0, out=bands[band])
+        active = np.maximum.reduceat(bands, np.arange(0, cols, self.tile), axis=1) > self.threshold
+
+        for step in range(0, self.margin):
+            grown = active.copy()
+            grown[1:, :] |= active[:-1, :]
+            grown[:-1, :] |= active[1:, :]
+            grown[:, 1:] |= active[:, :-1]
+            grown[:, :-1] |= active[:, 1:]
+            active = grown
+        self.active = active
+
+        # cells of every active tile, without the edges of the grid
+        tile_rows, tile_cols = np.nonzero(active)
+        offsets = np.arange(self.tile)
+        cell_rows = (tile_rows * self.tile)[:, None] + offsets
+        cell_cols = (tile_cols * self.tile)[:, None] + offsets
+        inside = ((cell_rows >= 1) & (cell_rows < rows - 1))[:, :, None] & ((cell_cols >= 1) & (cell_cols < cols - 1))[:, None, :]
+        self.cells = np.sort((cell_rows[:, :, None] * cols + cell_cols[:, None, :])[inside])
+
+    def advect(self, d, d0, velocity, dtx, dty):
+        """Semi-Lagrangian advection of the active cells, the same operations as NumpyKernels.advect.
+        The other interior cells keep the values of d0, the edges are left to the boundaries."""
+        rows, cols = d.shape
+        cells = self.cells
+        np.copyto(d[1:-1, 1:-1], d0[1:-1, 1:-1])
+        flat = d0.reshape(-1)
+
+        x = (cells // cols).astype(d.dtype)
+        x -= velocity[..., 0].take(cells) * dtx
+        y = (cells % cols).astype(d.dtype)
+        y -= velocity[..., 1].take(cells) * dty
+        np.clip(x, 0.5, (rows - 1) - 0.5, out=x)
+        np.clip(y, 0.5, (cols - 1) - 0.5, out=y)
+
+        s0 = np.floor(x)
+        s1 = x - s0
+        t0 = np.floor(y)
+        t1 = y - t0
+        index = s0.astype(np.intp) * cols + t0.astype(np.intp)
+        s0 = 1.0 - s1
+        t0 = 1.0 - t1
+
+        g = flat.take(index, mode="clip") * t0
+        g += flat.take(index + 1, mode="clip") * t1
+        g *= s0
+        h = flat.take(index + cols, mode="clip") * t0
+        h += flat.take(index + cols + 1, mode="clip") * t1
+        h *= s1
+        g += h
+        np.put(d, cells, g)
+
+    def keep(self, x, x0):
+        """Gives the interior cells of x outside the active tiles the values of x0, before the sweeps of jacobi,
+        so they do not keep what an earlier substep left there. The active cells keep their values."""
+        values = x.take(self.cells)
+        np.copyto(x[1:-1, 1:-1], x0[1:-1, 1:-1])
+        np.put(x, self.cells, values)
+
+    def jacobi(self, x, x0, a, c_recip):
+        """Jacobi sweep over the active cells of a 2d array, the other cells are left as they are.
+        The neighbours are read before any cell is written, like the sweeps of the kernels."""
+        cols = x.shape[1]
+        cells = self.cells
+        out = x.take(cells + cols) + x.take(cells - cols)
+        if isinstance(a, tuple):
+            out *= a[0] / a[1]
+            a = a[1]
+        out += x.take(cells + 1)
+        out += x.take(cells - 1)
+        out *= a
+        out += x0.take(cells)
+        out *= c_recip
+        np.put(x, cells, out)
@@ -0,0 +1,239 @@
+"""
+Passive tracers carried by the velocity of a Fluid: a stack of scalar fields and a set of particles.
+
+ScalarStack holds several scalars (temperature, dyes...) as a single array (scalars, rows, cols). They are advected
+together, the backtrace and the weights of every cell computed once for all of them. Particles keeps its particles
+as arrays of coordinates, moved by the velocity sampled bilinearly with a midpoint (RK2) step. A particle that would
+enter a solid stays where it was.
+
+Both are coordinates of the grid: a cell (row, col) is centered on y = row, x = col, like in the advection.
+
+Usage:
+    fluid.scalars = ScalarStack(["temperature", "dye"], fluid)
+    fluid.particles = Particles.seed(100000, 10, 10, 20, 20)
+    for frame in range(0, frames):
+        fluid.scalars["dye"][10:20, 10:20] = 1
+        fluid.step()
+    counts = fluid.particles.bins(fluid.density.shape, 4)
+"""
+import numpy as np
+
+from boundaries import Boundaries
+
+class ScalarStack:
+    """Passive scalars of a Fluid, diffused and advected after the density at every substep.
+    """
+    def __init__(self, names: list, fluid, diff=0.0):
+        """Creates a ScalarStack with every scalar at 0.
+
+        Args:
+            names (list): The names of the scalars.
+            fluid (Fluid): The Fluid whose grid and precision the scalars take.
+            diff (float or list, optional): Diffusion of every scalar, or of each one. Defaults to 0.0.
+        """
+        self.names = list(names)
+        self.diff = np.broadcast_to(np.asarray(diff, dtype=float), (len(self.names),)).tolist()
+        shape = (len(self.names),) + fluid.density.shape
+        self.fields = np.zeros(shape, dtype=fluid.dtype)    # current scalars
+        self.previous = np.zeros(shape, dtype=fluid.dtype)  # scalars before the advection
+
+    def __len__(self):
+        """Number of scalars."""
+        return len(self.names)
+
+    def __getitem__(self, name: str):
+        """The field of a scalar, a view into the stack."""
+        return self.fields[self.names.index(name)]
+
+    def step(self, fluid):
+        """Diffuses and advects every scalar over a substep of the Fluid, like its density.
+
+        Args:
+            fluid (Fluid): The Fluid, after the advection of its density.
+        """
+        for index, diff in enumerate(self.diff):
+            fluid.diffuse(self.previous[index], self.fields[index], diff)
+        self.advect(fluid)
+
+    def advect(self, fluid):
+        """Semi-Lagrangian advection of the whole stack by the velocity of the Fluid, the same operations
+        as NumpyKernels.advect, with the backtrace and the neighbours of every cell found once for all the scalars."""
+        d, d0 = self.fields, self.previous
+        n0, n1 = d.shape[-2:]
+        velocity = fluid.velo
+        rows = np.arange(1, n0 - 1, dtype=d.dtype)[:, None]
+        cols = np.arange(1, n1 - 1, dtype=d.dtype)[None, :]
+
+        x = rows - velocity[1:-1, 1:-1, 0] * (fluid.dt * fluid.scale[0])
+        y = cols - velocity[1:-1, 1:-1, 1] * (fluid.dt * fluid.scale[1])
+        fluid.boundaries.limit(x, 0, n0)
+        fluid.boundaries.limit(y, 1, n1)
+
+        s0 = np.floor(x)
+        s1 = x - s0
+        t0 = np.floor(y)
+        t1 = y - t0
+        corners = [s0.astype(np.intp) * n1 + t0.astype(np.intp)]
+        corners += [corners[0] + 1, corners[0] + n1, corners[0] + n1 + 1]
+        s0 = 1.0 - s1
+        t0 = 1.0 - t1
+
+        # one scalar at a time through the same buffers, they stay in the cache
+        g, h = x, y
+        for field, field0 in zip(d, d0):
+            flat = field0.reshape(-1)
+            np.take(flat, corners[0], out=g, mode="clip")
+            g *= t0
+            np.take(flat, corners[1], out=h, mode="clip")
+            h *= t1
+            g += h
+            g *= s0
+            np.take(flat, corners[2], out=h, mode="clip")
+            h *= t0
+            h += flat.take(corners[3], mode="clip") * t1
+            h *= s1
+            np.add(g, h, out=field[1:-1, 1:-1])
+            fluid.set_boundaries(field)
+        d[(slice(None),) + tuple(fluid.solid_cells)] = 0
+
+class Particles:
+    """Lagrangian particles as arrays of coordinates, moved by the velocity of a Fluid at every substep.
+    """
+    def __init__(self, y=(), x=()):
+        """Creates Particles.
+
+        Args:
+            y (np.ndarray, optional): The row coordinates. Defaults to ().
+            x (np.ndarray, optional): The column coordinates. Defaults to ().
+        """
+        self.y = np.array(y, dtype=float).reshape(-1)
+        self.x = np.array(x, dtype=float).reshape(-1)
+
+    @classmethod
+    def seed(cls, count: int, pos_x: int, pos_y: int, size_x: int, size_y: int, rng=None):
+        """Creates Particles spread uniformly over a rectangle of cells, given like a Density.
+
+        Args:
+            count (int): The number of particles.
+            pos_x (int): The first column of the rectangle.
+            pos_y (int): The first row of the rectangle.
+            size_x (int): The width of the rectangle.
+            size_y (int): The height of the rectangle.
+            rng (np.random.Generator, optional): The random generator. Defaults to None.
+                None: A generator seeded with 0, seeding is reproducible.
+
+        Returns:
+            Particles: The particles.
+        """
+        if rng is None: rng = np.random.default_rng(0)
+        return cls(pos_y - 0.5 + rng.random(count) * size_y, pos_x - 0.5 + rng.random(count) * size_x)
+
+    def __len__(self):
+        """Number of particles."""
+        return len(self.y)
+
+    def add(self, y, x):
+        """Adds particles at coordinates."""
+        self.y = np.concatenate([self.y, np.asarray(y, dtype=float).reshape(-1)])
+        self.x = np.concatenate([self.x, np.asarray(x, dtype=float).reshape(-1)])
+
+    def remove(self, mask):
+        """Removes the particles where a mask is True."""
+        keep = ~np.asarray(mask)
+        self.y = self.y[keep]
+        self.x = self.x[keep]
+
+    def sample(self, velo_planes, y, x, boundaries=None):
+        """Velocity at coordinates, bilinear between the cells like the advection.
+
+        Args:
+            velo_planes (np.ndarray): The velocity as component planes [y, x].
+            y (np.ndarray): The row coordinates, kept inside the grid.
+            x (np.ndarray): The column coordinates, kept inside the grid.
+            boundaries (Boundaries, optional): The boundaries of the grid, see Boundaries.limit. Defaults to None.
+                None: Reflective walls, the coordinates are clamped.
+
+        Returns:
+            [np.ndarray, np.ndarray]
+                np.ndarray: The y component.
+                np.ndarray: The x component.
+        """
+        n0, n1 = velo_planes.shape[-2:]
+        if boundaries is None: boundaries = Boundaries()
+        y = np.array(y, dtype=float)
+        x = np.array(x, dtype=float)
+        boundaries.limit(y, 0, n0)
+        boundaries.limit(x, 1, n1)
+        s0 = np.floor(y)
+        s1 = y - s0
+        t0 = np.floor(x)
+        t1 = x - t0
+        index = s0.astype(np.intp) * n1 + t0.astype(np.intp)
+        s0 = 1.0 - s1
+        t0 = 1.0 - t1
+
+        corners = [index, index + 1, index + n1, index + n1 + 1]
+        sampled = []
+        for plane in velo_planes:
+            flat = plane.reshape(-1)
+            g = flat.take(corners[0], mode="clip") * t0
+            g += flat.take(corners[1], mode="clip") * t1
+            g *= s0
+            h = flat.take(corners[2], mode="clip") * t0
+            h += flat.take(corners[3], mode="clip") * t1
+            h *= s1
+            g += h
+            sampled.append(g)
+        return sampled[0], sampled[1]
+
+    def step(self, fluid):
+        """Moves every particle over a substep of the Fluid with a midpoint step.
+        A particle whose move ends in a solid keeps its position. The particles wrap around the periodic edges,
+        leave the grid through the outflow edges and stay inside the others.
+
+        Args:
+            fluid (Fluid): The Fluid, after its substep.
+        """
+        n0, n1 = fluid.density.shape
+        dty = fluid.dt * fluid.scale[0]
+        dtx = fluid.dt * fluid.scale[1]
+        planes = fluid.velo_planes
+        boundaries = fluid.boundaries
+
+        vy, vx = self.sample(planes, self.y, self.x, boundaries)
+        vy, vx = self.sample(planes, self.y + 0.5 * dty * vy, self.x + 0.5 * dtx * vx, boundaries)
+        y = self.y + dty * vy
+        x = self.x + dtx * vx
+        gone = boundaries.outflow_mask(y, x, (n0, n1))
+        for axis, (coords, length) in enumerate([(y, n0), (x, n1)]):
+            if boundaries.periodic[axis]:
+                np.mod(coords - 0.5, length - 2, out=coords)
+                coords += 0.5
+            else:
+                np.clip(coords, 0.5, (length - 1) - 0.5, out=coords)
+
+        # the cell of the new positions, the moves into a solid are rejected
+        blocked = fluid.solid_mask.reshape(-1).take(self.cells(y, x, n1))
+        self.y = np.where(blocked, self.y, y)
+        self.x = np.where(blocked, self.x, x)
+        if gone.any(): self.remove(gone)
+
+    @staticmethod
+    def cells(y, x, cols: int):
+        """Flat index of the cell of coordinates, in a grid of cols columns."""
+        return np.floor(y + 0.5).astype(np.intp) * cols + np.floor(x + 0.5).astype(np.intp)
+
+    def bins(self, shape: tuple, factor=1):
+        """Number of particles in every block of factor x factor cells, a density of the particles.
+
+        Args:
+            shape (tuple): The shape of the grid (rows, cols).
+            factor (int, optional): Cells per side of the blocks. Defaults to 1.
+
+        Returns:
+            np.ndarray: The counts, of shape (ceil(rows / factor), ceil(cols / factor)).
+        """
+        rows, cols = -(-shape[0] // factor), -(-shape[1] // factor)
+        row = np.clip(np.floor(self.y + 0.5).astype(np.intp) // factor, 0, rows - 1)
+        col = np.clip(np.floor(self.x + 0.5).astype(np.intp) // factor, 0, cols - 1)
+        return np.bincount(row * cols + col, minlength=rows * cols).reshape(rows, cols)
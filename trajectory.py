@@ -0,0 +1,198 @@
+"""
+Trajectory store, keeps the density and the velocity of every frame of a run in compressed chunks on disk.
+
+A trajectory is a folder:
+    meta.json: Shape, precision, stride, chunk length and number of frames.
+    chunk_000000.npz, chunk_000001.npz...: Compressed arrays density (frames, size, size) and velo (frames, size, size, 2).
+"""
+import json
+import os
+
+import numpy as np
+
+PRECISIONS = {"float64": np.float64, "float32": np.float32, "float16": np.float16}
+
+class TrajectoryWriter:
+    """Appends the frames of a Fluid to a trajectory, one chunk at a time.
+    It can be used as the output of the runner.
+    """
+    def __init__(self, path: str, precision="float32", stride=1, chunk_frames=32, keep=0, steps=None):
+        """Creates a TrajectoryWriter, an existing trajectory in the same folder is replaced.
+
+        Args:
+            path (str): The folder of the trajectory.
+            precision (str, optional): "float64", "float32" or "float16". Defaults to "float32".
+            stride (int, optional): Only every stride-th frame written is kept. Defaults to 1.
+            chunk_frames (int, optional): Frames per chunk file. Defaults to 32.
+            keep (int, optional): Frames of the existing trajectory kept, the new frames are appended after them. Defaults to 0.
+                The simulation continues from the step after the last frame kept, the trajectory must have the same precision, stride and chunk_frames.
+            steps (int, optional): Steps of the simulation behind the frames kept, the stride goes on from them. Defaults to None.
+                None: keep * stride, the step after the last frame kept is on the stride.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}, expected one of {', '.join(PRECISIONS)}")
+        self.path = path
+        self.dtype = PRECISIONS[precision]
+        self.precision = precision
+        self.stride = stride
+        self.chunk_frames = chunk_frames
+
+        self.steps = 0
+        self.frames = 0
+        self.chunks = 0
+        self.density = None
+        self.velo = None
+
+        os.makedirs(path, exist_ok=True)
+        if keep:
+            self._reopen(keep, keep * stride if steps is None else steps)
+            return
+        for name in os.listdir(path):
+            if name.startswith("chunk_") or name == "meta.json": os.remove(os.path.join(path, name))
+
+    def _reopen(self, keep: int, steps: int):
+        """Keeps the first frames of the existing trajectory, the last incomplete chunk goes back in memory."""
+        reader = TrajectoryReader(self.path)
+        meta = reader.meta
+        if (meta["precision"], meta["stride"], meta["chunk_frames"]) != (self.precision, self.stride, self.chunk_frames):
+            raise ValueError(f"Trajectory {self.path} was written with another precision, stride or chunk_frames")
+        if keep > len(reader): raise ValueError(f"Trajectory {self.path} has {len(reader)} frames, {keep} can not be kept")
+
+        self.frames = keep
+        self.steps = steps
+        self.chunks = keep // self.chunk_frames
+        remainder = keep - self.chunks * self.chunk_frames
+        shape = tuple(meta["shape"])
+        self.density = np.empty((self.chunk_frames,) + shape, dtype=self.dtype)
+        self.velo = np.empty((self.chunk_frames,) + shape + (2,), dtype=self.dtype)
+        if remainder:
+            chunk = reader.load_chunk(self.chunks)
+            self.density[:remainder] = chunk["density"][:remainder]
+            self.velo[:remainder] = chunk["velo"][:remainder]
+        # the chunks after the frames kept go, the incomplete one is written again by the next flush
+        for name in os.listdir(self.path):
+            if name.startswith("chunk_") and int(name[6:12]) >= self.chunks + (remainder > 0): os.remove(os.path.join(self.path, name))
+        self._write_meta()
+
+    def write(self, fluid):
+        """Appends the current frame of the Fluid, if it falls on the stride.
+
+        Args:
+            fluid (Fluid): The Fluid after its step.
+        """
+        self.steps += 1
+        if (self.steps - 1) % self.stride: return
+
+        if self.density is None:
+            self.density = np.empty((self.chunk_frames,) + fluid.density.shape, dtype=self.dtype)
+            self.velo = np.empty((self.chunk_frames,) + fluid.velo.shape, dtype=self.dtype)
+        index = self.frames - self.chunks * self.chunk_frames
+        self.density[index] = fluid.density
+        self.velo[index] = fluid.velo
+        self.frames += 1
+        if index + 1 == self.chunk_frames: self.flush()
+
+    def flush(self):
+        """Writes the frames waiting in memory as a chunk, and the metadata.
+        """
+        count = self.frames - self.chunks * self.chunk_frames
+        if count == 0: return
+        np.savez_compressed(os.path.join(self.path, f"chunk_{self.chunks:06d}.npz"), density=self.density[:count], velo=self.velo[:count])
+        if count == self.chunk_frames: self.chunks += 1
+        self._write_meta()
+
+    def close(self):
+        """Writes the last incomplete chunk.
+        """
+        self.flush()
+        if self.density is None: self._write_meta()
+
+    def _write_meta(self):
+        shape = list(self.density.shape[1:]) if self.density is not None else []
+        meta = {"shape": shape, "precision": self.precision, "stride": self.stride, "chunk_frames": self.chunk_frames, "frames": self.frames}
+        temp = os.path.join(self.path, "meta.json.tmp")
+        with open(temp, "w") as file:
+            json.dump(meta, file)
+        os.replace(temp, os.path.join(self.path, "meta.json"))
+
+class TrajectoryReader:
+    """Reads the frames of a trajectory, by index or as a stream.
+    Only the chunk holding the frame asked is loaded.
+    """
+    def __init__(self, path: str, fields=("density", "velo")):
+        """Opens a trajectory.
+
+        Args:
+            path (str): The folder of the trajectory.
+            fields (tuple, optional): The fields to be read, "density" and/or "velo". Defaults to ("density", "velo").
+        """
+        self.path = path
+        self.fields = tuple(fields)
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            self.meta = json.load(file)
+        self.stride = self.meta["stride"]
+        self.chunk_frames = self.meta["chunk_frames"]
+        self.__chunk = None
+        self.__chunk_index = -1
+
+    def __len__(self):
+        """Number of frames in the trajectory."""
+        return self.meta["frames"]
+
+    def step_of(self, index: int):
+        """Number of steps simulated at a frame of the trajectory.
+
+        Args:
+            index (int): The index of the frame.
+
+        Returns:
+            int: The step of the simulation.
+        """
+        return index * self.stride + 1
+
+    def load_chunk(self, chunk: int):
+        """Loads a whole chunk of the trajectory.
+
+        Args:
+            chunk (int): The index of the chunk.
+
+        Returns:
+            dict: The arrays of every field read, with the frames of the chunk in the first axis.
+        """
+        if chunk != self.__chunk_index:
+            with np.load(os.path.join(self.path, f"chunk_{chunk:06d}.npz")) as data:
+                self.__chunk = {name: data[name] for name in self.fields}
+            self.__chunk_index = chunk
+        return self.__chunk
+
+    def __getitem__(self, index: int):
+        """Reads a single frame.
+
+        Args:
+            index (int): The index of the frame, negative values count from the end.
+
+        Returns:
+            dict: The array of every field read.
+        """
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self): raise IndexError(f"Frame {index} out of range for {len(self)} frames")
+        chunk = self.load_chunk(index // self.chunk_frames)
+        return {name: chunk[name][index % self.chunk_frames] for name in self.fields}
+
+    def frames(self, start=0, stop=None, step=1):
+        """Streams the frames of the trajectory, keeping a single chunk in memory.
+
+        Args:
+            start (int, optional): First frame. Defaults to 0.
+            stop (int, optional): Frame where the stream stops. Defaults to None.
+                None: The end of the trajectory.
+            step (int, optional): Frames between two frames given. Defaults to 1.
+
+        Yields:
+            [int, dict]
+                int: The index of the frame.
+                dict: The array of every field read.
+        """
+        if stop is None or stop > len(self): stop = len(self)
+        for index in range(start, stop, step):
+            yield index, self[index]
@@ -100,6 +100,50 @@ class Velocity:
         """
         return [self.__dir_y, self.__dir_x]
 
+    def get_state(self):
+        """Returns everything needed to recreate the Velocity at its current step of the animation.
+
+        Returns:
+            dict: The state of the Velocity, see from_state.
+        """
+        return {
+            "pos_x": self.pos_x, "pos_y": self.pos_y,
+            "strength_x": self.strength_x, "strength_y": self.strength_y,
+            "animation": int(self.__animation), "rotation": self.__rotation, "length": self.__length,
+            "dir_x": self.__dir_x, "dir_y": self.__dir_y,
+            "current_rot": self.__current_rot, "current_length": self.__current_length, "step": self.__step
+        }
+
+    def set_state(self, state: dict):
+        """Restores the animation of the Velocity from a state given by get_state.
+
+        Args:
+            state (dict): The state of the Velocity.
+        """
+        self.pos_x = state["pos_x"]
+        self.pos_y = state["pos_y"]
+        self.__dir_x = state["dir_x"]
+        self.__dir_y = state["dir_y"]
+        self.__current_rot = state["current_rot"]
+        self.__current_length = state["current_length"]
+        self.__step = state["step"]
+
+    @classmethod
+    def from_state(cls, state: dict):
+        """Creates a Velocity from a state given by get_state.
+
+        Args:
+            state (dict): The state of the Velocity.
+
+        Returns:
+            Velocity: The Velocity at the step of the animation it was saved.
+        """
+        animation = VelocityAnimation(state["animation"])
+        value = state["rotation"] if animation in [VelocityAnimation.ROTATE_CW, VelocityAnimation.ROTATE_CCW] else state["length"]
+        velocity = cls(state["pos_x"], state["pos_y"], state["strength_x"], state["strength_y"], animation, value)
+        velocity.set_state(state)
+        return velocity
+
     def step(self):
         """Modifies a vector of the Velocity depending on its animation.
         """